@@ -0,0 +1,297 @@
+"""This module benchmarks the speed and memory usage of Silver.
+
+Synthetic expression profiles, contrasts and fold change files are generated
+for every point of a grid of numbers of genes, samples and repository
+repetitions. Each benchmark is timed several times and its peak memory usage
+is measured with tracemalloc in a separate run. The results are written as
+JSON, so that the results of two versions can be compared:
+
+    python benchmark.py --output new.json --compare old.json
+
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import scipy
+from silver.dataset import Dataset
+from silver.dexpress import TTestDExpress, WilcoxonRankSumDExpress
+from silver.dexpress import FoldChangeDExpress
+from silver.repository import Repository
+from silver.utils import read_profile, read_contrast, read_fold_change_file
+from silver.utils import simulate
+
+
+def make_inputs(directory, num_genes, num_samples, num_de_genes, rng):
+    """Write a synthetic profile, contrast and fold change file.
+
+    Args:
+        directory (str): The directory where the files are written.
+        num_genes (int): The number of genes in the profile.
+        num_samples (int): The number of samples in the profile; half of them
+            are controls and half of them are cases.
+        num_de_genes (int): The number of genes in the fold change file.
+        rng (numpy.random.Generator): The random number generator.
+
+    Returns:
+        dict: The addresses of the profile, contrast and fold change files.
+
+    """
+    genes = [f'G{i}' for i in range(num_genes)]
+    levels = rng.uniform(2, 12, size=(num_genes, 1))
+    values = levels + rng.normal(scale=0.3, size=(num_genes, num_samples))
+    profile = pd.DataFrame(values.round(4), index=pd.Index(genes, name='ID'),
+                           columns=[f'S{i}' for i in range(num_samples)])
+    addresses = {'profile': os.path.join(directory, 'profile.txt'),
+                 'contrast': os.path.join(directory, 'contrast.txt'),
+                 'fold_change': os.path.join(directory, 'fold_change.txt')}
+    profile.to_csv(addresses['profile'], sep='\t')
+    num_ctrls = num_samples // 2
+    with open(addresses['contrast'], 'w') as fout:
+        fout.write('\t'.join(['c'] * num_ctrls +
+                             ['d'] * (num_samples - num_ctrls)) + '\n')
+    de_genes = rng.choice(num_genes, min(num_de_genes, num_genes),
+                          replace=False)
+    signs = rng.choice([-1, 1], size=len(de_genes))
+    fold_changes = pd.DataFrame({'ID': [genes[i] for i in de_genes],
+                                 'FCLower': signs * 0.5,
+                                 'FCUpper': signs * 1.5})
+    fold_changes[['FCLower', 'FCUpper']] = np.sort(
+        fold_changes[['FCLower', 'FCUpper']].values, axis=1)
+    fold_changes.to_csv(addresses['fold_change'], sep='\t', index=False)
+    return addresses
+
+
+def measure(func, repeat, setup=None):
+    """Time a function and measure its peak memory usage.
+
+    Args:
+        func (callable): A function without arguments or, if setup is given,
+            a function of the value returned by setup.
+        repeat (int): The number of timed runs.
+        setup (callable): If given, a function without arguments that is
+            called before every run of func. It is neither timed nor
+            included in the memory usage.
+
+    Returns:
+        dict: The durations of the timed runs in seconds, their minimum and
+            median, and the peak memory allocated by an untimed run in bytes.
+
+    """
+    def prepare():
+        if setup is None:
+            return func
+        value = setup()
+        return lambda: func(value)
+
+    times = []
+    for _ in range(repeat):
+        call = prepare()
+        start = time.perf_counter()
+        call()
+        times.append(time.perf_counter() - start)
+    # Tracing slows down allocations, so memory is measured separately
+    call = prepare()
+    tracemalloc.start()
+    try:
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'times': times, 'min': min(times),
+            'median': statistics.median(times), 'peak_memory': peak}
+
+
+def benchmarks(addresses, num_reps, dtype, seed):
+    """Create the benchmarks of a grid point.
+
+    Args:
+        addresses (dict): The addresses returned by make_inputs.
+        num_reps (int): The number of repository repetitions.
+        dtype (numpy.dtype): The data type of the expression values.
+        seed (int): The seed of the random number generators.
+
+    Returns:
+        dict: A dictionary from benchmark names to functions without
+            arguments, or to (setup, function) pairs as in measure.
+
+    """
+    ctrl_indices, case_indices, _ = read_contrast(addresses['contrast'])
+    profile = read_profile(addresses['profile'], dtype=dtype, sep='\t',
+                           index_col='ID')
+    ctrls = profile.samples(ctrl_indices)
+    cases = profile.samples(case_indices)
+    num_sim = len(case_indices) // 2
+    gfc = read_fold_change_file(addresses['fold_change'], 'ID', 'FCLower',
+                                'FCUpper')
+    sim_ctrls = ctrls.samples(list(range(num_sim)))
+    ctrl_expressions = sim_ctrls.get_many(list(gfc))
+    fold_changes = list(gfc.values())
+
+    def read():
+        read_profile(addresses['profile'], dtype=dtype, sep='\t',
+                     index_col='ID')
+
+    def make_replicates():
+        Dataset(ctrls, cases, random_state=seed).make_replicates(num_sim,
+                                                                 num_sim)
+
+    def build_repository():
+        Repository(cases, num_sim, num_repetitions=num_reps,
+                   random_state=seed)
+
+    def prepare_repository():
+        # The repository and its row summaries are built before the timed
+        # run, so that only the differential expression tests are timed
+        repository = Repository(cases, num_sim, num_repetitions=num_reps,
+                                 random_state=seed)
+        repository.variances
+        repository.mean_order
+        return repository
+
+    def dexpress(cls):
+        def run(repository):
+            cls(repository, 0.05, random_state=seed).batch(ctrl_expressions,
+                                                           fold_changes)
+        return prepare_repository, run
+
+    def run_simulate():
+        simulate(profile_address=addresses['profile'],
+                 contrast_address=addresses['contrast'],
+                 gene_fc_address=addresses['fold_change'],
+                 fc_id_col_name='ID',
+                 lower_bound_col_name='FCLower',
+                 upper_bound_col_name='FCUpper',
+                 num_simulated_ctrls=num_sim,
+                 num_simulated_cases=num_sim,
+                 profile_id_col_name='ID',
+                 num_repository_reps=num_reps,
+                 random_state=seed,
+                 dtype=dtype)
+
+    return {'read_profile': read,
+            'make_replicates': make_replicates,
+            'repository': build_repository,
+            'ttest': dexpress(TTestDExpress),
+            'wilcoxon': dexpress(WilcoxonRankSumDExpress),
+            'fold_change': dexpress(FoldChangeDExpress),
+            'simulate': run_simulate}
+
+
+def run(genes, samples, reps, num_de_genes=100, repeat=3, dtype=None,
+        selected=None, seed=0):
+    """Run the benchmarks on every point of a grid.
+
+    Args:
+        genes (list): The numbers of genes.
+        samples (list): The numbers of samples.
+        reps (list): The numbers of repository repetitions.
+        num_de_genes (int): The number of differentially expressed genes.
+        repeat (int): The number of timed runs of each benchmark.
+        dtype (numpy.dtype): The data type of the expression values. If None,
+            float64 is used.
+        selected (list): The names of the benchmarks to be run. If None, all
+            benchmarks are run.
+        seed (int): The seed of the random number generators.
+
+    Returns:
+        list: A dictionary per benchmark and grid point, containing the
+            parameters and the measurements.
+
+    """
+    results = []
+    for num_genes, num_samples in itertools.product(genes, samples):
+        with tempfile.TemporaryDirectory() as directory:
+            addresses = make_inputs(directory, num_genes, num_samples,
+                                    num_de_genes, np.random.default_rng(seed))
+            for num_reps in reps:
+                funcs = benchmarks(addresses, num_reps, dtype, seed)
+                for name, func in funcs.items():
+                    if selected is not None and name not in selected:
+                        continue
+                    result = {'benchmark': name, 'num_genes': num_genes,
+                              'num_samples': num_samples,
+                              'num_reps': num_reps}
+                    setup = None
+                    if isinstance(func, tuple):
+                        setup, func = func
+                    result.update(measure(func, repeat, setup=setup))
+                    print('{benchmark:>16} genes={num_genes:<7} '
+                          'samples={num_samples:<4} reps={num_reps:<3} '
+                          'median={median:.4f}s '
+                          'peak={peak_memory:,}B'.format(**result))
+                    results.append(result)
+    return results
+
+
+def compare(results, baseline):
+    """Print the ratio of the median times of two result lists.
+
+    Args:
+        results (list): The results of run.
+        baseline (list): The results of run for another version.
+
+    """
+    def key(result):
+        return (result['benchmark'], result['num_genes'],
+                result['num_samples'], result['num_reps'])
+    baseline = {key(result): result for result in baseline}
+    for result in results:
+        other = baseline.get(key(result))
+        if other is None:
+            continue
+        print('{:>16} genes={:<7} samples={:<4} reps={:<3} '
+              'time x{:.2f} memory x{:.2f}'.format(
+                  *key(result), result['median'] / other['median'],
+                  result['peak_memory'] / max(1, other['peak_memory'])))
+
+
+def metadata():
+    """Describe the environment of a benchmark run."""
+    return {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'scipy': scipy.__version__}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--genes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--samples', type=int, nargs='+', default=[20, 60])
+    parser.add_argument('--reps', type=int, nargs='+', default=[1, 5])
+    parser.add_argument('--de-genes', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--dtype', default=None,
+                        help='e.g. float32; the default is float64')
+    parser.add_argument('--benchmarks', nargs='+', default=None,
+                        help='the names of the benchmarks to be run')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None,
+                        help='the address of the JSON results file')
+    parser.add_argument('--compare', default=None,
+                        help='the address of a JSON results file to '
+                             'compare with')
+    args = parser.parse_args()
+    results = run(args.genes, args.samples, args.reps,
+                  num_de_genes=args.de_genes, repeat=args.repeat,
+                  dtype=args.dtype, selected=args.benchmarks, seed=args.seed)
+    if args.output is not None:
+        with open(args.output, 'w') as fout:
+            json.dump({'metadata': dict(metadata(), dtype=args.dtype),
+                       'results': results}, fout, indent=2)
+    if args.compare is not None:
+        with open(args.compare) as fin:
+            compare(results, json.load(fin)['results'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""This module caches parsed input files in a binary format.
+
+Each cache entry is a directory, named after a key, that contains one .npy
+file per array and a JSON file of metadata. Keys are built from the content
+of the parsed file and the parsing arguments, so an entry is never used for
+a modified file.
+
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+
+
+_METADATA_FILE = 'metadata.json'
+
+
+def file_key(address, **params):
+    """Compute the cache key of a file parsed with some arguments.
+
+    Args:
+        address (str): The address of the parsed file.
+        **params: The arguments used for parsing the file. Their repr must
+            identify them.
+
+    Returns:
+        str: A hexadecimal digest of the file content and params.
+
+    """
+    digest = hashlib.sha256()
+    with open(address, 'rb') as fin:
+        for block in iter(lambda: fin.read(1 << 20), b''):
+            digest.update(block)
+    digest.update(repr(sorted(params.items())).encode())
+    return digest.hexdigest()
+
+
+def load(cache_dir, key, mmap=(), mmap_mode='c'):
+    """Load a cache entry.
+
+    Args:
+        cache_dir (str): The address of the cache directory.
+        key (str): The key of the entry.
+        mmap (tuple): The names of the arrays to be memory-mapped. Other
+            arrays are read into memory.
+        mmap_mode (str): The mode used to memory-map arrays, as in
+            numpy.load. The default 'c' maps them copy-on-write, so that
+            modifying them never modifies the cache.
+
+    Returns:
+        tuple: A dictionary of arrays and a dictionary of metadata, or None if
+            there is no valid entry for key.
+
+    """
+    directory = os.path.join(cache_dir, key)
+    try:
+        with open(os.path.join(directory, _METADATA_FILE)) as fin:
+            metadata = json.load(fin)
+        arrays = {}
+        for name in metadata['arrays']:
+            arrays[name] = np.load(os.path.join(directory, name + '.npy'),
+                                   mmap_mode=mmap_mode if name in mmap
+                                   else None)
+    except (OSError, ValueError, KeyError):
+        return None
+    return arrays, metadata['info']
+
+
+def save(cache_dir, key, arrays, info=None):
+    """Save a cache entry.
+
+    The entry is written to a temporary directory that is then renamed, so
+    that an entry is never read while it is being written. If another
+    process saves the same entry first, its entry is kept.
+
+    Args:
+        cache_dir (str): The address of the cache directory. It is created if
+            it does not exist.
+        key (str): The key of the entry.
+        arrays (dict): A dictionary from names to arrays. Arrays must not
+            contain Python objects.
+        info (dict): Metadata that can be serialized to JSON.
+
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    temp = tempfile.mkdtemp(dir=cache_dir, prefix='.' + key)
+    try:
+        for name, array in arrays.items():
+            np.save(os.path.join(temp, name + '.npy'), array,
+                    allow_pickle=False)
+        with open(os.path.join(temp, _METADATA_FILE), 'w') as fout:
+            json.dump({'arrays': list(arrays), 'info': info or {}}, fout)
+        try:
+            os.rename(temp, os.path.join(cache_dir, key))
+        except OSError:
+            # The entry already exists
+            pass
+    finally:
+        shutil.rmtree(temp, ignore_errors=True)
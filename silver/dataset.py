@@ -1,11 +1,9 @@
 """This module simulates expression datasets.
 
 """
-import random
 import logging
 import numpy as np
 from silver.exceptions import MismatchedProfileException
-from silver.exceptions import NonExistingExpressionException
 
 
 logger = logging.getLogger(__name__)
@@ -17,20 +15,31 @@ class Dataset(object):
             containing expression measures for control samples.
         case_profile (ExpressionProfile): A ExpressionProfile object
             containing expression measures for case samples.
+        random_state (int): A seed, or a numpy.random.Generator, for the
+            random numbers drawn by the Dataset object.
+        dtype (numpy.dtype): If given, the expression values of both
+            profiles are converted to this floating point data type, e.g.
+            numpy.float32 to halve their memory usage. If None (default),
+            the data types of the profiles are kept.
 
     Raises:
         MismatchedProfileException: If the order of gene ids in
             ctrl_profile and case_profile are not the same.
 
     """
-    def __init__(self, ctrl_profile, case_profile):
+    def __init__(self, ctrl_profile, case_profile, random_state=None,
+                 dtype=None):
         if not np.array_equal(list(ctrl_profile.keys()),
                               list(case_profile.keys())):
             msg = ('The order of gene ids in ctrl_profile and case_profile ' +
                    'must be the same.')
             raise MismatchedProfileException(msg)
+        if dtype is not None:
+            ctrl_profile = ctrl_profile.astype(dtype)
+            case_profile = case_profile.astype(dtype)
         self.controls = ctrl_profile
         self.cases = case_profile
+        self.rng = np.random.default_rng(random_state)
 
     ############################################################################
     def make_custom_replicates(self, simulated_ctrl_indices,
@@ -87,7 +96,9 @@ class Dataset(object):
             num_sim_cases (int): Number of case samples to be simulated.
             replace (bool): True for using sampling with replacement and False
                 otherwise. Default is False.
-            random_state (int): A seed for reproducing method results.
+            random_state (int): A seed, or a numpy.random.Generator, for
+                reproducing method results. If None (default), the generator
+                of the Dataset object is used.
 
         Raises:
             IndexError: If simulated_ctrl_indices (simulated_case_indices)
@@ -103,25 +114,126 @@ class Dataset(object):
                 are replicate (with no differential expression) for
                 simulated_ctrls.
         """
-        if random_state is not None:
-            np.random.seed(random_state)
+        rng = self._rng(random_state)
         total_num_controls = self.controls.shape[1]
-        if replace is False and (num_sim_ctrls + num_sim_cases > total_num_controls):
-            raise ValueError('num_sim_ctrls + num_sim_cases must ' +
-                             'be less than or equal to the total number of ' +
-                             'controls. Alternatively you should set the "replace" ' +
-                             'parameter as True to use sampling with replacement ' +
-                             'instead of sampling without replacement.')
+        self._check_num_samples(num_sim_ctrls, num_sim_cases, replace)
         indices = np.arange(total_num_controls)
         if replace is True:
-            indices = random.choices(indices, k=num_sim_ctrls + num_sim_cases)
-        indices = np.random.permutation(indices)
+            indices = rng.choice(indices, num_sim_ctrls + num_sim_cases,
+                                 replace=True)
+        indices = rng.permutation(indices)
         simulated_ctrl_indices = indices[:num_sim_ctrls]
         simulated_case_indices = indices[num_sim_ctrls:(num_sim_ctrls + num_sim_cases)]
         return self.make_custom_replicates(simulated_ctrl_indices,
                                            simulated_case_indices,
                                            replace=replace)
 
+    ###########################################################################
+    def replicate_indices(self, n, num_sim_ctrls, num_sim_cases,
+                          replace=False, random_state=None):
+        """Draw the control samples of several replicate datasets at once.
+
+        Each replicate is drawn as in make_replicates, but all index sets are
+        drawn by a few calls to the random number generator.
+
+        Args:
+            n (int): The number of replicate datasets.
+            num_sim_ctrls (int): Number of control samples to be simulated.
+            num_sim_cases (int): Number of case samples to be simulated.
+            replace (bool): True for using sampling with replacement and False
+                otherwise. Default is False.
+            random_state (int): A seed, or a numpy.random.Generator, for
+                reproducing method results. If None (default), the generator
+                of the Dataset object is used.
+
+        Raises:
+            ValueError: If replace is False and num_sim_ctrls + num_sim_cases
+                is greater than the total number of controls.
+
+        Returns:
+            (tuple): Two integer arrays of shape (n, num_sim_ctrls) and
+                (n, num_sim_cases), whose i-th rows contain the indices of the
+                controls used as simulated controls and simulated cases of
+                the i-th replicate.
+        """
+        rng = self._rng(random_state)
+        total_num_controls = self.controls.shape[1]
+        self._check_num_samples(num_sim_ctrls, num_sim_cases, replace)
+        num_samples = num_sim_ctrls + num_sim_cases
+        if replace is True:
+            indices = rng.integers(total_num_controls, size=(n, num_samples))
+        else:
+            indices = np.tile(np.arange(total_num_controls), (n, 1))
+            indices = rng.permuted(indices, axis=1)[:, :num_samples]
+        return indices[:, :num_sim_ctrls], indices[:, num_sim_ctrls:]
+
+    ###########################################################################
+    def make_replicate_batch(self, n, num_sim_ctrls, num_sim_cases,
+                             replace=False, random_state=None, stacked=False):
+        """Create several replicate datasets at once.
+
+        Args:
+            n (int): The number of replicate datasets.
+            num_sim_ctrls (int): Number of control samples to be simulated.
+            num_sim_cases (int): Number of case samples to be simulated.
+            replace (bool): True for using sampling with replacement and False
+                otherwise. Default is False.
+            random_state (int): A seed, or a numpy.random.Generator, for
+                reproducing method results. If None (default), the generator
+                of the Dataset object is used.
+            stacked (bool): If False (default), the replicates are returned as
+                ExpressionProfile objects; otherwise, they are returned as
+                three dimensional arrays.
+
+        Raises:
+            ValueError: If replace is False and num_sim_ctrls + num_sim_cases
+                is greater than the total number of controls.
+
+        Returns:
+            If stacked is False, a list of n (simulated_ctrls,
+            simulated_cases) tuples as returned by make_replicates. Their
+            profiles share the expression values of the controls until they
+            are modified, so creating them copies no expression value.
+            If stacked is True, a tuple of two arrays of shape
+            (n, number of genes, num_sim_ctrls) and
+            (n, number of genes, num_sim_cases) containing the expression
+            values of the simulated controls and the simulated cases.
+        """
+        ctrl_indices, case_indices = self.replicate_indices(
+            n, num_sim_ctrls, num_sim_cases, replace=replace,
+            random_state=random_state)
+        if stacked is False:
+            return [(self.controls.samples(ctrls), self.controls.samples(cases))
+                    for ctrls, cases in zip(ctrl_indices.tolist(),
+                                            case_indices.tolist())]
+        values = self.controls.data(copy=False)
+        result = []
+        for indices in [ctrl_indices, case_indices]:
+            stack = np.empty((n, len(values), indices.shape[1]),
+                             dtype=values.dtype)
+            for i, row in enumerate(indices):
+                np.take(values, row, axis=1, out=stack[i])
+            result.append(stack)
+        return tuple(result)
+
+    ###########################################################################
+    def _rng(self, random_state):
+        """Return the generator for random_state or that of the object."""
+        if random_state is None:
+            return self.rng
+        return np.random.default_rng(random_state)
+
+    def _check_num_samples(self, num_sim_ctrls, num_sim_cases, replace):
+        """Check that enough controls exist for sampling without replacement.
+        """
+        total_num_controls = self.controls.shape[1]
+        if replace is False and (num_sim_ctrls + num_sim_cases > total_num_controls):
+            raise ValueError('num_sim_ctrls + num_sim_cases must ' +
+                             'be less than or equal to the total number of ' +
+                             'controls. Alternatively you should set the "replace" ' +
+                             'parameter as True to use sampling with replacement ' +
+                             'instead of sampling without replacement.')
+
     ############################################################################
     @staticmethod
     def diff_express(ctrls, cases, genes_fold_changes, dexpress_obj):
@@ -138,21 +250,25 @@ class Dataset(object):
                 genes_fold_changes.keys() must be an index element of
                 ctrls and cases.
             dexpress_obj (DExpress): A DExpress object that determines the
-                procedure to be applied for differential expression.
+                procedure to be applied for differential expression. All
+                genes are passed to its batch method at once and the
+                resulting expressions are assigned to cases in bulk.
 
         Returns:
             A tuple containing ctrls (unchanged) and updated cases.
 
         """
-        for gene, fold_change in genes_fold_changes.items():
-            expressions = ctrls.get(gene)
-            try:
-                expressions = dexpress_obj(expressions, fold_change)
-            except NonExistingExpressionException:
+        genes = list(genes_fold_changes.keys())
+        if len(genes) == 0:
+            return ctrls, cases
+        fold_changes = [genes_fold_changes[gene] for gene in genes]
+        expressions = ctrls.get_many(genes)
+        expressions, expressed = dexpress_obj.batch(expressions, fold_changes)
+        for gene, fold_change, found in zip(genes, fold_changes, expressed):
+            if not found:
                 msg = ('{} cannot be expressed by' +
                        ' {} fold change').format(gene, fold_change)
                 logger.warning(msg)
-            finally:
-                cases.set(gene, expressions)
+        cases.set_many(genes, expressions)
         return ctrls, cases
 
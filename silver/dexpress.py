@@ -4,9 +4,170 @@ Each criterion must extend DExpress class, which is an abstract class.
 
 """
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+import hashlib
+import threading
+import time
 import numpy as np
 from scipy import stats
 from silver.exceptions import NonExistingExpressionException, InvalidLogFoldChangeValue
+from silver.instrumentation import HIT, FALLBACK, MISS
+
+# The number of rows tested in the first block of a vectorized scan
+_FIRST_BLOCK_SIZE = 64
+# The maximum number of (gene, repository row) pairs tested at once in batch
+_BATCH_CELLS = 2 ** 22
+
+
+def _check_fold_changes(fold_changes, num_genes):
+    """Validate an array of fold-change intervals.
+
+    Args:
+        fold_changes (array-like): A sequence of (lower, upper) fold-change
+            intervals, one per gene.
+        num_genes (int): The expected number of intervals.
+
+    Returns:
+        numpy.ndarray: The fold-change intervals as an array of shape
+            (num_genes, 2).
+
+    Raises:
+        TypeError: If fold_changes is not of shape (num_genes, 2).
+        InvalidLogFoldChangeValue: If a lower bound is greater than its upper
+            bound or if the bounds of an interval are not of the same sign.
+
+    """
+    fold_changes = np.asarray(fold_changes, dtype=float)
+    if fold_changes.shape != (num_genes, 2):
+        raise TypeError('fold_changes must be of shape (number of genes, 2).')
+    if np.any(fold_changes[:, 0] > fold_changes[:, 1]):
+        msg = 'fold_change[0] must be less than fold_change[1]'
+        raise InvalidLogFoldChangeValue(msg)
+    if np.any(fold_changes[:, 0] * fold_changes[:, 1] <= 0):
+        msg = ('fold_change must be a tuple of two numbers of the '
+               'same sign.')
+        raise InvalidLogFoldChangeValue(msg)
+    return fold_changes
+
+
+def _blocks(indices, block_size):
+    """Split a sequence of row indices into consecutive blocks.
+
+    Blocks start small, so that an early match is cheap, and their size
+    doubles up to block_size.
+
+    Args:
+        indices (numpy.ndarray): Repository row indices in search order.
+        block_size (int): The maximum size of a block.
+
+    Yields:
+        numpy.ndarray: The next block of indices.
+
+    """
+    start, size = 0, min(_FIRST_BLOCK_SIZE, block_size)
+    while start < len(indices):
+        yield indices[start:start + size]
+        start += size
+        size = min(2 * size, block_size)
+
+
+def _searchsorted_rows(sorted_rows, values, side='left'):
+    """Find insertion points of values in each row of a matrix.
+
+    This is a vectorized version of numpy.searchsorted(row, values, side)
+    for every row, using a binary search that advances all rows at once.
+
+    Args:
+        sorted_rows (numpy.ndarray): A two dimensional array where each row
+            is sorted in increasing order.
+        values (numpy.ndarray): A sequence of values.
+        side (str): 'left' to count the elements less than each value or
+            'right' to count the elements less than or equal to each value.
+
+    Returns:
+        numpy.ndarray: An array of shape (len(sorted_rows), len(values)).
+
+    """
+    num_rows, num_cols = sorted_rows.shape
+    rows = np.arange(num_rows)[:, np.newaxis]
+    low = np.zeros((num_rows, len(values)), dtype=np.intp)
+    high = np.full((num_rows, len(values)), num_cols, dtype=np.intp)
+    active = low < high
+    while active.any():
+        middle = (low + high) // 2
+        pivots = sorted_rows[rows, np.minimum(middle, num_cols - 1)]
+        if side == 'left':
+            right = active & (pivots < values)
+        else:
+            right = active & (pivots <= values)
+        low = np.where(right, middle + 1, low)
+        high = np.where(active & ~right, middle, high)
+        active = low < high
+    return low
+
+
+def _ranksums_rows(sample, sorted_rows):
+    """Compare a sample with each row of a matrix using the rank-sum test.
+
+    This is a vectorized version of scipy.stats.ranksums(sample, row) for
+    every row. The rank sum of sample is obtained by counting, for each
+    value of sample, the values of a row that are less than or equal to it.
+    As in scipy, the statistic and the p-value are nan for rows containing
+    nan values, or for every row if sample contains nan values.
+
+    Args:
+        sample (numpy.ndarray): A sequence of expression values.
+        sorted_rows (numpy.ndarray): A two dimensional array of expression
+            values where each row is sorted in increasing order.
+
+    Returns:
+        tuple: Two arrays containing the test statistic and the two-sided
+            p-value for each row.
+
+    """
+    n1, n2 = len(sample), sorted_rows.shape[1]
+    less = _searchsorted_rows(sorted_rows, sample, side='left')
+    less_equal = _searchsorted_rows(sorted_rows, sample, side='right')
+    ranksum = n1 * (n1 + 1) / 2.0 + np.sum(less + less_equal, axis=1) / 2.0
+    expected = n1 * (n1 + n2 + 1) / 2.0
+    z = (ranksum - expected) / np.sqrt(n1 * n2 * (n1 + n2 + 1) / 12.0)
+    # numpy.sort puts nan values last, so they are found in the last column
+    invalid = np.isnan(sorted_rows[:, -1]) if n2 > 0 else False
+    if np.any(np.isnan(sample)):
+        invalid = True
+    z = np.where(invalid, np.nan, z)
+    p = 2 * stats.norm.sf(np.abs(z))
+    return z, p
+
+
+def _ttest_ind_from_summaries(sample, means, variances, counts):
+    """Compare a sample with many others using a two-sample t-test.
+
+    This is a vectorized version of
+    scipy.stats.ttest_ind(sample, other, equal_var=True) where every other
+    sample is given by its mean, variance and size.
+
+    Args:
+        sample (numpy.ndarray): A sequence of expression values.
+        means (numpy.ndarray): The means of the other samples.
+        variances (numpy.ndarray): The variances (with one degree of freedom)
+            of the other samples.
+        counts (numpy.ndarray): The sizes of the other samples.
+
+    Returns:
+        tuple: Two arrays containing the t statistic and the two-sided p-value
+            for each of the other samples.
+
+    """
+    n1 = len(sample)
+    df = n1 + counts - 2
+    svar = ((n1 - 1) * np.var(sample, ddof=1, dtype=np.float64) +
+            (counts - 1) * variances) / df
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = ((np.mean(sample, dtype=np.float64) - means) /
+             np.sqrt(svar * (1.0 / n1 + 1.0 / counts)))
+    p = 2 * stats.t.sf(np.abs(t), df)
+    return t, p
 
 
 class DExpress(ABC):
@@ -16,11 +177,36 @@ class DExpress(ABC):
         repository:
             Repository: A repository containing the expression values of
                 genes for several samples.
+        random_state (int): A seed, or a numpy.random.Generator, for the
+            random numbers drawn by the criterion. Each object draws from its
+            own generator, so objects can be used concurrently.
+        stats (SimulationStats): If given, the search for the differential
+            expression of every gene is recorded in stats. For genes
+            simulated by batch, the latency of the whole batch is recorded
+            instead of per-gene latencies.
 
     """
 
-    def __init__(self, repository):
+    def __init__(self, repository, random_state=None, stats=None):
         self.repository = repository
+        self.rng = np.random.default_rng(random_state)
+        self.stats = stats
+
+    def _record(self, rows_tested, outcome, start):
+        """Record the search for a gene, which started at start, in stats."""
+        if self.stats is not None:
+            self.stats.record_gene(rows_tested, outcome,
+                                   time.perf_counter() - start)
+
+    def _record_batch(self, rows_tested, outcomes, start):
+        """Record the searches for genes simulated together in stats.
+
+        The duration since start is recorded as the latency of the batch.
+
+        """
+        if self.stats is not None and len(outcomes) > 0:
+            self.stats.record_batch(rows_tested, outcomes,
+                                    time.perf_counter() - start)
 
     @abstractmethod
     def __call__(self, gene_ctrl_expressions, **kwargs):
@@ -33,6 +219,38 @@ class DExpress(ABC):
 
         """
 
+    def batch(self, ctrl_expressions, fold_changes, **kwargs):
+        """Simulate differential expression for several genes at once.
+
+        Criteria may override this method with a vectorized version; by
+        default, genes are simulated one at a time using __call__.
+
+        Args:
+            ctrl_expressions (array-like): A two dimensional array where each
+                row contains the expression values of a gene.
+            fold_changes (array-like): A sequence of (lower, upper)
+                fold-change intervals, one per row of ctrl_expressions.
+            **kwargs: Arguments to be used to simulate differential expression
+                of each gene.
+
+        Returns:
+            tuple: The simulated case expressions as a two dimensional array
+                and a boolean array that is False for the genes that could not
+                be differentially expressed. The rows of these genes contain
+                their control expressions.
+
+        """
+        cases, expressed = [], []
+        for expressions, fold_change in zip(ctrl_expressions, fold_changes):
+            try:
+                cases.append(self(expressions, tuple(fold_change), **kwargs))
+                expressed.append(True)
+            except NonExistingExpressionException:
+                cases.append(expressions)
+                expressed.append(False)
+        return np.array(cases), np.array(expressed, dtype=bool)
+
+
 class TTestDExpress(DExpress):
     """A criteria based on independent two-sample t-test.
 
@@ -41,12 +259,20 @@ class TTestDExpress(DExpress):
             simulating differential expression.
         alpha (float): A positive number between 0 and 1 used as
             significant level.
+        block_size (int): The maximum number of repository rows tested at
+            once. If None, rows are tested one at a time using
+            scipy.stats.ttest_ind. The default is 1024.
+        random_state (int): A seed, or a numpy.random.Generator, for the
+            random numbers drawn by the criterion.
+        stats (SimulationStats): See DExpress.
 
     """
 
-    def __init__(self, repository, alpha):
-        super().__init__(repository)
+    def __init__(self, repository, alpha, block_size=1024,
+                 random_state=None, stats=None):
+        super().__init__(repository, random_state=random_state, stats=stats)
         self.alpha = alpha
+        self.block_size = block_size
 
     def __call__(self, gene_ctrl_expressions, fold_change, force=True,
                  shuffle=True, std=0.5, log_scale=True):
@@ -92,35 +318,307 @@ class TTestDExpress(DExpress):
             msg = ('fold_change must be a tuple of two numbers of the '
                    'same sign.')
             raise InvalidLogFoldChangeValue(msg)
+        start = time.perf_counter()
         if log_scale is True:
             lower = np.array(gene_ctrl_expressions) + fold_change[0]
             upper = np.array(gene_ctrl_expressions) + fold_change[1]
         else:
             lower = np.array(gene_ctrl_expressions) * fold_change[0]
             upper = np.array(gene_ctrl_expressions) * fold_change[1]
-        indices = np.arange(len(self.repository))
-        if shuffle is True:
-            np.random.shuffle(indices)
-        for i in indices:
-            measures = self.repository[i]
-            t, p = stats.ttest_ind(lower, measures, equal_var=True)
-            if t > 0 or (p/2.) > self.alpha:
-                continue
-            t, p = stats.ttest_ind(upper, measures, equal_var=True)
-            if t < 0 or (p/2.) > self.alpha:
-                continue
+        if self.block_size is None:
+            indices = np.arange(len(self.repository))
+            if shuffle is True:
+                self.rng.shuffle(indices)
+            measures, rows_tested = self._scan_rows(lower, upper, indices)
+        else:
+            # Only rows whose mean is between the means of lower and upper
+            # can meet the criteria
+            candidates = self.repository.rows_in_mean_range(np.mean(lower),
+                                                            np.mean(upper))
+            if shuffle is True:
+                # Shuffle every row, as the scalar scan does, and keep the
+                # candidates in that order, so that both scans draw the same
+                # random numbers and return the same row
+                indices = np.arange(len(self.repository))
+                self.rng.shuffle(indices)
+                in_range = np.zeros(len(self.repository), dtype=bool)
+                in_range[candidates] = True
+                candidates = indices[in_range[indices]]
+            else:
+                candidates = np.sort(candidates)
+            measures, rows_tested = self._scan_blocks(lower, upper,
+                                                      candidates)
+        if measures is not None:
+            self._record(rows_tested, HIT, start)
             return measures
         if force is False:
+            self._record(rows_tested, MISS, start)
             msg = 'Cannot find expression measures with requested fold changes.'
             raise NonExistingExpressionException(msg)
         else:
-            change = np.random.normal(loc=np.mean(fold_change), scale=std,
-                                      size=len(gene_ctrl_expressions))
+            change = self.rng.normal(loc=np.mean(fold_change), scale=std,
+                                     size=len(gene_ctrl_expressions))
+            self._record(rows_tested, FALLBACK, start)
             if log_scale is True:
                 return gene_ctrl_expressions + change
             else:
                 return gene_ctrl_expressions * change
 
+    def batch(self, ctrl_expressions, fold_changes, force=True,
+              shuffle=True, std=0.5, log_scale=True):
+        """Simulate differential expression for several genes at once.
+
+        The candidate rows of many genes are tested at once and, for each
+        gene, a row is chosen among those that meet the criteria. This
+        follows the same distribution as __call__, but the random numbers
+        are drawn in a different order.
+
+        Args:
+            ctrl_expressions (array-like): A two dimensional array where each
+                row contains the expression values of a gene.
+            fold_changes (array-like): A sequence of (lower, upper)
+                fold-change intervals, one per row of ctrl_expressions.
+            force (bool): See __call__.
+            shuffle(bool): See __call__.
+            std(float): See __call__.
+            log_scale (bool): See __call__.
+
+        Returns:
+            tuple: The simulated case expressions as a two dimensional array
+                and a boolean array that is False for the genes that could not
+                be differentially expressed. The rows of these genes contain
+                their control expressions.
+
+        Raises:
+            TypeError: If fold_changes is not of shape (number of genes, 2).
+            InvalidLogFoldChangeValue: If a fold-change interval is invalid.
+            ValueError: If controls must be shifted, because force is True,
+                but the number of control samples is not equal to the number
+                of samples in the repository.
+
+        """
+        start = time.perf_counter()
+        ctrl_expressions = np.asarray(ctrl_expressions)
+        num_genes = len(ctrl_expressions)
+        fold_changes = _check_fold_changes(fold_changes, num_genes)
+        if log_scale is True:
+            lower = ctrl_expressions + fold_changes[:, :1]
+            upper = ctrl_expressions + fold_changes[:, 1:]
+        else:
+            lower = ctrl_expressions * fold_changes[:, :1]
+            upper = ctrl_expressions * fold_changes[:, 1:]
+        selected, rows_tested = self._select_rows(lower, upper,
+                                                  shuffle=shuffle)
+        expressed = selected >= 0
+        self._record_batch(rows_tested,
+                           np.where(expressed, HIT,
+                                    FALLBACK if force is True else MISS),
+                           start)
+        cases = np.empty((num_genes, self.repository.shape[1]),
+                         dtype=np.result_type(self.repository.dtype,
+                                              ctrl_expressions))
+        cases[expressed] = self.repository.rows(selected[expressed])
+        missing = ~expressed
+        if not missing.any():
+            return cases, expressed
+        if force is False:
+            shifted = ctrl_expressions[missing]
+        else:
+            expressed[missing] = True
+            change = self.rng.normal(
+                loc=np.mean(fold_changes[missing], axis=1)[:, np.newaxis],
+                scale=std, size=(np.sum(missing), ctrl_expressions.shape[1]))
+            if log_scale is True:
+                shifted = ctrl_expressions[missing] + change
+            else:
+                shifted = ctrl_expressions[missing] * change
+        if shifted.shape[1] != cases.shape[1]:
+            raise ValueError('The number of control samples must be equal to '
+                             'the number of samples in the repository.')
+        cases[missing] = shifted
+        return cases, expressed
+
+    def _select_rows(self, lower, upper, shuffle=True):
+        """Choose a repository row that meets the criteria for several genes.
+
+        A row can only pass both one-sided tests if its mean is between the
+        means of lower and upper, so only these candidate rows are tested,
+        for up to _BATCH_CELLS (gene, candidate row) pairs at once. Rows pass
+        a one-sided test if the t statistic is beyond the critical value of
+        the t distribution at the alpha significance level, which is
+        equivalent to the p-value test of _scan_blocks.
+
+        Args:
+            lower (numpy.ndarray): Control expressions of each gene shifted by
+                the lower bound of its fold-change interval.
+            upper (numpy.ndarray): Control expressions of each gene shifted by
+                the upper bound of its fold-change interval.
+            shuffle (bool): If True, a passing row is chosen uniformly at
+                random; otherwise, the passing row with the smallest index is
+                chosen.
+
+        Returns:
+            tuple: The index of the chosen row for each gene, or -1 for genes
+                without any passing row, and the number of rows tested for
+                each gene.
+
+        """
+        repository = self.repository
+        means = repository.means
+        variances = repository.variances
+        counts = repository.counts
+        n1 = lower.shape[1]
+        # The critical value only depends on the size of a row
+        sizes, inverse = np.unique(counts, return_inverse=True)
+        critical = stats.t.isf(self.alpha, n1 + sizes - 2)[inverse]
+        shifted = [(np.mean(values, axis=1, dtype=np.float64),
+                    np.var(values, axis=1, ddof=1, dtype=np.float64))
+                   for values in (lower, upper)]
+        starts, stops = repository.mean_range_positions(shifted[0][0],
+                                                        shifted[1][0])
+        num_candidates = stops - starts
+        ends = np.cumsum(num_candidates)
+        order = repository.mean_order
+        selected = np.full(len(lower), -1, dtype=np.intp)
+        first = 0
+        while first < len(lower):
+            # The next genes whose candidates fit in _BATCH_CELLS pairs
+            offset = ends[first] - num_candidates[first]
+            last = max(first + 1, int(np.searchsorted(
+                ends, offset + _BATCH_CELLS, side='right')))
+            genes = np.arange(first, last)
+            pair_genes = np.repeat(genes, num_candidates[genes])
+            rows = order[starts[pair_genes] + np.arange(len(pair_genes)) -
+                         (ends[pair_genes] - num_candidates[pair_genes] -
+                          offset)]
+            row_counts = counts[rows]
+            df = n1 + row_counts - 2
+            passed = np.ones(len(rows), dtype=bool)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                for (gene_means, gene_vars), sign in zip(shifted, (-1, 1)):
+                    svar = ((n1 - 1) * gene_vars[pair_genes] +
+                            (row_counts - 1) * variances[rows]) / df
+                    t = ((gene_means[pair_genes] - means[rows]) /
+                         np.sqrt(svar * (1.0 / n1 + 1.0 / row_counts)))
+                    passed &= sign * t >= critical[rows]
+            hits = np.flatnonzero(passed)
+            hit_genes = pair_genes[hits] - first
+            num_hits = np.bincount(hit_genes, minlength=len(genes))
+            found = num_hits > 0
+            if shuffle is True:
+                ranks = np.floor(self.rng.uniform(size=len(genes)) *
+                                 num_hits).astype(np.intp)
+                chosen = hits[(np.cumsum(num_hits) - num_hits + ranks)[found]]
+                selected[genes[found]] = rows[chosen]
+            else:
+                smallest = np.full(len(genes), len(repository), dtype=np.intp)
+                np.minimum.at(smallest, hit_genes, rows[hits])
+                selected[genes[found]] = smallest[found]
+            first = last
+        return selected, num_candidates
+
+    def _scan_rows(self, lower, upper, indices):
+        """Test repository rows one at a time using scipy.stats.ttest_ind.
+
+        Args:
+            lower (numpy.ndarray): Control expressions shifted by the lower
+                bound of the fold-change interval.
+            upper (numpy.ndarray): Control expressions shifted by the upper
+                bound of the fold-change interval.
+            indices (numpy.ndarray): Repository row indices in search order.
+
+        Returns:
+            tuple: The first row, in the order of indices, that meets the
+                criteria or None if no such row exists, and the number of
+                rows tested.
+
+        """
+        for num_tested, i in enumerate(indices, 1):
+            measures = self.repository[i]
+            # Rows with nan statistics, e.g. rows with nan values, never pass
+            t, p = stats.ttest_ind(lower, measures, equal_var=True)
+            if not (t <= 0 and (p/2.) <= self.alpha):
+                continue
+            t, p = stats.ttest_ind(upper, measures, equal_var=True)
+            if not (t >= 0 and (p/2.) <= self.alpha):
+                continue
+            return measures, num_tested
+        return None, len(indices)
+
+    def passing_rows(self, gene_ctrl_expressions, fold_change,
+                     log_scale=True):
+        """Find all repository rows that meet the criteria for a gene.
+
+        Args:
+            gene_ctrl_expressions(array-like): A sequence of expression values.
+            fold_change (tuple): See __call__.
+            log_scale (bool): See __call__.
+
+        Returns:
+            tuple: The indices of the rows that meet the criteria in
+                increasing order, and the number of rows tested.
+
+        Raises:
+            TypeError: If fold_change is not a tuple of length two.
+            InvalidLogFoldChangeValue: If fold_change is invalid.
+
+        """
+        fold_change = _check_fold_changes([fold_change], 1)[0]
+        expressions = np.asarray(gene_ctrl_expressions)
+        if log_scale is True:
+            lower = expressions + fold_change[0]
+            upper = expressions + fold_change[1]
+        else:
+            lower = expressions * fold_change[0]
+            upper = expressions * fold_change[1]
+        candidates = np.sort(self.repository.rows_in_mean_range(
+            np.mean(lower), np.mean(upper)))
+        summaries = (self.repository.means[candidates],
+                     self.repository.variances[candidates],
+                     self.repository.counts[candidates])
+        # The conditions of _scan_blocks
+        t, p = _ttest_ind_from_summaries(lower, *summaries)
+        passed = (t <= 0) & ((p/2.) <= self.alpha)
+        t, p = _ttest_ind_from_summaries(upper, *summaries)
+        passed &= (t >= 0) & ((p/2.) <= self.alpha)
+        return candidates[passed], len(candidates)
+
+    def _scan_blocks(self, lower, upper, indices):
+        """Test blocks of repository rows with vectorized t statistics.
+
+        The t statistics are computed from the cached row summaries of the
+        repository, so the raw values of a row are only read when the row
+        meets the criteria. The result is the same as that of _scan_rows.
+
+        Args:
+            lower (numpy.ndarray): Control expressions shifted by the lower
+                bound of the fold-change interval.
+            upper (numpy.ndarray): Control expressions shifted by the upper
+                bound of the fold-change interval.
+            indices (numpy.ndarray): Repository row indices in search order.
+
+        Returns:
+            tuple: The first row, in the order of indices, that meets the
+                criteria or None if no such row exists, and the number of
+                rows tested.
+
+        """
+        means = self.repository.means
+        variances = self.repository.variances
+        counts = self.repository.counts
+        num_tested = 0
+        for block in _blocks(indices, self.block_size):
+            num_tested += len(block)
+            summaries = means[block], variances[block], counts[block]
+            # The conditions of _scan_rows; nan statistics never pass
+            t, p = _ttest_ind_from_summaries(lower, *summaries)
+            passed = (t <= 0) & ((p/2.) <= self.alpha)
+            t, p = _ttest_ind_from_summaries(upper, *summaries)
+            passed &= (t >= 0) & ((p/2.) <= self.alpha)
+            hits = np.flatnonzero(passed)
+            if len(hits) > 0:
+                return self.repository[block[hits[0]]], num_tested
+        return None, num_tested
 
 
 class WilcoxonRankSumDExpress(DExpress):
@@ -131,12 +629,20 @@ class WilcoxonRankSumDExpress(DExpress):
             simulating differential expression.
         alpha (float): A positive number between 0 and 1 used as
             significant level.
+        block_size (int): The maximum number of repository rows tested at
+            once. If None, rows are tested one at a time using
+            scipy.stats.ranksums. The default is 1024.
+        random_state (int): A seed, or a numpy.random.Generator, for the
+            random numbers drawn by the criterion.
+        stats (SimulationStats): See DExpress.
 
     """
 
-    def __init__(self, repository, alpha):
-        super().__init__(repository)
+    def __init__(self, repository, alpha, block_size=1024,
+                 random_state=None, stats=None):
+        super().__init__(repository, random_state=random_state, stats=stats)
         self.alpha = alpha
+        self.block_size = block_size
 
     def __call__(self, gene_ctrl_expressions, fold_change, force=True,
                  shuffle=True, std=0.5, log_scale=True):
@@ -182,6 +688,7 @@ class WilcoxonRankSumDExpress(DExpress):
             msg = ('fold_change must be a tuple of two numbers of the '
                    'same sign.')
             raise InvalidLogFoldChangeValue(msg)
+        start = time.perf_counter()
         average_fold_change = (fold_change[0] + fold_change[1]) / 2
         if log_scale is True:
             base_expression = np.array(gene_ctrl_expressions) + average_fold_change
@@ -189,24 +696,113 @@ class WilcoxonRankSumDExpress(DExpress):
             base_expression = np.array(gene_ctrl_expressions) * average_fold_change
         indices = np.arange(len(self.repository))
         if shuffle is True:
-            np.random.shuffle(indices)
-        for i in indices:
-            measures = self.repository[i]
-            t, p = stats.ranksums(base_expression, measures, equal_var=True)
-            if p < self.alpha:
-                continue
+            self.rng.shuffle(indices)
+        if self.block_size is None:
+            measures, rows_tested = self._scan_rows(base_expression, indices)
+        else:
+            measures, rows_tested = self._scan_blocks(base_expression, indices)
+        if measures is not None:
+            self._record(rows_tested, HIT, start)
             return measures
         if force is False:
+            self._record(rows_tested, MISS, start)
             msg = 'Cannot find expression measures with requested fold changes.'
             raise NonExistingExpressionException(msg)
         else:
-            change = np.random.normal(loc=np.mean(fold_change), scale=std,
-                                      size=len(gene_ctrl_expressions))
+            change = self.rng.normal(loc=np.mean(fold_change), scale=std,
+                                     size=len(gene_ctrl_expressions))
+            self._record(rows_tested, FALLBACK, start)
             if log_scale is True:
                 return gene_ctrl_expressions + change
             else:    
                 return gene_ctrl_expressions * change
 
+    def _scan_rows(self, base_expression, indices):
+        """Test repository rows one at a time using scipy.stats.ranksums.
+
+        Args:
+            base_expression (numpy.ndarray): Control expressions shifted by
+                the average of the fold-change interval.
+            indices (numpy.ndarray): Repository row indices in search order.
+
+        Returns:
+            tuple: The first row, in the order of indices, that meets the
+                criteria or None if no such row exists, and the number of
+                rows tested.
+
+        """
+        for num_tested, i in enumerate(indices, 1):
+            measures = self.repository[i]
+            t, p = stats.ranksums(base_expression, measures)
+            # Rows with a nan p-value, e.g. rows with nan values, never pass
+            if not p >= self.alpha:
+                continue
+            return measures, num_tested
+        return None, len(indices)
+
+    def _scan_blocks(self, base_expression, indices):
+        """Test blocks of repository rows with vectorized rank-sum statistics.
+
+        The rank sums are counted against the pre-sorted rows of the
+        repository. The result is the same as that of _scan_rows.
+
+        Args:
+            base_expression (numpy.ndarray): Control expressions shifted by
+                the average of the fold-change interval.
+            indices (numpy.ndarray): Repository row indices in search order.
+
+        Returns:
+            tuple: The first row, in the order of indices, that meets the
+                criteria or None if no such row exists, and the number of
+                rows tested.
+
+        """
+        num_tested = 0
+        for block in _blocks(indices, self.block_size):
+            num_tested += len(block)
+            z, p = _ranksums_rows(base_expression,
+                                  self.repository.sorted_rows(block))
+            # The condition of _scan_rows; nan p-values never pass
+            hits = np.flatnonzero(p >= self.alpha)
+            if len(hits) > 0:
+                return self.repository[block[hits[0]]], num_tested
+        return None, num_tested
+
+    def passing_rows(self, gene_ctrl_expressions, fold_change,
+                     log_scale=True):
+        """Find all repository rows that meet the criteria for a gene.
+
+        Args:
+            gene_ctrl_expressions(array-like): A sequence of expression values.
+            fold_change (tuple): See __call__.
+            log_scale (bool): See __call__.
+
+        Returns:
+            tuple: The indices of the rows that meet the criteria in
+                increasing order, and the number of rows tested.
+
+        Raises:
+            TypeError: If fold_change is not a tuple of length two.
+            InvalidLogFoldChangeValue: If fold_change is invalid.
+
+        """
+        fold_change = _check_fold_changes([fold_change], 1)[0]
+        average_fold_change = (fold_change[0] + fold_change[1]) / 2
+        expressions = np.asarray(gene_ctrl_expressions)
+        if log_scale is True:
+            base_expression = expressions + average_fold_change
+        else:
+            base_expression = expressions * average_fold_change
+        indices = np.arange(len(self.repository))
+        passed = []
+        for block in _blocks(indices, self.block_size or len(indices)):
+            z, p = _ranksums_rows(base_expression,
+                                  self.repository.sorted_rows(block))
+            # The condition of _scan_blocks
+            passed.append(block[p >= self.alpha])
+        rows = np.concatenate(passed) if len(passed) > 0 else indices
+        return rows, len(indices)
+
 
 class FoldChangeDExpress(DExpress):
     """A criteria based on fold-change.
@@ -216,11 +812,14 @@ class FoldChangeDExpress(DExpress):
             simulating differential expression.
         alpha (float): A positive number between 0 and 1 used as
             significant level.
+        random_state (int): A seed, or a numpy.random.Generator, for the
+            random numbers drawn by the criterion.
+        stats (SimulationStats): See DExpress.
 
     """
 
-    def __init__(self, repository, alpha):
-        super().__init__(repository)
+    def __init__(self, repository, alpha, random_state=None, stats=None):
+        super().__init__(repository, random_state=random_state, stats=stats)
         self.alpha = alpha
 
     def __call__(self, gene_ctrl_expressions, fold_change, log_scale=True):
@@ -255,10 +854,229 @@ class FoldChangeDExpress(DExpress):
             msg = ('fold_change must be a tuple of two numbers of the '
                    'same sign.')
             raise InvalidLogFoldChangeValue(msg)
-        fc = np.random.uniform(low=fold_change[0], high=fold_change[1])
+        start = time.perf_counter()
+        fc = self.rng.uniform(low=fold_change[0], high=fold_change[1])
         if log_scale is True:
             base_expression = np.array(gene_ctrl_expressions) + fc
         else:
             base_expression = np.array(gene_ctrl_expressions) * fc
+        self._record(0, HIT, start)
         return base_expression
 
+    def batch(self, ctrl_expressions, fold_changes, log_scale=True):
+        """Simulate differential expression for several genes at once.
+
+        Args:
+            ctrl_expressions (array-like): A two dimensional array where each
+                row contains the expression values of a gene.
+            fold_changes (array-like): A sequence of (lower, upper)
+                fold-change intervals, one per row of ctrl_expressions.
+            log_scale (bool): See __call__.
+
+        Returns:
+            tuple: The simulated case expressions as a two dimensional array
+                and a boolean array that is True for every gene.
+
+        Raises:
+            TypeError: If fold_changes is not of shape (number of genes, 2).
+            InvalidLogFoldChangeValue: If a fold-change interval is invalid.
+
+        """
+        start = time.perf_counter()
+        ctrl_expressions = np.asarray(ctrl_expressions)
+        num_genes = len(ctrl_expressions)
+        fold_changes = _check_fold_changes(fold_changes, num_genes)
+        fc = self.rng.uniform(low=fold_changes[:, 0], high=fold_changes[:, 1])
+        if log_scale is True:
+            base_expression = ctrl_expressions + fc[:, np.newaxis]
+        else:
+            base_expression = ctrl_expressions * fc[:, np.newaxis]
+        self._record_batch(np.zeros(num_genes), [HIT] * num_genes, start)
+        return base_expression, np.ones(len(ctrl_expressions), dtype=bool)
+
+
+
+class DExpressCache(object):
+    """A least recently used cache of the rows passing DExpress criteria.
+
+    Entries are the indices of the repository rows that meet the criteria
+    for a gene, stored as compact integer arrays. The least recently used
+    entries are evicted when the entries use more than max_bytes. A
+    DExpressCache object can be shared by several CachedDExpress objects,
+    including objects used from several threads and built for different
+    Repository objects.
+
+    Args:
+        max_bytes (int): The maximum memory, in bytes, used by the arrays of
+            the cached entries. The default is 256 MiB.
+
+    """
+
+    def __init__(self, max_bytes=2 ** 28):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        """Return the state to be pickled, without the lock."""
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        """Restore a pickled state with a new lock."""
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Return the number of cached entries."""
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the cached rows of a key.
+
+        Args:
+            key (str): The key of an entry.
+
+        Returns:
+            numpy.ndarray: The cached row indices or None if key is not
+                cached.
+
+        """
+        with self._lock:
+            rows = self._entries.get(key)
+            if rows is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return rows
+
+    def put(self, key, rows):
+        """Cache the rows of a key.
+
+        Entries larger than max_bytes are not cached.
+
+        Args:
+            key (str): The key of the entry.
+            rows (numpy.ndarray): The row indices to be cached.
+
+        """
+        dtype = np.int32 if rows.size == 0 or rows.max() < 2 ** 31 else np.intp
+        rows = np.array(rows, dtype=dtype)
+        rows.flags.writeable = False
+        if rows.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key).nbytes
+            self._entries[key] = rows
+            self.nbytes += rows.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+
+class CachedDExpress(DExpress):
+    """A criterion that remembers the repository rows passing another one.
+
+    For every gene, the wrapped criterion finds all repository rows that meet
+    its criteria once; the rows are cached under a key made of the
+    repository key, the control expressions, the fold-change interval and
+    the parameters of the criterion. Later calls with the same key choose a
+    row among the cached ones without testing the repository again. A row is
+    chosen uniformly at random, which follows the same distribution as the
+    shuffled search of the wrapped criterion.
+
+    Args:
+        criterion (DExpress): A criterion with a passing_rows method, e.g. a
+            TTestDExpress or a WilcoxonRankSumDExpress object.
+        cache (DExpressCache): The cache of passing rows. If None (default),
+            a new DExpressCache object is used.
+        random_state (int): A seed, or a numpy.random.Generator, for the
+            random numbers drawn by the criterion.
+        stats (SimulationStats): See DExpress.
+
+    Raises:
+        TypeError: If criterion has no passing_rows method.
+
+    """
+
+    def __init__(self, criterion, cache=None, random_state=None, stats=None):
+        if not callable(getattr(criterion, 'passing_rows', None)):
+            raise TypeError('criterion must have a passing_rows method.')
+        super().__init__(criterion.repository, random_state=random_state,
+                         stats=stats)
+        self.criterion = criterion
+        self.cache = DExpressCache() if cache is None else cache
+
+    def _key(self, gene_ctrl_expressions, fold_change, log_scale):
+        """Compute the cache key of a search."""
+        digest = hashlib.sha256()
+        digest.update(repr((self.repository.key,
+                            type(self.criterion).__name__,
+                            self.criterion.alpha,
+                            tuple(float(bound) for bound in fold_change),
+                            log_scale)).encode())
+        digest.update(np.ascontiguousarray(gene_ctrl_expressions,
+                                           dtype=np.float64).data)
+        return digest.hexdigest()
+
+    def __call__(self, gene_ctrl_expressions, fold_change, force=True,
+                 shuffle=True, std=0.5, log_scale=True):
+        """Simulate differential expression.
+
+        Args:
+            gene_ctrl_expressions(array-like): A sequence of expression values.
+            fold-change (tuple): See TTestDExpress.__call__.
+            force (bool): See TTestDExpress.__call__.
+            shuffle(bool): If True (default), a row is chosen at random among
+                the rows that meet the criteria; otherwise, the first of
+                these rows is chosen.
+            std(float): See TTestDExpress.__call__.
+            log_scale (bool): See TTestDExpress.__call__.
+
+        Returns:
+            numpy.ndarray: An element of the respository that meets the
+                differential expression criteria.
+
+        Raises:
+            TypeError: If fold_change is not a tuple of length two.
+            InvalidLogFoldChangeValue: If fold_change is invalid.
+            NonExistingExpressionException: If no row meets the criteria and
+                force is False.
+
+        """
+        if not isinstance(fold_change, tuple) or len(fold_change) != 2:
+            raise TypeError('fold_change must be a tuple of length 2.')
+        start = time.perf_counter()
+        key = self._key(gene_ctrl_expressions, fold_change, log_scale)
+        rows = self.cache.get(key)
+        rows_tested = 0
+        if rows is None:
+            rows, rows_tested = self.criterion.passing_rows(
+                gene_ctrl_expressions, fold_change, log_scale=log_scale)
+            self.cache.put(key, rows)
+        if len(rows) > 0:
+            i = self.rng.integers(len(rows)) if shuffle is True else 0
+            self._record(rows_tested, HIT, start)
+            return self.repository[rows[i]]
+        if force is False:
+            self._record(rows_tested, MISS, start)
+            msg = 'Cannot find expression measures with requested fold changes.'
+            raise NonExistingExpressionException(msg)
+        change = self.rng.normal(loc=np.mean(fold_change), scale=std,
+                                 size=len(gene_ctrl_expressions))
+        self._record(rows_tested, FALLBACK, start)
+        if log_scale is True:
+            return gene_ctrl_expressions + change
+        return gene_ctrl_expressions * change
@@ -1,13 +1,60 @@
 """This module aims at representing a expression profiles.
 """
-import copy
+import numpy as np
 import pandas as pd
 import numbers
+from silver import shared
+
+
+def _as_slice(positions):
+    """Return a slice selecting the same positions, or None if there is none.
+    """
+    if len(positions) == 1:
+        return slice(positions[0], positions[0] + 1)
+    steps = np.diff(positions)
+    if len(steps) == 0 or steps[0] <= 0 or np.any(steps != steps[0]):
+        return None
+    return slice(positions[0], positions[-1] + 1, steps[0])
+
+
+class _ProfileFrame(pd.DataFrame):
+    """A read-only DataFrame returned by ExpressionProfile.profile.
+
+    Copies of it and results of operations on it are regular DataFrames.
+
+    """
+    _MESSAGE = ('The DataFrame returned by ExpressionProfile.profile is '
+                'read-only; modify the ExpressionProfile or a copy instead.')
+
+    @property
+    def _constructor(self):
+        return pd.DataFrame
+
+    def __setattr__(self, name, value):
+        if name in ('index', 'columns'):
+            raise ValueError(self._MESSAGE)
+        super().__setattr__(name, value)
+
+    def __setitem__(self, key, value):
+        raise ValueError(self._MESSAGE)
+
+    def __delitem__(self, key):
+        raise ValueError(self._MESSAGE)
 
 
 class ExpressionProfile(object):
     """A class for wrapping gene expression profile data.
 
+    Expression values are stored in a two dimensional NumPy array and genes
+    are located through a dictionary from gene names/IDs to row numbers, so
+    that accessing the expression values of a gene takes constant time.
+
+    Profiles created by samples share the expression values of their parent.
+    Evenly spaced samples are a view of the parent array; other samples are
+    selected when the values of all genes are first needed. The shared
+    values are copied before they are modified by set or set_many, so
+    modifying a profile never modifies another one.
+
     """
     def __init__(self, profile):
         """Initialize an ExpressionProfile object using a pandas DataFrame.
@@ -17,9 +64,108 @@ class ExpressionProfile(object):
                 Each row represents expression levels for a gene, and each
                 column represents expression levels for a sample.
 
+        Raises:
+            ValueError: If gene names/IDs, i.e. the index of profile, are
+                not unique.
+
         """
         assert isinstance(profile, (pd.DataFrame, pd.core.frame.DataFrame))
-        self.__profile = profile
+        values = profile.to_numpy()
+        if not values.flags.writeable:
+            values = values.copy()
+        self._set_data(values, profile.index, profile.columns)
+
+    @classmethod
+    def from_array(cls, values, index, columns):
+        """Create an ExpressionProfile from an array of expression values.
+
+        Args:
+            values (numpy.ndarray): A two dimensional array of expression
+                values. It is used without being copied.
+            index (array-like): The gene names/IDs, one per row of values.
+            columns (array-like): The sample names, one per column of values.
+
+        Returns:
+            ExpressionProfile: An ExpressionProfile wrapping values.
+
+        Raises:
+            ValueError: If gene names/IDs are not unique or if the size of
+                index or columns does not match the shape of values.
+
+        """
+        profile = cls.__new__(cls)
+        profile._set_data(values, pd.Index(index), pd.Index(columns))
+        return profile
+
+    def _set_data(self, values, index, columns):
+        """Set the expression values, gene names/IDs and sample names."""
+        if values.dtype.kind in 'biu':
+            values = values.astype(np.float64)
+        if values.shape != (len(index), len(columns)):
+            raise ValueError('The shape of values must match the number of ' +
+                             'gene names/IDs and sample names.')
+        rows = {identifier: i for i, identifier in enumerate(index)}
+        if len(rows) != len(index):
+            raise ValueError('Gene names/IDs must be unique.')
+        self.__values = values
+        self.__lazy = None
+        self.__shared = False
+        self.__index = index
+        self.__columns = columns
+        self.__rows = rows
+
+    def _derive(self, values, lazy, columns):
+        """Create a profile of the same genes sharing expression values.
+
+        Args:
+            values (numpy.ndarray): A view of the shared expression values, or
+                None if the values are selected lazily.
+            lazy (tuple): If values is None, an array of expression values and
+                the column positions to be selected from it.
+            columns (pandas.Index): The sample names.
+
+        """
+        profile = ExpressionProfile.__new__(ExpressionProfile)
+        profile.__values = values
+        profile.__lazy = lazy
+        profile.__shared = True
+        profile.__index = self.__index
+        profile.__columns = columns
+        profile.__rows = self.__rows
+        return profile
+
+    def _array(self):
+        """Return the expression values, selecting them if needed."""
+        # __lazy is read before __values and cleared after it is set, so
+        # that the values can be selected by several threads at once
+        lazy = self.__lazy
+        values = self.__values
+        if values is None:
+            base, positions = lazy
+            values = base[:, positions]
+            self.__values = values
+            self.__shared = False
+            self.__lazy = None
+        return values
+
+    def _writable_array(self):
+        """Return expression values that can be modified in place."""
+        values = self._array()
+        if self.__shared is True:
+            values = values.copy()
+            self.__values = values
+            self.__shared = False
+        return values
+
+    def _take(self, rows):
+        """Return the expression values of some rows without selecting all.
+        """
+        lazy = self.__lazy
+        values = self.__values
+        if values is None:
+            base, positions = lazy
+            return base[rows][..., positions]
+        return values[rows]
 
     @property
     def shape(self):
@@ -31,7 +177,44 @@ class ExpressionProfile(object):
                 of samples.
 
         """
-        return self.profile.shape
+        return len(self.__index), len(self.__columns)
+
+    @property
+    def dtype(self):
+        """Return the data type of the expression values.
+
+        Returns:
+            numpy.dtype: The data type of the expression values.
+
+        """
+        lazy = self.__lazy
+        values = self.__values
+        return lazy[0].dtype if values is None else values.dtype
+
+    def astype(self, dtype):
+        """Create an ExpressionProfile with expression values of a data type.
+
+        Args:
+            dtype (numpy.dtype): A floating point data type, such as
+                numpy.float32.
+
+        Returns:
+            ExpressionProfile: An ExpressionProfile with the same genes and
+                samples whose expression values are of type dtype. The
+                expression values are only copied if dtype is not their
+                current data type.
+
+        Raises:
+            TypeError: If dtype is not a floating point data type.
+
+        """
+        dtype = np.dtype(dtype)
+        if dtype.kind != 'f':
+            raise TypeError('dtype must be a floating point data type.')
+        if dtype == self.dtype:
+            return self
+        return ExpressionProfile.from_array(self._array().astype(dtype),
+                                            self.__index, self.__columns)
 
     def __len__(self):
         """Return the number of genes in an ExpressionProfile.
@@ -40,7 +223,7 @@ class ExpressionProfile(object):
             int: The number of genes in the ExpressionProfile.
 
         """
-        return self.profile.shape[0]
+        return len(self.__index)
 
     def keys(self):
         """Return the gene IDs (names).
@@ -49,7 +232,7 @@ class ExpressionProfile(object):
             An iterator of the gene ID/names in the ExpressionProfile object.
 
         """
-        return iter(self.profile.index.values)
+        return iter(self.__index.values)
 
     def items(self):
         """Yield tuples of (gene name/ID, expression values).
@@ -60,8 +243,8 @@ class ExpressionProfile(object):
                 expression values, of all samples, for that gene.
 
         """
-        for idx, row in self.profile.iterrows():
-            yield idx, list(row)
+        for identifier, row in zip(self.__index, self._array()):
+            yield identifier, row.tolist()
 
     def values(self):
         """Yield list of expression values per gene.
@@ -71,8 +254,65 @@ class ExpressionProfile(object):
                 next gene.
 
         """
-        for _, row in self.profile.iterrows():
-            yield list(row)
+        for row in self._array():
+            yield row.tolist()
+
+    def iter_items(self, chunk_size=None):
+        """Yield gene names/IDs with read-only views of their expressions.
+
+        Unlike items, no expression value is copied or converted to a Python
+        object.
+
+        Args:
+            chunk_size (int): If None (default), genes are yielded one at a
+                time; otherwise, they are yielded in chunks of chunk_size
+                consecutive genes (the last chunk may be smaller).
+
+        Yields:
+            tuple: A tuple of size two. If chunk_size is None, it contains a
+                gene name/ID and a one dimensional array of its expression
+                values; otherwise, it contains an array of gene names/IDs and
+                a two dimensional array of their expression values.
+
+        """
+        if chunk_size is None:
+            yield from zip(self.__index, self.iter_values())
+        else:
+            identifiers = self.__index.values
+            for start, block in zip(range(0, len(self), chunk_size),
+                                    self.iter_values(chunk_size)):
+                yield identifiers[start:start + chunk_size], block
+
+    def iter_values(self, chunk_size=None):
+        """Yield read-only views of the expression values.
+
+        Args:
+            chunk_size (int): If None (default), one row is yielded per gene;
+                otherwise, blocks of chunk_size consecutive rows are yielded
+                (the last block may be smaller). The samples of a profile
+                created by samples are then selected one block at a time,
+                and the blocks are read-only copies rather than views.
+
+        Yields:
+            numpy.ndarray: A one dimensional array of the expression values of
+                a gene or, if chunk_size is given, a two dimensional array of
+                the expression values of a chunk of genes.
+
+        Raises:
+            ValueError: If chunk_size is not a positive integer.
+
+        """
+        if chunk_size is not None and chunk_size < 1:
+            raise ValueError('chunk_size must be a positive integer.')
+        if chunk_size is None:
+            values = self._array().view()
+            values.flags.writeable = False
+            yield from values
+        else:
+            for start in range(0, len(self), chunk_size):
+                block = self._take(slice(start, start + chunk_size)).view()
+                block.flags.writeable = False
+                yield block
 
     def __getitem__(self, i):
         """Implement evaluation of self[key].
@@ -89,7 +329,20 @@ class ExpressionProfile(object):
             raise TypeError('i must be an integer number.')
         if i < 0 or i >= len(self):
             raise IndexError('Index out of bound error.')
-        return list(self.profile.iloc[i, :])
+        return self._take(i).tolist()
+
+    @property
+    def index(self):
+        """Return the gene names/IDs.
+
+        Unlike profile.index, this does not build a DataFrame, so the
+        samples of a profile created by samples are not selected.
+
+        Returns:
+            pandas.Index: The gene names/IDs, in the order of the rows.
+
+        """
+        return self.__index
 
     @property
     def columns(self):
@@ -99,16 +352,53 @@ class ExpressionProfile(object):
             list: List of all samples in the ExpressionProfile object.
 
         """
-        return list(self.profile.columns)
+        return list(self.__columns)
+
+    @columns.setter
+    def columns(self, names):
+        """Rename the samples.
+
+        Args:
+            names (list): The new sample names, one per sample.
+
+        Raises:
+            ValueError: If the length of names is not equal to the number
+                of samples in the ExpressionProfile.
+
+        """
+        if len(names) != self.shape[1]:
+            raise ValueError('length of names must be equal to the ' +
+                             'number of samples in the ExpressionProfile.')
+        self.__columns = pd.Index(names)
 
     @property
     def profile(self):
         """Return expression profile object as a pandas.DataFrame.
 
+        A new DataFrame is built on each access from a read-only view of
+        the expression values, as returned by data(copy=False). Modifying it,
+        e.g. assigning values, a column, its index or its columns, raises a
+        ValueError instead of being silently lost. Use set, set_many or the
+        columns property to modify an ExpressionProfile, or modify a copy of
+        the DataFrame.
+
         Args:
             pandas.DataFrame: Expression values of all genes across all samples.
         """
-        return self.__profile
+        return _ProfileFrame(self.data(copy=False), index=self.__index,
+                             columns=self.__columns, copy=False)
+
+    def _row(self, identifier):
+        """Return the row number of a gene.
+
+        Raises:
+            KeyError: If identifier is not the name/ID of a gene in the
+                ExpressionProfile object.
+
+        """
+        if identifier not in self:
+            raise KeyError('identifier cannot be found in the Profile object.')
+        return self.__rows[identifier]
 
     def get(self, identifier):
         """Get the expression values for a gene.
@@ -125,9 +415,25 @@ class ExpressionProfile(object):
                 in the ExpressionProfile object.
 
         """
-        if identifier not in self:
-            raise KeyError('identifier cannot be found in the Profile object.')
-        return list(self.profile.loc[identifier, :])
+        return self._take(self._row(identifier)).tolist()
+
+    def get_many(self, identifiers):
+        """Get the expression values for several genes.
+
+        Args:
+            identifiers (list): A sequence of gene names/IDs.
+
+        Returns:
+            numpy.ndarray: A two dimensional array where the i-th row contains
+                the expression values of the gene identifiers[i].
+
+        Raises:
+            KeyError: Raise KeyError if an element of identifiers is not the
+                name/ID of a gene in the ExpressionProfile object.
+
+        """
+        rows = [self._row(identifier) for identifier in identifiers]
+        return self._take(rows)
 
     def set(self, identifier, expression):
         """Set the expression values of a gene.
@@ -146,13 +452,34 @@ class ExpressionProfile(object):
                 equal to the number of samples in the ExpressionProfile.
 
         """
-        if identifier not in self:
-            raise KeyError('identifier cannot be found in the Profile object.')
-        expres = self.get(identifier)
-        if len(expres) != len(expression):
+        row = self._row(identifier)
+        if len(expression) != self.shape[1]:
             raise ValueError('length of expression must be equal to the ' +
                              'number of samples in the ExpressionProfile.')
-        self.profile.loc[identifier, :] = copy.copy(expression)
+        self._writable_array()[row] = expression
+
+    def set_many(self, identifiers, expressions):
+        """Set the expression values of several genes.
+
+        Args:
+            identifiers (list): A sequence of gene names/IDs.
+            expressions (array-like): A two dimensional array where the i-th
+                row contains the expression values to be assigned to the gene
+                identifiers[i].
+
+        Raises:
+            KeyError: Raise KeyError if an element of identifiers is not the
+                name/ID of a gene in the ExpressionProfile object.
+            ValueError: Raise ValueError if the shape of expressions is not
+                (len(identifiers), number of samples in the
+                ExpressionProfile).
+
+        """
+        rows = [self._row(identifier) for identifier in identifiers]
+        if np.shape(expressions) != (len(rows), self.shape[1]):
+            raise ValueError('length of expression must be equal to the ' +
+                             'number of samples in the ExpressionProfile.')
+        self._writable_array()[rows] = expressions
 
     def __contains__(self, identifier):
         """Check if a gene exist in the ExpressionProfile object.
@@ -165,7 +492,10 @@ class ExpressionProfile(object):
                 object; False otherwise.
 
         """
-        return identifier in self.profile.index.values
+        try:
+            return identifier in self.__rows
+        except TypeError:
+            return False
 
     def samples(self, cols):
         """Create an ExpressionProfile from a subset of samples.
@@ -180,7 +510,8 @@ class ExpressionProfile(object):
         Returns:
             ExpressionProfile: An ExpressionProfile object containing the
                 expression level of all genes for the samples represented
-                in cols.
+                in cols. It shares the expression values of self until
+                either of them is modified.
 
         Raises:
             ValueError: Raises ValueError if cols is a list of the
@@ -200,22 +531,105 @@ class ExpressionProfile(object):
         if is_index is False:
             if not set(cols).issubset(set(self.columns)):
                 raise ValueError(error_msg)
-            result = self.profile.loc[:, cols]
+            positions = self.__columns.get_indexer(cols)
         else:
             if max(cols) >= len(self.columns) or min(cols) < 0:
                 raise IndexError('Index out of bound error.')
-            result = self.profile.iloc[:, cols]
-        return ExpressionProfile(copy.copy(result))
+            positions = np.asarray(cols, dtype=np.intp)
+        columns = self.__columns[positions]
+        lazy = self.__lazy
+        values = self.__values
+        if values is None:
+            values, parent_positions = lazy
+            positions = parent_positions[positions]
+        else:
+            self.__shared = True
+        window = _as_slice(positions)
+        if window is None:
+            return self._derive(None, (values, positions), columns)
+        return self._derive(values[:, window], None, columns)
 
-    def data(self):
+    def data(self, copy=True):
         """Return the expression values of the ExpressionProfile.
 
+        Args:
+            copy (bool): If True (default), a copy of the expression values is
+                returned; otherwise, a read-only view of them is returned. The
+                view is not affected by later modifications of the profile.
+
         Returns:
             numpy.ndarray: A shallow copy of the expression values from
                 the ExpressionProfile object.
 
         """
-        return copy.copy(self.profile.values)
+        if copy is True:
+            return self._array().copy()
+        values = self._array().view()
+        self.__shared = True
+        values.flags.writeable = False
+        return values
+
+    def to_shared_memory(self):
+        """Copy the expression values to shared memory.
+
+        Other processes, e.g. the workers of a process pool, can then attach
+        the profile without copying its expression values by passing the
+        handle of the returned object to from_shared_memory.
+
+        Returns:
+            shared.SharedExport: An object whose handle attribute can be
+                pickled. The shared memory is released when it is closed,
+                e.g. at the end of a with statement.
+
+        """
+        return shared.SharedExport({'values': self._array()},
+                                   {'index': list(self.__index),
+                                    'index_name': self.__index.name,
+                                    'columns': list(self.__columns)})
+
+    @classmethod
+    def from_shared_memory(cls, handle):
+        """Attach a profile copied to shared memory.
+
+        The expression values of the attached profile are a read-only view of
+        the shared memory; they are copied before being modified by set or
+        set_many.
+
+        Args:
+            handle (shared.SharedHandle): The handle of the object returned by
+                to_shared_memory.
+
+        Returns:
+            ExpressionProfile: A profile with the same genes, samples and
+                expression values.
+
+        Raises:
+            FileNotFoundError: If the shared memory has been released.
+
+        """
+        values = shared.attach(handle)['values']
+        profile = cls.from_array(values,
+                                 pd.Index(handle.info['index'],
+                                          name=handle.info['index_name']),
+                                 handle.info['columns'])
+        profile.__shared = True
+        return profile
+
+    def __getstate__(self):
+        """Return the state to be pickled.
+
+        Only the expression values of the profile are pickled, and not the
+        values of other samples of a parent array shared with it.
+
+        """
+        state = self.__dict__.copy()
+        lazy = state.pop('_ExpressionProfile__lazy')
+        if lazy is not None:
+            base, positions = lazy
+            state['_ExpressionProfile__values'] = base[:, positions]
+        state['_ExpressionProfile__lazy'] = None
+        state['_ExpressionProfile__shared'] = False
+        return state
 
     def __str__(self):
         """A string representation.
@@ -249,5 +663,7 @@ class ExpressionProfile(object):
         if set(self.columns) & set(other.columns) != set():
             raise ValueError('Profile sample names must be unique after '
                              'concatenation.')
-        data = pd.concat([self.profile, other.profile], axis=1)
-        return ExpressionProfile(data)
+        values = np.concatenate([self._array(), other._array()], axis=1)
+        return ExpressionProfile.from_array(values, self.__index,
+                                            self.__columns.append(
+                                                other.__columns))
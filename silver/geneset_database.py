@@ -1,20 +1,196 @@
 from collections import OrderedDict
+import json
+import os
+import uuid
+import numpy as np
+from scipy import sparse
+from silver import cache
+
+
+# Names of the files in a directory created by GenesetDatabase.save
+_ARRAYS = ('names', 'descriptions', 'genes', 'indptr', 'indices')
+_METADATA_FILE = 'metadata.json'
+# Similarity measures of overlap_matrix and top_overlaps
+_METRICS = ('count', 'jaccard')
+
+
+def _index_dtype(size):
+    """Return the smallest integer type used for indices less than size."""
+    return np.int32 if size < 2 ** 31 else np.int64
+
+
+class _ReadOnlyDict(OrderedDict):
+    """An OrderedDict that cannot be modified.
+
+    GenesetDatabase builds its genesets and descriptions from its arrays as
+    _ReadOnlyDict objects, so that modifications, which would not be applied
+    to the arrays, raise an error. Copies are ordinary OrderedDict objects.
+
+    Args:
+        items (iterable): The (key, value) pairs of the dictionary.
+
+    """
+
+    def __init__(self, items=()):
+        super().__init__()
+        for key, value in items:
+            OrderedDict.__setitem__(self, key, value)
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('The genesets and descriptions of a GenesetDatabase '
+                        'are read-only; assign a new dictionary to its '
+                        'database or info attribute instead.')
+
+    __setitem__ = __delitem__ = _read_only
+    clear = pop = popitem = setdefault = update = move_to_end = _read_only
+    __ior__ = _read_only
+
+    def copy(self):
+        return OrderedDict(self)
+
+    __copy__ = copy
+
+    def __or__(self, other):
+        result = OrderedDict(self)
+        result.update(other)
+        return result
+
+    def __ror__(self, other):
+        result = OrderedDict(other)
+        result.update(self)
+        return result
+
+    def __reduce__(self):
+        return (self.__class__, (list(self.items()),))
 
 
 class GenesetDatabase(object):
+    """A collection of named genesets.
+
+    Gene names/IDs are interned in a vocabulary array and genesets are stored
+    in compressed sparse row (CSR) form: the genes of the i-th geneset are
+    genes[indices[indptr[i]:indptr[i + 1]]]. Geneset names and descriptions
+    are stored in arrays as well, so that a database holds no Python object
+    per gene or per geneset and can be saved to and memory-mapped from .npy
+    files. An inverted index from genes to the genesets containing them is
+    built on request.
+
+    Args:
+        database (OrderedDict): A dictionary from geneset names to lists of
+            genes.
+        info (OrderedDict): A dictionary from geneset names to their
+            descriptions, or None.
+
+    """
+    __slots__ = ('_names', '_descriptions', '_genes', 'indptr', 'indices',
+                 '_gene_ids', '_positions', '_database', '_info',
+                 '_gene_indptr', '_gene_sets', '_membership')
+
     def __init__(self, database, info=None):
         assert isinstance(database, OrderedDict)
         self.database = database
         self.info = info
 
+    @classmethod
+    def _from_arrays(cls, names, descriptions, genes, indptr, indices):
+        """Create a database from its arrays, which are used without copy."""
+        gsdb = cls.__new__(cls)
+        gsdb._set_arrays(names, descriptions, genes, indptr, indices)
+        return gsdb
+
+    def _set_arrays(self, names, descriptions, genes, indptr, indices):
+        """Set the encoded genesets and clear the derived structures."""
+        self._names = names
+        self._descriptions = descriptions
+        self._genes = genes
+        self.indptr = indptr
+        self.indices = indices
+        self._gene_ids = None
+        self._positions = None
+        self._database = None
+        self._info = None
+        self._gene_indptr = None
+        self._gene_sets = None
+        self._membership = None
+
+    @staticmethod
+    def _encode(genesets):
+        """Encode lists of genes as a vocabulary and CSR arrays."""
+        gene_ids = {}
+        indices = []
+        indptr = [0]
+        for genes in genesets:
+            indices.extend(gene_ids.setdefault(gene, len(gene_ids))
+                           for gene in genes)
+            indptr.append(len(indices))
+        return (np.array(list(gene_ids), dtype=str),
+                np.array(indptr, dtype=_index_dtype(len(indices) + 1)),
+                np.array(indices, dtype=_index_dtype(len(gene_ids))))
+
+    @property
+    def database(self):
+        """Return the genesets as an OrderedDict of lists of genes.
+
+        The returned dictionary is read-only, i.e. modifying it raises a
+        TypeError, and its lists are copies of the genes of the genesets.
+        The genesets are modified by assigning a new dictionary, e.g. a
+        modified copy obtained by database.copy(), to database.
+
+        """
+        if self._database is None:
+            self._database = _ReadOnlyDict(
+                (name, self._members(i))
+                for i, name in enumerate(self._names.tolist()))
+        return self._database
+
+    @database.setter
+    def database(self, database):
+        info = self.info if hasattr(self, '_names') else None
+        genes, indptr, indices = self._encode(database.values())
+        self._set_arrays(np.array(list(database), dtype=str), None, genes,
+                         indptr, indices)
+        self.info = info
+
+    @property
+    def info(self):
+        """Return the descriptions of the genesets as an OrderedDict, or None.
+
+        The returned dictionary is read-only, as the one returned by
+        database.
+
+        """
+        if self._descriptions is None:
+            return None
+        if self._info is None:
+            self._info = _ReadOnlyDict(zip(self._names.tolist(),
+                                         self._descriptions.tolist()))
+        return self._info
+
+    @info.setter
+    def info(self, info):
+        self._info = None
+        if info is None:
+            self._descriptions = None
+        else:
+            self._descriptions = np.array([info.get(name, '') for name in
+                                           self._names.tolist()], dtype=str)
+
+    def _members(self, i):
+        """Return the list of genes of the i-th geneset."""
+        return self._genes[self.indices[self.indptr[i]:
+                                        self.indptr[i + 1]]].tolist()
+
     def __getitem__(self, identifier):
-        return self.database[identifier]
+        if self._positions is None:
+            self._positions = {name: i for i, name in
+                               enumerate(self._names.tolist())}
+        return self._members(self._positions[identifier])
 
     def __len__(self):
-        return len(self.database)
+        return len(self._names)
 
     def __iter__(self):
-        return iter(self.database)
+        return iter(self._names.tolist())
 
     def keys(self):
         return self.database.keys()
@@ -25,29 +201,314 @@ class GenesetDatabase(object):
     def values(self):
         return self.database.values()
 
+    @property
+    def sizes(self):
+        """Return the number of genes in each geneset.
+
+        Returns:
+            numpy.ndarray: The sizes of the genesets in the order of keys().
+
+        """
+        return np.diff(self.indptr)
+
     @classmethod
-    def fromGMT(cls, address):
+    def fromGMT(cls, address, cache_dir=None):
+        """Read a database from a GMT file.
+
+        Args:
+            address (str): The address of a GMT file.
+            cache_dir (str): Address of a directory for caching the parsed
+                database. The cached arrays are memory-mapped when they are
+                loaded. If None (default), no cache is used.
+
+        Returns:
+            GenesetDatabase: The genesets of the GMT file.
+
+        """
+        if cache_dir is not None:
+            key = cache.file_key(address, reader='gmt')
+            entry = cache.load(cache_dir, key, mmap=_ARRAYS, mmap_mode='r')
+            if entry is not None:
+                arrays, _ = entry
+                return cls._from_arrays(*(arrays[name] for name in _ARRAYS))
         sep = '\t'
-        database, info = OrderedDict(), OrderedDict()
+        names, descriptions, genesets = [], [], []
         with open(address) as fin:
             for line in fin:
                 line = line.strip()
                 if line == '':
                     continue
                 words = [w.strip() for w in line.split(sep)]
-                name = words[0]
-                info[name] = words[1]
-                database[name] = words[2:]
-        return GenesetDatabase(database, info)
+                names.append(words[0])
+                descriptions.append(words[1])
+                genesets.append(words[2:])
+        gsdb = cls._from_arrays(np.array(names, dtype=str),
+                                np.array(descriptions, dtype=str),
+                                *cls._encode(genesets))
+        if cache_dir is not None:
+            cache.save(cache_dir, key, gsdb._arrays())
+        return gsdb
+
+    def _arrays(self):
+        """Return the arrays of the database by name."""
+        descriptions = self._descriptions
+        if descriptions is None:
+            descriptions = np.array([], dtype=str)
+        return {'names': self._names, 'descriptions': descriptions,
+                'genes': self._genes, 'indptr': self.indptr,
+                'indices': self.indices}
+
+    def save(self, address):
+        """Save the database to a directory of .npy files.
+
+        Args:
+            address (str): The address of a directory. It is created if it
+                does not exist, and files of a previously saved database are
+                replaced.
+
+        """
+        os.makedirs(address, exist_ok=True)
+        # The temporary files are unique to this call, so that threads and
+        # processes can save to the same address at once
+        suffix = '.{}.tmp'.format(uuid.uuid4().hex)
+        for name, array in self._arrays().items():
+            with open(os.path.join(address, name + '.npy' + suffix),
+                      'wb') as fout:
+                np.save(fout, array, allow_pickle=False)
+        metadata_address = os.path.join(address, _METADATA_FILE)
+        with open(metadata_address + suffix, 'w') as fout:
+            json.dump({'has_info': self._descriptions is not None}, fout)
+        for name in _ARRAYS:
+            array_address = os.path.join(address, name + '.npy')
+            os.replace(array_address + suffix, array_address)
+        os.replace(metadata_address + suffix, metadata_address)
+
+    @classmethod
+    def load(cls, address, mmap_mode='r'):
+        """Load a database saved by save.
+
+        Args:
+            address (str): The address of a directory created by save.
+            mmap_mode (str): The mode used to memory-map the arrays, as in
+                numpy.load. If None, the arrays are read into memory.
+
+        Returns:
+            GenesetDatabase: The loaded database.
+
+        """
+        with open(os.path.join(address, _METADATA_FILE)) as fin:
+            metadata = json.load(fin)
+        arrays = {name: np.load(os.path.join(address, name + '.npy'),
+                                mmap_mode=mmap_mode)
+                  for name in _ARRAYS}
+        if not metadata['has_info']:
+            arrays['descriptions'] = None
+        return cls._from_arrays(*(arrays[name] for name in _ARRAYS))
+
+    def _gene_id(self, gene):
+        """Return the integer code of a gene, or None if it is unknown."""
+        if self._gene_ids is None:
+            self._gene_ids = {gene: i for i, gene in
+                              enumerate(self._genes.tolist())}
+        return self._gene_ids.get(gene)
+
+    def _build_inverted_index(self):
+        """Build the index from genes to the genesets containing them."""
+        set_ids = np.repeat(np.arange(len(self), dtype=self.indices.dtype),
+                            self.sizes)
+        order = np.argsort(self.indices, kind='stable')
+        counts = np.bincount(self.indices, minlength=len(self._genes))
+        self._gene_sets = set_ids[order]
+        self._gene_indptr = np.concatenate([[0], np.cumsum(counts)])
+
+    def sets_containing(self, gene):
+        """Find the genesets containing a gene.
+
+        Args:
+            gene (str): A gene name/ID.
+
+        Returns:
+            list: The names of the genesets containing gene, in the order of
+                keys(). A geneset listing gene several times appears several
+                times.
+
+        """
+        g = self._gene_id(gene)
+        if g is None:
+            return []
+        if self._gene_sets is None:
+            self._build_inverted_index()
+        set_ids = self._gene_sets[self._gene_indptr[g]:self._gene_indptr[g + 1]]
+        return self._names[set_ids].tolist()
+
+    def cleaned(self, background, min_size=1, max_size=float('inf')):
+        """Create a database restricted to the genes of a background.
+
+        Args:
+            background (iterable): The genes to be kept, e.g. the genes
+                measured by a platform.
+            min_size (int): Genesets with fewer genes in background are
+                excluded. The default is 1.
+            max_size (int): Genesets with more genes in background are
+                excluded. The default is infinity.
+
+        Returns:
+            GenesetDatabase: A new database containing the genes of each
+                geneset that are in background, in their original order,
+                for the genesets with a size between min_size and max_size.
+                It shares the gene vocabulary of self, which is not modified.
+
+        """
+        in_background = np.zeros(len(self._genes), dtype=bool)
+        gene_ids = [self._gene_id(gene) for gene in set(background)]
+        in_background[[g for g in gene_ids if g is not None]] = True
+        kept = in_background[self.indices]
+        ends = np.concatenate([[0], np.cumsum(kept)])[self.indptr]
+        sizes = np.diff(ends)
+        selected = (sizes >= min_size) & (sizes <= max_size)
+        kept &= np.repeat(selected, self.sizes)
+        indptr = np.concatenate([[0], np.cumsum(sizes[selected])])
+        descriptions = self._descriptions
+        if descriptions is not None:
+            descriptions = descriptions[selected]
+        result = GenesetDatabase._from_arrays(
+            self._names[selected], descriptions, self._genes,
+            indptr.astype(_index_dtype(indptr[-1] + 1)),
+            self.indices[kept])
+        result._gene_ids = self._gene_ids
+        return result
 
     def clean(self, background, min_size=1, max_size=float('inf')):
-        background = set(background)
-        db = OrderedDict()
-        for name, gs in self.database.items():
-            geneset = [g for g in gs if g in background]
-            if min_size <= len(geneset) <= max_size:
-                db[name] = geneset
-            else:
-                del self.info[name]
-        self.database = db
+        """Restrict the database to the genes of a background in place.
+
+        See cleaned for the arguments.
+
+        """
+        result = self.cleaned(background, min_size=min_size,
+                              max_size=max_size)
+        self._set_arrays(result._names, result._descriptions, result._genes,
+                         result.indptr, result.indices)
+        self._gene_ids = result._gene_ids
+
+    def membership_matrix(self):
+        """Return the binary genesets x genes membership matrix.
+
+        Returns:
+            scipy.sparse.csr_matrix: A matrix whose (i, j) element is 1 if the
+                i-th geneset contains the j-th gene of the vocabulary and 0
+                otherwise. Genes listed several times in a geneset are
+                counted once.
+
+        """
+        if self._membership is None:
+            shape = (len(self), len(self._genes))
+            # sum_duplicates sorts and compacts the index arrays in place, so
+            # the matrix is built from copies of the arrays of the database
+            membership = sparse.csr_matrix(
+                (np.ones(len(self.indices), dtype=np.int32),
+                 np.array(self.indices), np.array(self.indptr)),
+                shape=shape)
+            membership.sum_duplicates()
+            membership.data[:] = 1
+            self._membership = membership
+        return self._membership
+
+    @staticmethod
+    def _check_metric(metric):
+        """Raise ValueError if metric is not a supported similarity."""
+        if metric not in _METRICS:
+            raise ValueError('metric must be one of {}.'.format(
+                ', '.join(_METRICS)))
+
+    def _similarities(self, rows, metric):
+        """Compute the similarities of some genesets with all genesets.
+
+        Args:
+            rows (slice): The genesets compared with all genesets.
+            metric (str): 'count' or 'jaccard'.
+
+        Returns:
+            scipy.sparse.csr_matrix: The similarities; pairs without common
+                genes are not stored.
+
+        """
+        membership = self.membership_matrix()
+        product = (membership[rows] @ membership.T).tocsr()
+        product.sort_indices()
+        if metric == 'count':
+            return product
+        sizes = np.asarray(membership.sum(axis=1)).ravel()
+        row_sizes = np.repeat(sizes[rows], np.diff(product.indptr))
+        union = row_sizes + sizes[product.indices] - product.data
+        return sparse.csr_matrix((product.data / union, product.indices,
+                                  product.indptr), shape=product.shape)
+
+    def overlap_matrix(self, metric='count'):
+        """Compute the similarity of every pair of genesets.
+
+        All similarities are obtained from one sparse product of the
+        membership matrix with its transpose.
+
+        Args:
+            metric (str): 'count' (default) for the number of common genes or
+                'jaccard' for the number of common genes divided by the
+                number of genes in either geneset.
+
+        Returns:
+            scipy.sparse.csr_matrix: A symmetric matrix whose (i, j) element
+                is the similarity of the i-th and j-th genesets, in the order
+                of keys(). Pairs without common genes are not stored.
+
+        Raises:
+            ValueError: If metric is not 'count' or 'jaccard'.
+
+        """
+        self._check_metric(metric)
+        return self._similarities(slice(None), metric)
+
+    def top_overlaps(self, k, metric='jaccard', chunk_size=1024):
+        """Find the most similar genesets of every geneset.
+
+        Genesets are compared with all others chunk_size at a time, so that
+        memory usage is bounded by the overlaps of a chunk rather than those
+        of the whole collection.
+
+        Args:
+            k (int): The number of similar genesets returned per geneset.
+            metric (str): 'jaccard' (default) or 'count'; see overlap_matrix.
+            chunk_size (int): The number of genesets compared at once.
+
+        Returns:
+            tuple: Two arrays of shape (number of genesets, k). The i-th row
+                of the first one contains the positions, in the order of
+                keys(), of the genesets most similar to the i-th geneset,
+                excluding itself, in decreasing order of similarity (ties are
+                broken by position); the second one contains their
+                similarities. Rows with fewer than k overlapping genesets are
+                padded with -1 and 0.
+
+        Raises:
+            ValueError: If metric is not 'count' or 'jaccard', or if k or
+                chunk_size is not a positive integer.
 
+        """
+        self._check_metric(metric)
+        if k < 1 or chunk_size < 1:
+            raise ValueError('k and chunk_size must be positive integers.')
+        num_sets = len(self)
+        neighbors = np.full((num_sets, k), -1, dtype=np.int64)
+        scores = np.zeros((num_sets, k),
+                          dtype=np.int64 if metric == 'count' else float)
+        for start in range(0, num_sets, chunk_size):
+            chunk = self._similarities(slice(start, start + chunk_size),
+                                       metric)
+            for row in range(chunk.shape[0]):
+                begin, end = chunk.indptr[row], chunk.indptr[row + 1]
+                columns = chunk.indices[begin:end]
+                values = chunk.data[begin:end]
+                others = columns != start + row
+                columns, values = columns[others], values[others]
+                best = np.lexsort((columns, -values))[:k]
+                neighbors[start + row, :len(best)] = columns[best]
+                scores[start + row, :len(best)] = values[best]
+        return neighbors, scores
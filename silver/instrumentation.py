@@ -0,0 +1,275 @@
+"""This module records where the time of a simulation goes.
+
+"""
+from contextlib import contextmanager
+import threading
+import time
+import numpy as np
+
+
+# The outcomes of simulating the differential expression of a gene
+HIT = 'hit'
+FALLBACK = 'fallback'
+MISS = 'miss'
+
+
+class SimulationStats(object):
+    """Collect timings and search effort of a simulation.
+
+    A SimulationStats object records the duration of named stages and, for
+    every differentially expressed gene, the number of repository rows that
+    were tested, the outcome of the search and its latency. The outcome is
+    HIT if a repository row met the criteria, FALLBACK if the control
+    expressions were shifted by random noise instead (force=True), and MISS
+    if the gene was left unchanged. Genes searched together in a batch, e.g.
+    by DExpress.batch, have no latency of their own; the latency of each
+    batch and its number of genes are recorded instead.
+
+    Records are appended under a lock, so a SimulationStats object can be
+    shared by criteria used from several threads.
+
+    """
+
+    def __init__(self):
+        self.stage_times = {}
+        self._rows_tested = []
+        self._outcomes = []
+        self._latencies = []
+        self._batch_latencies = []
+        self._batch_sizes = []
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        """Return the state to be pickled, without the lock."""
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        """Restore a pickled state with a new lock."""
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """Time a stage of the simulation.
+
+        The duration of the code run in the with statement is added to
+        stage_times[name].
+
+        Args:
+            name (str): The name of the stage.
+
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.stage_times[name] = (self.stage_times.get(name, 0.0) +
+                                          elapsed)
+
+    def record_gene(self, rows_tested, outcome, latency):
+        """Record the search for the differential expression of a gene.
+
+        Args:
+            rows_tested (int): The number of repository rows tested.
+            outcome (str): HIT, FALLBACK or MISS.
+            latency (float): The duration of the search in seconds.
+
+        """
+        self.record_genes([rows_tested], [outcome], [latency])
+
+    def record_genes(self, rows_tested, outcomes, latencies):
+        """Record the searches for the differential expression of genes.
+
+        Args:
+            rows_tested (array-like): The number of repository rows tested
+                for each gene.
+            outcomes (array-like): The outcome, HIT, FALLBACK or MISS, for
+                each gene.
+            latencies (array-like): The duration of the search for each gene
+                in seconds.
+
+        Raises:
+            ValueError: If the arguments are not of the same length.
+
+        """
+        rows_tested = np.asarray(rows_tested, dtype=np.int64).tolist()
+        outcomes = [str(outcome) for outcome in outcomes]
+        latencies = np.asarray(latencies, dtype=float).tolist()
+        if not len(rows_tested) == len(outcomes) == len(latencies):
+            raise ValueError('rows_tested, outcomes and latencies must be of '
+                             'the same length.')
+        with self._lock:
+            self._rows_tested.extend(rows_tested)
+            self._outcomes.extend(outcomes)
+            self._latencies.extend(latencies)
+
+    def record_batch(self, rows_tested, outcomes, latency):
+        """Record the searches for genes simulated together in a batch.
+
+        The latencies of the genes are recorded as nan.
+
+        Args:
+            rows_tested (array-like): The number of repository rows tested
+                for each gene.
+            outcomes (array-like): The outcome, HIT, FALLBACK or MISS, for
+                each gene.
+            latency (float): The duration of the whole batch in seconds.
+
+        Raises:
+            ValueError: If rows_tested and outcomes are not of the same
+                length.
+
+        """
+        rows_tested = np.asarray(rows_tested, dtype=np.int64).tolist()
+        outcomes = [str(outcome) for outcome in outcomes]
+        if len(rows_tested) != len(outcomes):
+            raise ValueError('rows_tested and outcomes must be of the same '
+                             'length.')
+        with self._lock:
+            self._rows_tested.extend(rows_tested)
+            self._outcomes.extend(outcomes)
+            self._latencies.extend([np.nan] * len(outcomes))
+            self._batch_latencies.append(float(latency))
+            self._batch_sizes.append(len(outcomes))
+
+    @property
+    def num_genes(self):
+        """Return the number of recorded genes."""
+        return len(self._outcomes)
+
+    @property
+    def rows_tested(self):
+        """Return the number of repository rows tested for each gene.
+
+        Returns:
+            numpy.ndarray: The number of rows tested, in recording order.
+
+        """
+        return np.array(self._rows_tested, dtype=np.int64)
+
+    @property
+    def latencies(self):
+        """Return the latency of the search for each gene.
+
+        Returns:
+            numpy.ndarray: The latencies in seconds, in recording order. The
+                latencies of genes recorded by record_batch are nan.
+
+        """
+        return np.array(self._latencies, dtype=float)
+
+    @property
+    def batch_latencies(self):
+        """Return the latency of each batch recorded by record_batch.
+
+        Returns:
+            numpy.ndarray: The latencies in seconds, in recording order.
+
+        """
+        return np.array(self._batch_latencies, dtype=float)
+
+    @property
+    def batch_sizes(self):
+        """Return the number of genes in each batch recorded by record_batch.
+
+        Returns:
+            numpy.ndarray: The numbers of genes, in recording order.
+
+        """
+        return np.array(self._batch_sizes, dtype=np.int64)
+
+    @property
+    def hits(self):
+        """Return the number of genes expressed using a repository row."""
+        return self._outcomes.count(HIT)
+
+    @property
+    def fallbacks(self):
+        """Return the number of genes expressed by shifting controls."""
+        return self._outcomes.count(FALLBACK)
+
+    @property
+    def misses(self):
+        """Return the number of genes that could not be expressed."""
+        return self._outcomes.count(MISS)
+
+    def latency_histogram(self, bins=None):
+        """Compute a histogram of the per-gene latencies.
+
+        Genes recorded by record_batch, which have no latency of their own,
+        are left out.
+
+        Args:
+            bins (array-like): The bin edges in seconds. If None (default),
+                one bin per half decade from one microsecond is used.
+
+        Returns:
+            tuple: The number of genes in each bin and the bin edges, as
+                returned by numpy.histogram.
+
+        """
+        latencies = self.latencies
+        latencies = latencies[~np.isnan(latencies)]
+        if bins is None:
+            top = max(1e-6, latencies.max()) if len(latencies) > 0 else 1e-6
+            num_edges = int(np.ceil(2 * np.log10(top / 1e-6))) + 1
+            bins = 1e-6 * 10 ** (np.arange(max(2, num_edges)) / 2)
+            bins[0] = 0.0
+        return np.histogram(latencies, bins=bins)
+
+    def summary(self):
+        """Summarize the records.
+
+        Returns:
+            dict: A JSON serializable summary with the stage timings, the
+                number of genes per outcome, statistics of the number of rows
+                tested, of the per-gene latencies and of the batch latencies,
+                and the per-gene latency histogram.
+
+        """
+        rows_tested = self.rows_tested
+        latencies = self.latencies
+        latencies = latencies[~np.isnan(latencies)]
+        batch_latencies = self.batch_latencies
+        counts, edges = self.latency_histogram()
+        result = {'stage_times': dict(self.stage_times),
+                  'num_genes': self.num_genes,
+                  'hits': self.hits,
+                  'fallbacks': self.fallbacks,
+                  'misses': self.misses,
+                  'latency_histogram': {'counts': counts.tolist(),
+                                        'edges': edges.tolist()}}
+        if self.num_genes > 0:
+            result['rows_tested'] = {'total': int(rows_tested.sum()),
+                                     'mean': float(rows_tested.mean()),
+                                     'max': int(rows_tested.max())}
+        if len(latencies) > 0:
+            result['latency'] = {
+                'total': float(latencies.sum()),
+                'mean': float(latencies.mean()),
+                'median': float(np.median(latencies)),
+                'p99': float(np.percentile(latencies, 99))}
+        if len(batch_latencies) > 0:
+            result['batch_latency'] = {
+                'num_batches': len(batch_latencies),
+                'num_genes': int(self.batch_sizes.sum()),
+                'total': float(batch_latencies.sum()),
+                'mean': float(batch_latencies.mean()),
+                'max': float(batch_latencies.max())}
+        return result
+
+    def __str__(self):
+        """A string representation.
+
+        Returns:
+            str: The stage timings and the outcome counts.
+        """
+        stages = ', '.join(f'{name}: {elapsed:.4f}s'
+                           for name, elapsed in self.stage_times.items())
+        return (f'SimulationStats({stages}; genes: {self.num_genes}, '
+                f'hits: {self.hits}, fallbacks: {self.fallbacks}, '
+                f'misses: {self.misses})')
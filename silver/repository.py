@@ -1,6 +1,54 @@
 """Represent a repository, which is a collection for expression values.
 """
+import hashlib
+import json
+import numbers
+import os
+import uuid
 import numpy as np
+from silver import shared
+
+
+# Names of the files in a directory created by Repository.save
+_ROWS_FILE = 'repository.npy'
+_SAMPLE_INDICES_FILE = 'sample_indices.npy'
+_METADATA_FILE = 'metadata.json'
+
+
+def _seed_state(random_state):
+    """Return a description of a reproducible seed that can be saved as JSON.
+
+    Args:
+        random_state: An integer seed, a numpy.random.SeedSequence, or any
+            other value accepted by numpy.random.default_rng.
+
+    Returns:
+        The integer seed, a dictionary with the entropy, spawn_key and
+            pool_size of a SeedSequence, or None if random_state cannot be
+            reproduced, e.g. it is None or a numpy.random.Generator.
+
+    """
+    if isinstance(random_state, numbers.Integral):
+        return int(random_state)
+    if isinstance(random_state, np.random.SeedSequence):
+        entropy = random_state.entropy
+        if isinstance(entropy, numbers.Integral):
+            entropy = int(entropy)
+        else:
+            entropy = [int(value) for value in entropy]
+        return {'entropy': entropy,
+                'spawn_key': [int(value) for value in random_state.spawn_key],
+                'pool_size': int(random_state.pool_size)}
+    return None
+
+
+def _seed_from_state(state):
+    """Return the seed described by the output of _seed_state."""
+    if isinstance(state, dict):
+        return np.random.SeedSequence(state['entropy'],
+                                      spawn_key=state['spawn_key'],
+                                      pool_size=state['pool_size'])
+    return state
 
 
 class Repository(object):
@@ -17,6 +65,20 @@ class Repository(object):
             num_repetitions (int): A positive integer representing the number of
                 samplings. In each sampling a set of columns from the cases is
                 extracted and appended to the repository.
+            random_state (int): A seed, a numpy.random.SeedSequence, or a
+                numpy.random.Generator, for reproducing the samplings.
+            virtual (bool): If False (default), the rows of the repository are
+                copied into one array. If True, only a reference to the
+                expression values of case_expression_profile and the sampled
+                column indices are kept, and rows are built when they are
+                accessed. Later modifications of case_expression_profile
+                through its set methods copy its expression values first, so
+                they do not modify the repository.
+            dtype (numpy.dtype): If given, the expression values are
+                converted to this floating point data type, e.g. numpy.float32
+                to halve the memory used by the repository. If None (default),
+                the data type of case_expression_profile is kept. The row
+                summaries are computed in float64 in any case.
 
         Raises:
             ValueError: If num_sim_cases is greater than the number of samples
@@ -25,23 +87,332 @@ class Repository(object):
     """
 
     def __init__(self, case_expression_profile, num_sim_cases,
-                 num_repetitions=1, random_state=None):
-        np.random.seed(random_state)
+                 num_repetitions=1, random_state=None, virtual=False,
+                 dtype=None):
+        if dtype is not None:
+            case_expression_profile = case_expression_profile.astype(dtype)
+        rng = np.random.default_rng(random_state)
         total_num_cases = len(case_expression_profile.columns)
         if num_sim_cases > total_num_cases:
             raise ValueError('num_sim_cases must be less than or equal to' +
                              ' the total number of case samples.')
-        indices = np.random.choice(np.arange(total_num_cases), num_sim_cases,
-                                   replace=False)
-        indices = [int(value) for value in indices]
-        repository = case_expression_profile.samples(indices).data()
-        for _ in range(1, num_repetitions):
-            indices = list(np.random.choice(np.arange(total_num_cases),
-                                            num_sim_cases, replace=False))
-            indices = [int(value) for value in indices]
-            batch = case_expression_profile.samples(indices).data()
-            repository = np.concatenate([repository, batch], axis=0)
-        self.repository = repository
+        num_repetitions = max(1, num_repetitions)
+        sample_indices = np.empty((num_repetitions, num_sim_cases),
+                                  dtype=np.intp)
+        for rep in range(num_repetitions):
+            sample_indices[rep] = rng.choice(total_num_cases, num_sim_cases,
+                                             replace=False)
+        source = case_expression_profile.data(copy=False)
+        self.virtual = virtual
+        self.random_state = random_state
+        self._num_genes = len(case_expression_profile)
+        self._sample_indices = sample_indices
+        self._source = source
+        self._source_hash = None
+        if virtual is True:
+            self._repository = None
+        else:
+            repository = np.empty((num_repetitions * self._num_genes,
+                                   num_sim_cases), dtype=source.dtype)
+            for rep, indices in enumerate(sample_indices):
+                repository[self._rep_rows(rep)] = source[:, indices]
+            self._repository = repository
+        self._means = None
+        self._variances = None
+        self._counts = None
+        self._mean_order = None
+        self._sorted_means = None
+        self._sorted_repository = None
+        self._key = None
+
+    @staticmethod
+    def fingerprint(case_expression_profile):
+        """Compute a hash of the expression values of a profile.
+
+        Args:
+            case_expression_profile (ExpressionProfile): Expression data for
+                case samples.
+
+        Returns:
+            str: A hexadecimal digest that identifies the expression values
+                used to build a Repository object.
+
+        """
+        return Repository._hash(case_expression_profile.data(copy=False))
+
+    @staticmethod
+    def _hash(values):
+        """Compute a hash of an array, its shape and its data type."""
+        digest = hashlib.sha256()
+        digest.update(str((values.shape, values.dtype.str)).encode())
+        digest.update(np.ascontiguousarray(values).data)
+        return digest.hexdigest()
+
+    @property
+    def source_hash(self):
+        """Return the hash of the case expression values of the repository.
+
+        Returns:
+            str: The value of Repository.fingerprint for the profile used to
+                build the Repository object.
+
+        """
+        if self._source_hash is None:
+            self._source_hash = self._hash(self._source)
+        return self._source_hash
+
+    @property
+    def key(self):
+        """Return a key that identifies the rows of the repository.
+
+        Repository objects built from the same expression values with the
+        same num_sim_cases, num_repetitions and integer or SeedSequence
+        random_state have the same rows and the same key, even if they are
+        created or loaded separately. Other Repository objects get a unique
+        key.
+
+        Returns:
+            str: A hexadecimal string.
+
+        """
+        if self._key is None:
+            metadata = self._metadata()
+            if metadata['random_state'] is None:
+                self._key = uuid.uuid4().hex
+            else:
+                self._key = hashlib.sha256(json.dumps(
+                    metadata, sort_keys=True).encode()).hexdigest()
+        return self._key
+
+    def _metadata(self):
+        """Return the metadata stored by save."""
+        return {'source_hash': self.source_hash,
+                'random_state': _seed_state(self.random_state),
+                'num_sim_cases': int(self.shape[1]),
+                'num_repetitions': len(self._sample_indices),
+                'num_genes': int(self._num_genes),
+                'dtype': np.dtype(self.dtype).str}
+
+    def save(self, address):
+        """Save the Repository object to a directory.
+
+        The rows are written to a .npy file, so that they can be memory-mapped
+        by load. The rows of a virtual Repository object are written one
+        sampling at a time.
+
+        Args:
+            address (str): The address of a directory. It is created if it
+                does not exist, and files of a previously saved Repository
+                object are replaced.
+
+        """
+        os.makedirs(address, exist_ok=True)
+        # The temporary files are unique to this call, so that threads and
+        # processes can save to the same address at once
+        suffix = '.{}.tmp'.format(uuid.uuid4().hex)
+        rows_address = os.path.join(address, _ROWS_FILE)
+        rows = np.lib.format.open_memmap(rows_address + suffix, mode='w+',
+                                         dtype=self.dtype, shape=self.shape)
+        for rep, block in enumerate(self._blocks()):
+            rows[self._rep_rows(rep)] = block
+        rows.flush()
+        del rows
+        indices_address = os.path.join(address, _SAMPLE_INDICES_FILE)
+        with open(indices_address + suffix, 'wb') as fout:
+            np.save(fout, self._sample_indices)
+        metadata_address = os.path.join(address, _METADATA_FILE)
+        with open(metadata_address + suffix, 'w') as fout:
+            json.dump(self._metadata(), fout, indent=2)
+        # Metadata is replaced last, so it never describes partial rows
+        os.replace(rows_address + suffix, rows_address)
+        os.replace(indices_address + suffix, indices_address)
+        os.replace(metadata_address + suffix, metadata_address)
+
+    @classmethod
+    def load(cls, address, mmap_mode='r'):
+        """Load a Repository object saved by save.
+
+        Args:
+            address (str): The address of a directory created by save.
+            mmap_mode (str): The mode used to memory-map the rows, as in
+                numpy.load. The default 'r' opens them read-only, so that
+                they can be shared by several processes through the page
+                cache. If None, the rows are read into memory.
+
+        Returns:
+            Repository: The loaded Repository object. It is not virtual.
+
+        """
+        with open(os.path.join(address, _METADATA_FILE)) as fin:
+            metadata = json.load(fin)
+        repository = cls.__new__(cls)
+        repository.virtual = False
+        repository.random_state = _seed_from_state(metadata['random_state'])
+        repository._num_genes = metadata['num_genes']
+        repository._sample_indices = np.load(
+            os.path.join(address, _SAMPLE_INDICES_FILE))
+        repository._source = None
+        repository._source_hash = metadata['source_hash']
+        repository._repository = np.load(os.path.join(address, _ROWS_FILE),
+                                         mmap_mode=mmap_mode)
+        repository._means = None
+        repository._variances = None
+        repository._counts = None
+        repository._mean_order = None
+        repository._sorted_means = None
+        repository._sorted_repository = None
+        repository._key = None
+        return repository
+
+    def to_shared_memory(self):
+        """Copy the Repository object to shared memory.
+
+        The rows, or the case expression values and sampled column indices
+        of a virtual Repository object, are copied once, together with the
+        row summaries computed so far. Other processes, e.g. the workers of
+        a process pool, can then attach the Repository object by passing
+        the handle of the returned object to from_shared_memory.
+
+        Returns:
+            shared.SharedExport: An object whose handle attribute can be
+                pickled. The shared memory is released when it is closed,
+                e.g. at the end of a with statement.
+
+        """
+        arrays = {'sample_indices': self._sample_indices}
+        if self._repository is not None:
+            arrays['repository'] = self._repository
+        else:
+            arrays['source'] = self._source
+        if self._means is not None:
+            arrays['means'] = self._means
+            arrays['variances'] = self._variances
+        info = self._metadata()
+        info['virtual'] = self.virtual
+        return shared.SharedExport(arrays, info)
+
+    @classmethod
+    def from_shared_memory(cls, handle):
+        """Attach a Repository object copied to shared memory.
+
+        Args:
+            handle (shared.SharedHandle): The handle of the object returned by
+                to_shared_memory.
+
+        Returns:
+            Repository: A Repository object with the same rows, whose arrays
+                are read-only views of the shared memory.
+
+        Raises:
+            FileNotFoundError: If the shared memory has been released.
+
+        """
+        arrays = shared.attach(handle)
+        repository = cls.__new__(cls)
+        repository.virtual = handle.info['virtual']
+        repository.random_state = _seed_from_state(
+            handle.info['random_state'])
+        repository._num_genes = handle.info['num_genes']
+        repository._sample_indices = arrays['sample_indices']
+        repository._source = arrays.get('source')
+        repository._source_hash = handle.info['source_hash']
+        repository._repository = arrays.get('repository')
+        repository._means = arrays.get('means')
+        repository._variances = arrays.get('variances')
+        repository._counts = None
+        if repository._means is not None:
+            repository._counts = np.full(len(repository),
+                                         repository.shape[1])
+        repository._mean_order = None
+        repository._sorted_means = None
+        repository._sorted_repository = None
+        repository._key = None
+        return repository
+
+    @classmethod
+    def load_or_create(cls, address, case_expression_profile, num_sim_cases,
+                       num_repetitions=1, random_state=None, mmap_mode='r',
+                       dtype=None):
+        """Load a saved Repository object or create and save a new one.
+
+        A Repository object saved at address is loaded if it was built from
+        the same expression values with the same num_sim_cases,
+        num_repetitions and random_state; otherwise, a new Repository object
+        is created and saved at address. A Repository object built without
+        an integer or SeedSequence random_state is never saved, as it cannot
+        be reproduced.
+
+        Args:
+            address (str): The address of a directory.
+            case_expression_profile (ExpressionProfile): Expression data for
+                case samples.
+            num_sim_cases (int): See Repository.
+            num_repetitions (int): See Repository.
+            random_state (int): See Repository.
+            mmap_mode (str): See load.
+            dtype (numpy.dtype): See Repository.
+
+        Returns:
+            Repository: The loaded or created Repository object.
+
+        """
+        if dtype is not None:
+            case_expression_profile = case_expression_profile.astype(dtype)
+        seed_state = _seed_state(random_state)
+        if seed_state is None:
+            return cls(case_expression_profile, num_sim_cases,
+                       num_repetitions=num_repetitions,
+                       random_state=random_state)
+        expected = {'source_hash': cls.fingerprint(case_expression_profile),
+                    'random_state': seed_state,
+                    'num_sim_cases': int(num_sim_cases),
+                    'num_repetitions': max(1, num_repetitions)}
+        try:
+            with open(os.path.join(address, _METADATA_FILE)) as fin:
+                metadata = json.load(fin)
+        except (OSError, ValueError):
+            metadata = {}
+        if all(metadata.get(key) == value for key, value in expected.items()):
+            return cls.load(address, mmap_mode=mmap_mode)
+        repository = cls(case_expression_profile, num_sim_cases,
+                         num_repetitions=num_repetitions,
+                         random_state=random_state)
+        repository._source_hash = expected['source_hash']
+        repository.save(address)
+        return repository
+
+    def _rep_rows(self, rep):
+        """Return the slice of rows built from the rep-th sampling."""
+        return slice(rep * self._num_genes, (rep + 1) * self._num_genes)
+
+    @property
+    def repository(self):
+        """Return the rows of the Repository object as an array.
+
+        For a virtual Repository object, all rows are built on each call.
+
+        Returns:
+            numpy.ndarray: A two dimensional array where each row is a row
+                of the Repository object.
+
+        """
+        if self._repository is not None:
+            return self._repository
+        return np.concatenate([self._source[:, indices]
+                               for indices in self._sample_indices])
+
+    @property
+    def sample_indices(self):
+        """Return the sampled case column indices.
+
+        Returns:
+            numpy.ndarray: An array of shape (num_repetitions, num_sim_cases),
+                where the i-th row contains the indices of the case samples
+                used to build the i-th block of len(case_expression_profile)
+                rows.
+
+        """
+        return self._sample_indices
 
     @property
     def shape(self):
@@ -52,7 +423,149 @@ class Repository(object):
                 the number of rows in the Repository object and the second
                 element is the number of samples.
         """
-        return self.repository.shape
+        return (len(self._sample_indices) * self._num_genes,
+                self._sample_indices.shape[1])
+
+    @property
+    def dtype(self):
+        """Return the data type of the expression values.
+
+        Returns:
+            numpy.dtype: The data type of the expression values.
+
+        """
+        if self._repository is not None:
+            return self._repository.dtype
+        return self._source.dtype
+
+    @property
+    def means(self):
+        """Return the mean of each row.
+
+        The row summaries are computed on first access and cached, as the
+        rows of a Repository object never change.
+
+        Returns:
+            numpy.ndarray: The mean of the expression values in each row.
+
+        """
+        if self._means is None:
+            self._summarize()
+        return self._means
+
+    @property
+    def variances(self):
+        """Return the sample variance (with one degree of freedom) of each row.
+
+        Returns:
+            numpy.ndarray: The variance of the expression values in each row.
+
+        """
+        if self._variances is None:
+            self._summarize()
+        return self._variances
+
+    @property
+    def counts(self):
+        """Return the number of expression values in each row.
+
+        Returns:
+            numpy.ndarray: The number of expression values in each row.
+
+        """
+        if self._counts is None:
+            self._summarize()
+        return self._counts
+
+    def _summarize(self):
+        """Compute and cache the per-row summary statistics."""
+        if self._repository is not None:
+            # Summaries are accumulated in float64 whatever the data type
+            means = np.mean(self._repository, axis=1, dtype=np.float64)
+            variances = np.var(self._repository, axis=1, ddof=1,
+                               dtype=np.float64)
+        else:
+            means = np.empty(len(self))
+            variances = np.empty(len(self))
+            for rep, block in enumerate(self._blocks()):
+                rows = self._rep_rows(rep)
+                means[rows] = np.mean(block, axis=1, dtype=np.float64)
+                variances[rows] = np.var(block, axis=1, ddof=1,
+                                         dtype=np.float64)
+        # The summaries are only set once they are complete, and the means,
+        # on which mean_order depends, last, so that other threads never
+        # see partially computed values
+        self._counts = np.full(len(self), self.shape[1])
+        self._variances = variances
+        self._means = means
+
+    def _blocks(self):
+        """Yield the rows built from each sampling as a two dimensional array.
+        """
+        if self._repository is not None:
+            for rep in range(len(self._sample_indices)):
+                yield self._repository[self._rep_rows(rep)]
+        else:
+            for indices in self._sample_indices:
+                yield self._source[:, indices]
+
+    @property
+    def mean_order(self):
+        """Return the row indices sorted by row mean.
+
+        Returns:
+            numpy.ndarray: Indices of rows in increasing order of their means.
+                Rows with nan means come last.
+
+        """
+        if self._mean_order is None:
+            order = np.argsort(self.means, kind='stable')
+            # The sorted means are set first, so that they are available to
+            # threads that see _mean_order
+            self._sorted_means = self.means[order]
+            self._mean_order = order
+        return self._mean_order
+
+    def rows_in_mean_range(self, low, high):
+        """Find the rows whose mean is in a closed interval.
+
+        Args:
+            low (float): The lower bound of the interval.
+            high (float): The upper bound of the interval.
+
+        Returns:
+            numpy.ndarray: Indices of rows with a mean between low and high
+                (both inclusive), in increasing order of their means. Rows
+                with nan means are never included.
+
+        """
+        start, stop = self.mean_range_positions(low, high)
+        return self.mean_order[start:stop]
+
+    def mean_range_positions(self, low, high):
+        """Locate the rows whose mean is in closed intervals.
+
+        Args:
+            low (numpy.ndarray): The lower bounds of the intervals, or a
+                single lower bound.
+            high (numpy.ndarray): The upper bounds of the intervals, or a
+                single upper bound.
+
+        Returns:
+            tuple: The start and stop positions in mean_order of the rows of
+                each interval, so that rows_in_mean_range(low, high) is
+                mean_order[start:stop]. stop is never less than start.
+
+        """
+        self.mean_order
+        sorted_means = self._sorted_means
+        # Rows with nan means come last and are never included
+        num_valid = np.searchsorted(sorted_means, np.inf, side='right')
+        start = np.minimum(np.searchsorted(sorted_means, low, side='left'),
+                           num_valid)
+        stop = np.minimum(np.searchsorted(sorted_means, high, side='right'),
+                          num_valid)
+        return start, np.maximum(start, stop)
 
     def __len__(self):
         """Return the length of the repository object.
@@ -61,7 +574,7 @@ class Repository(object):
             int: The number of rows in the Repository object.
 
         """
-        return self.repository.shape[0]
+        return self.shape[0]
 
     def __getitem__(self, i):
         """Return a sequence of expression values.
@@ -79,10 +592,50 @@ class Repository(object):
                 (both inclusive).
         """
         if 0 <= i < len(self):
-            return self.repository[i, :]
+            if self._repository is not None:
+                return self._repository[i, :]
+            rep, gene = divmod(i, self._num_genes)
+            return self._source[gene, self._sample_indices[rep]]
         else:
             raise IndexError('Index out of bound.')
 
+    def rows(self, indices):
+        """Return a block of rows.
+
+        Args:
+            indices (array-like): Indices of rows of the Repository object.
+
+        Returns:
+            numpy.ndarray: A two dimensional array, where the i-th row is the
+                row of the Repository object at indices[i].
+
+        """
+        if self._repository is not None:
+            return self._repository[indices, :]
+        reps, genes = np.divmod(np.asarray(indices, dtype=np.intp),
+                                self._num_genes)
+        return self._source[genes[:, np.newaxis], self._sample_indices[reps]]
+
+    def sorted_rows(self, indices):
+        """Return a block of rows, each sorted in increasing order.
+
+        The sorted rows are built once, on first use, and cached. Rows of a
+        virtual Repository object are sorted on each call instead.
+
+        Args:
+            indices (array-like): Indices of rows of the Repository object.
+
+        Returns:
+            numpy.ndarray: A two dimensional array, where the i-th row
+                contains the sorted values of the row at indices[i].
+
+        """
+        if self.virtual is True:
+            return np.sort(self.rows(indices), axis=1)
+        if self._sorted_repository is None:
+            self._sorted_repository = np.sort(self._repository, axis=1)
+        return self._sorted_repository[indices, :]
+
     def __iter__(self):
         """Create an iterator of the repository rows.
 
@@ -90,7 +643,8 @@ class Repository(object):
             iterator: An iterator of the Repository rows.
 
         """
-        return iter(self.repository)
+        for block in self._blocks():
+            yield from block
 
     def __str__(self):
         """A String reporesentation.
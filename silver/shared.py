@@ -0,0 +1,139 @@
+"""This module shares NumPy arrays between processes through shared memory.
+
+An owner process copies arrays to shared memory blocks with SharedExport and
+passes its handle, which is small and can be pickled, to other processes.
+These processes open read-only views of the arrays by name with attach,
+without copying them.
+
+"""
+from collections import namedtuple
+from multiprocessing import shared_memory
+import os
+import weakref
+import numpy as np
+
+
+# The location of an array in a shared memory block
+ArrayHandle = namedtuple('ArrayHandle', ['name', 'shape', 'dtype'])
+# Arrays in shared memory, and other information needed to rebuild an object
+SharedHandle = namedtuple('SharedHandle', ['arrays', 'info'])
+
+
+class _AttachedBlock(shared_memory.SharedMemory):
+    """A shared memory block opened by name.
+
+    NumPy views of the block keep its memory mapped, so the block is only
+    unmapped when both the block and its views are garbage collected.
+
+    """
+
+    def __del__(self):
+        try:
+            self.close()
+        except BufferError:
+            # Views of the block still exist; they keep the memory mapped
+            if getattr(self, '_fd', -1) >= 0:
+                os.close(self._fd)
+                self._fd = -1
+
+
+def _open_block(name):
+    """Open an existing shared memory block without tracking it."""
+    try:
+        return _AttachedBlock(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13, blocks are always registered with the resource
+        # tracker, which is shared with the owner in processes started by
+        # multiprocessing, so the block is still only unlinked by its owner
+        return _AttachedBlock(name=name)
+
+
+def _release(blocks):
+    """Close and unlink shared memory blocks."""
+    for block in blocks:
+        block.close()
+        try:
+            block.unlink()
+        except FileNotFoundError:
+            pass
+    del blocks[:]
+
+
+class SharedExport(object):
+    """Copies of arrays in shared memory blocks owned by this process.
+
+    The blocks are released, i.e. closed and unlinked, by close, at the end
+    of a with statement, or when the SharedExport object is garbage
+    collected. Views attached in other processes remain valid until they are
+    garbage collected, but no new view can be attached afterwards.
+
+    Args:
+        arrays (dict): A dictionary from names to NumPy arrays. Arrays must
+            not contain Python objects.
+        info (dict): Information, which can be pickled, needed to rebuild an
+            object from the arrays.
+
+    Raises:
+        ValueError: If an array contains Python objects.
+
+    """
+
+    def __init__(self, arrays, info=None):
+        self._blocks = []
+        self._finalizer = weakref.finalize(self, _release, self._blocks)
+        handles = {}
+        try:
+            for key, array in arrays.items():
+                array = np.ascontiguousarray(array)
+                if array.dtype.hasobject:
+                    raise ValueError('Arrays containing Python objects '
+                                     'cannot be shared.')
+                block = shared_memory.SharedMemory(create=True,
+                                                   size=max(1, array.nbytes))
+                self._blocks.append(block)
+                view = np.ndarray(array.shape, dtype=array.dtype,
+                                  buffer=block.buf)
+                view[...] = array
+                del view
+                handles[key] = ArrayHandle(block.name, array.shape,
+                                           array.dtype.str)
+        except BaseException:
+            self.close()
+            raise
+        self.handle = SharedHandle(handles, info or {})
+
+    def close(self):
+        """Release the shared memory blocks."""
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def attach(handle):
+    """Open read-only views of arrays shared by a SharedExport object.
+
+    Args:
+        handle (SharedHandle): The handle attribute of a SharedExport object.
+
+    Returns:
+        dict: A dictionary from names to read-only NumPy arrays backed by the
+            shared memory blocks.
+
+    Raises:
+        FileNotFoundError: If the SharedExport object has been released.
+
+    """
+    arrays = {}
+    for key, (name, shape, dtype) in handle.arrays.items():
+        block = _open_block(name)
+        # Unlike numpy.ndarray, numpy.frombuffer holds the buffer of the
+        # block, so the memory stays mapped as long as the array exists
+        array = np.frombuffer(block.buf, dtype=np.dtype(dtype),
+                              count=int(np.prod(shape))).reshape(shape)
+        array.flags.writeable = False
+        arrays[key] = array
+    return arrays
@@ -2,16 +2,28 @@
 
 """
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numbers
+import os
 import numpy as np
 import pandas as pd
+from silver import cache
 from silver.dataset import Dataset
 from silver.exceptions import InvalidContrastException
 from silver.expression_profile import ExpressionProfile
+from silver.instrumentation import SimulationStats
 from silver.repository import Repository
-from silver.dexpress import TTestDExpress
+from silver.dexpress import TTestDExpress, CachedDExpress
 
 
-def read_contrast(address, ctrl_symbol='c', case_symbol='d', sep='\t'):
+# Names of the files in a directory created by write_dataset with binary=True
+_VALUES_FILE = 'values.npy'
+_INDEX_FILE = 'index.npy'
+_COLUMNS_FILE = 'columns.npy'
+
+
+def read_contrast(address, ctrl_symbol='c', case_symbol='d', sep='\t',
+                  cache_dir=None):
     """Read contrast from a file.
 
     Args:
@@ -22,19 +34,24 @@ def read_contrast(address, ctrl_symbol='c', case_symbol='d', sep='\t'):
         case_symbol (str): Symbol used in contrast file for representing
             case samples. Default value is 'd'.
         sep (str): Field separator.  Default value is '\t'.
+        cache_dir (str): Address of a directory for caching the parsed
+            contrast. If None (default), no cache is used.
 
     Returns:
         tuple: A tuple of size two, which contains control indices and
             case indices, respectively.
     """
-    contrast = []
-    with open(address, 'r') as fin:
-        for line in fin:
-            line = line.strip()
-            if line == "":
-                continue
-            contrast.extend([phenotype.strip()
-                             for phenotype in line.split(sep)])
+    if cache_dir is None:
+        contrast = _parse_contrast(address, sep)
+    else:
+        key = cache.file_key(address, reader='contrast', sep=sep)
+        entry = cache.load(cache_dir, key)
+        if entry is None:
+            contrast = _parse_contrast(address, sep)
+            cache.save(cache_dir, key, {'contrast': np.array(contrast,
+                                                             dtype=str)})
+        else:
+            contrast = entry[0]['contrast'].tolist()
     if ctrl_symbol not in contrast:
         raise InvalidContrastException('contrast must contain ctrl_symbol' +
                                        ' ({}).'.format(ctrl_symbol))
@@ -46,26 +63,146 @@ def read_contrast(address, ctrl_symbol='c', case_symbol='d', sep='\t'):
     return list(ctrl_col_indices), list(case_col_indices), list(contrast)
 
 
+def _parse_contrast(address, sep):
+    """Parse the phenotypes of a contrast file into a list."""
+    contrast = []
+    with open(address, 'r') as fin:
+        for line in fin:
+            line = line.strip()
+            if line == "":
+                continue
+            contrast.extend([phenotype.strip()
+                             for phenotype in line.split(sep)])
+    return contrast
+
+
 ###############################################################################
-def read_profile(address, **kwargs):
+def read_profile(address, columns=None, dtype=None, chunksize=None,
+                 cache_dir=None, **kwargs):
     """ Read an expression profile.
 
     Args:
         address (str): Address of expression profile.
+        columns (list): The sample columns to be read, given as names or as
+            positions among the sample columns (the index column is not
+            counted). Other columns are not parsed. If None (default), all
+            columns are read.
+        dtype (numpy.dtype): The data type of the expression values, e.g.
+            numpy.float32. If None (default), it is inferred by pandas.
+        chunksize (int): If given, the file is parsed chunksize rows at a
+            time, which bounds the memory used by the parser. The rows are
+            counted first, and each chunk is copied into the array of
+            expression values.
+        cache_dir (str): Address of a directory for caching the parsed
+            profile. The cache entry is keyed by the content of the file and
+            the parsing arguments, and its expression values are
+            memory-mapped copy-on-write when it is loaded. If None (default),
+            no cache is used.
         **kwargs: The as kwargs in pandas.read_csv.
 
     Returns:
         ExpressionProfile: The expression profile read from the address.
 
+    Raises:
+        IndexError: If a position in columns is out of bound.
+        ValueError: If a name in columns is not a column of the profile.
+
     """
-    df = pd.read_csv(address, **kwargs)
-    df.index = [str(gene_id) for gene_id in df.index]
-    return ExpressionProfile(df)
+    if cache_dir is not None:
+        if columns is not None:
+            columns = [int(col) if isinstance(col, numbers.Integral) else col
+                       for col in columns]
+        key = cache.file_key(address, reader='profile', columns=columns,
+                             dtype=None if dtype is None
+                             else np.dtype(dtype).str, **kwargs)
+        entry = cache.load(cache_dir, key, mmap=('values',))
+        if entry is not None:
+            arrays, info = entry
+            index = pd.Index(arrays['index'], name=info['index_name'])
+            return ExpressionProfile.from_array(arrays['values'], index,
+                                                arrays['columns'])
+        profile = read_profile(address, columns=columns, dtype=dtype,
+                               chunksize=chunksize, **kwargs)
+        index = profile.profile.index
+        cache.save(cache_dir, key,
+                   {'values': profile.data(copy=False),
+                    'index': np.asarray(index, dtype=str),
+                    'columns': np.asarray(profile.columns, dtype=str)},
+                   {'index_name': index.name})
+        return profile
+    if columns is None and dtype is None and chunksize is None:
+        df = pd.read_csv(address, **kwargs)
+        df.index = df.index.astype(str)
+        return ExpressionProfile(df)
+    index_col = kwargs.pop('index_col', None)
+    header = pd.read_csv(address, nrows=0, index_col=index_col, **kwargs)
+    samples = list(header.columns)
+    if columns is None:
+        names = samples
+    else:
+        names = []
+        for col in columns:
+            if isinstance(col, numbers.Integral):
+                if not 0 <= col < len(samples):
+                    raise IndexError('Index out of bound error.')
+                col = samples[col]
+            elif col not in samples:
+                raise ValueError('{} is not a column of the '
+                                 'profile.'.format(col))
+            names.append(col)
+    usecols = list(names)
+    if index_col is not None:
+        # Columns are selected by position, as the header cell of the index
+        # column may be blank, e.g. in files written by DataFrame.to_csv
+        file_columns = list(pd.read_csv(address, nrows=0, **kwargs).columns)
+        if isinstance(index_col, numbers.Integral):
+            index_position = index_col
+        else:
+            index_position = file_columns.index(index_col)
+        positions = {name: i for i, name in enumerate(file_columns)
+                     if i != index_position}
+        usecols = sorted({index_position} |
+                         {positions[name] for name in names})
+        # index_col is relative to the selected columns
+        index_col = usecols.index(index_position)
+    num_rows = None
+    if chunksize is not None:
+        # The rows are counted by parsing a single column, so that the
+        # chunks are copied into one array instead of being concatenated
+        num_rows = sum(len(chunk) for chunk in pd.read_csv(
+            address, usecols=usecols[:1] or [0], chunksize=chunksize,
+            **kwargs))
+    if dtype is not None:
+        kwargs['dtype'] = {name: dtype for name in names}
+    chunks = pd.read_csv(address, usecols=usecols, index_col=index_col,
+                         chunksize=chunksize, **kwargs)
+    if chunksize is None:
+        chunks = [chunks]
+    values, index, start = None, [], 0
+    for chunk in chunks:
+        chunk_values = chunk[names].to_numpy(dtype=dtype)
+        if num_rows is None:
+            values = chunk_values
+        else:
+            if values is None:
+                values = np.empty((num_rows, len(names)),
+                                  dtype=np.float64 if
+                                  chunk_values.dtype.kind in 'biu'
+                                  else chunk_values.dtype)
+            values[start:start + len(chunk_values)] = chunk_values
+            start += len(chunk_values)
+        index.append(chunk.index.astype(str))
+    if len(index) == 0:
+        return ExpressionProfile.from_array(
+            np.empty((0, len(names)), dtype=dtype),
+            header.index.astype(str), names)
+    return ExpressionProfile.from_array(values, index[0].append(index[1:]),
+                                        names)
 
 
 ###############################################################################
 def read_fold_change_file(address, id_col_name, lower_bound_col,
-                          upper_bound_col, sep='\t'):
+                          upper_bound_col, sep='\t', cache_dir=None):
     """Read fold change file to a dictionary.
 
     Args:
@@ -79,21 +216,225 @@ def read_fold_change_file(address, id_col_name, lower_bound_col,
             upper bounds for fold changes.
         sep (str): The field separator in fold change file.
             The default is '\t'.
+        cache_dir (str): Address of a directory for caching the parsed
+            file. If None (default), no cache is used.
 
        Returns:
         dict: A dictionary where gene names/ids are keys and tuples of
             (lower bound, upper bound) for gene fold changes as values.
 
     """
+    if cache_dir is not None:
+        key = cache.file_key(address, reader='fold_change',
+                             columns=(id_col_name, lower_bound_col,
+                                      upper_bound_col), sep=sep)
+        entry = cache.load(cache_dir, key)
+        if entry is not None:
+            arrays = entry[0]
+            return dict(zip(arrays['ids'].tolist(),
+                            zip(arrays['lower'].tolist(),
+                                arrays['upper'].tolist())))
     df = pd.read_csv(address, index_col=False, sep=sep)
     df = df[[id_col_name, lower_bound_col, upper_bound_col]]
     df[id_col_name] = [str(e) for e in df[id_col_name]]
     gfc = {}
     for _, row in df.iterrows():
         gfc[row[id_col_name]] = (row[lower_bound_col], row[upper_bound_col])
+    if cache_dir is not None:
+        cache.save(cache_dir, key,
+                   {'ids': np.array(list(gfc.keys()), dtype=str),
+                    'lower': np.array([fc[0] for fc in gfc.values()],
+                                      dtype=float),
+                    'upper': np.array([fc[1] for fc in gfc.values()],
+                                      dtype=float)})
     return gfc
 
 
+###############################################################################
+def write_dataset(ctrls, cases, profile_address, contrast_address=None,
+                  ctrl_symbol='c', case_symbol='d', sep='\t', binary=False,
+                  chunk_size=10000):
+    """Write simulated controls and cases as one expression profile.
+
+    The expression values of ctrls and cases are written side by side, one
+    chunk of genes at a time, so the two profiles are never concatenated in
+    memory, and the samples of profiles created by
+    ExpressionProfile.samples are only selected one chunk at a time. As text, the written profile is identical to
+    ctrls.concat(cases).profile.to_csv(profile_address, sep=sep).
+
+    Args:
+        ctrls (ExpressionProfile): The simulated controls.
+        cases (ExpressionProfile): The simulated cases, with the same genes
+            in the same order as ctrls.
+        profile_address (str): Address of the written expression profile. If
+            binary is True, it is the address of a directory that is created
+            if it does not exist; it can be read by load_profile.
+        contrast_address (str): If given, a contrast file for the written
+            profile is written to this address. Default is None.
+        ctrl_symbol (str): The string used to represent a control sample
+            in the contrast file. The default is 'c'.
+        case_symbol (str): The string used to represent a case sample
+            in the contrast file. The default is 'd'.
+        sep (str): Field separator of the profile and the contrast file.
+            Default value is '\t'.
+        binary (bool): If True, the expression values are written to a .npy
+            file, and the gene names/IDs and sample names to two other .npy
+            files. Default is False.
+        chunk_size (int): The number of genes written at a time. The default
+            is 10000.
+
+    Raises:
+        ValueError: If ctrls and cases have different or unaligned genes, if
+            their sample names are not different from each other, or if
+            chunk_size is not a positive integer.
+
+    """
+    if list(ctrls.keys()) != list(cases.keys()):
+        raise ValueError('Profiles with unequal (different or unaligned) row '
+                         'names cannot be concatenated.')
+    if set(ctrls.columns) & set(cases.columns) != set():
+        raise ValueError('Profile sample names must be unique after '
+                         'concatenation.')
+    if chunk_size < 1:
+        raise ValueError('chunk_size must be a positive integer.')
+    index = ctrls.index
+    columns = list(ctrls.columns) + list(cases.columns)
+    num_ctrls = len(ctrls.columns)
+    chunks = zip(ctrls.iter_values(chunk_size), cases.iter_values(chunk_size))
+    if binary is True:
+        os.makedirs(profile_address, exist_ok=True)
+        values = np.lib.format.open_memmap(
+            os.path.join(profile_address, _VALUES_FILE), mode='w+',
+            dtype=np.result_type(ctrls.dtype, cases.dtype),
+            shape=(len(index), len(columns)))
+        for start, (ctrl_chunk, case_chunk) in zip(
+                range(0, len(index), chunk_size), chunks):
+            values[start:start + len(ctrl_chunk), :num_ctrls] = ctrl_chunk
+            values[start:start + len(ctrl_chunk), num_ctrls:] = case_chunk
+        values.flush()
+        del values
+        np.save(os.path.join(profile_address, _INDEX_FILE),
+                np.asarray(index, dtype=str))
+        np.save(os.path.join(profile_address, _COLUMNS_FILE),
+                np.asarray(columns, dtype=str))
+    else:
+        with open(profile_address, 'w', newline='') as fout:
+            start = 0
+            for ctrl_chunk, case_chunk in chunks:
+                stop = start + len(ctrl_chunk)
+                chunk = pd.DataFrame(np.hstack([ctrl_chunk, case_chunk]),
+                                     index=index[start:stop], columns=columns)
+                chunk.to_csv(fout, sep=sep, header=start == 0)
+                start = stop
+            if start == 0:
+                # Write the header of a profile without genes
+                pd.DataFrame(np.empty((0, len(columns))), index=index,
+                             columns=columns).to_csv(fout, sep=sep)
+    if contrast_address is not None:
+        with open(contrast_address, 'w') as fout:
+            fout.write('{}\n'.format(sep.join(
+                [ctrl_symbol] * num_ctrls +
+                [case_symbol] * len(cases.columns))))
+
+
+def load_profile(address, mmap_mode='c'):
+    """Load an expression profile written by write_dataset with binary=True.
+
+    Args:
+        address (str): The address of a directory written by write_dataset.
+        mmap_mode (str): The mode used to memory-map the expression values,
+            as in numpy.load. The default 'c' maps them copy-on-write, so
+            that modifying the profile never modifies the file. If None, the
+            values are read into memory.
+
+    Returns:
+        ExpressionProfile: The loaded expression profile.
+
+    """
+    values = np.load(os.path.join(address, _VALUES_FILE), mmap_mode=mmap_mode)
+    index = np.load(os.path.join(address, _INDEX_FILE))
+    columns = np.load(os.path.join(address, _COLUMNS_FILE))
+    return ExpressionProfile.from_array(values, index, columns.tolist())
+
+
+###############################################################################
+def _read_samples(profile_address, contrast_address, profile_id_col_name,
+                  ctrl_symbol, case_symbol, profile_sep, contrast_sep,
+                  profile_chunksize, cache_dir, dtype, stats):
+    """Read the control and case samples of an expression profile.
+
+    Returns:
+        tuple: The profile of the control and case samples, and the
+            positions of control and case samples in it.
+
+    """
+    # Read contrast from a file
+    with stats.stage('read_contrast'):
+        temp = read_contrast(contrast_address, ctrl_symbol=ctrl_symbol,
+                             case_symbol=case_symbol, sep=contrast_sep,
+                             cache_dir=cache_dir)
+    ctrl_indices, case_indices, contrast = temp
+    # Read the control and case samples of the original expression profile
+    sample_indices = sorted(set(ctrl_indices) | set(case_indices))
+    with stats.stage('read_profile'):
+        profile = read_profile(profile_address,
+                               columns=sample_indices,
+                               dtype=dtype,
+                               chunksize=profile_chunksize,
+                               cache_dir=cache_dir,
+                               sep=profile_sep,
+                               index_col=profile_id_col_name)
+    positions = {index: i for i, index in enumerate(sample_indices)}
+    ctrl_indices = [positions[index] for index in ctrl_indices]
+    case_indices = [positions[index] for index in case_indices]
+    return profile, ctrl_indices, case_indices
+
+
+def _read_fold_changes(gene_fc_address, fc_id_col_name,
+                       lower_bound_col_name, upper_bound_col_name,
+                       fold_change_sep, cache_dir, stats):
+    """Read fold change information from a file."""
+    with stats.stage('read_fold_change'):
+        return read_fold_change_file(gene_fc_address, fc_id_col_name,
+                                     lower_bound_col_name,
+                                     upper_bound_col_name,
+                                     sep=fold_change_sep,
+                                     cache_dir=cache_dir)
+
+
+def _load_inputs(profile_address, contrast_address, gene_fc_address,
+                 fc_id_col_name, lower_bound_col_name, upper_bound_col_name,
+                 profile_id_col_name, ctrl_symbol, case_symbol, profile_sep,
+                 contrast_sep, fold_change_sep, profile_chunksize, cache_dir,
+                 dtype, stats):
+    """Read the input files of simulate concurrently.
+
+    The expression profile depends on the contrast, so they are read one
+    after the other while the fold change file is read in another thread.
+    Errors are raised in the order in which the files were read
+    sequentially: the contrast, the expression profile, then the fold change
+    file.
+
+    Returns:
+        tuple: The profile of the control and case samples, the positions of
+            control and case samples in it, and the fold changes returned by
+            read_fold_change_file.
+
+    """
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        samples = executor.submit(
+            _read_samples, profile_address, contrast_address,
+            profile_id_col_name, ctrl_symbol, case_symbol, profile_sep,
+            contrast_sep, profile_chunksize, cache_dir, dtype, stats)
+        fold_changes = executor.submit(
+            _read_fold_changes, gene_fc_address, fc_id_col_name,
+            lower_bound_col_name, upper_bound_col_name, fold_change_sep,
+            cache_dir, stats)
+        profile, ctrl_indices, case_indices = samples.result()
+        gfc = fold_changes.result()
+    return profile, ctrl_indices, case_indices, gfc
+
+
 ###############################################################################
 def simulate(profile_address=None,
              contrast_address=None,
@@ -112,7 +453,14 @@ def simulate(profile_address=None,
              fold_change_sep='\t',
              alpha=0.05,
              sampling_with_replacement=False,
-             random_state=0):
+             random_state=0,
+             virtual_repository=False,
+             repository_address=None,
+             profile_chunksize=None,
+             cache_dir=None,
+             dtype=None,
+             return_stats=False,
+             dexpress_cache=None):
     """
 
     Args:
@@ -157,47 +505,153 @@ def simulate(profile_address=None,
         contrast_sep (str): Field separator.  Default value is '\t'.
         fold_change_sep (str): Field separator.  Default value is '\t'.
         alpha (float): Significance level. The default is 0.05.
-        random_state (int): The default is 0.
+        random_state (int): A seed, a numpy.random.SeedSequence, or a
+            numpy.random.Generator, for the random numbers drawn by the
+            simulation. The default is 0.
         sampling_with_replacement (bool): True for using sampling with
             replacement and False otherwise. Default is False.
+        virtual_repository (bool): True for building the repository rows on
+            demand instead of copying them, which bounds the memory used by
+            large num_repository_reps. Default is False.
+        repository_address (str): Address of a directory where the
+            repository is saved, so that later calls with the same case
+            samples, num_simulated_cases, num_repository_reps and
+            random_state load it memory-mapped instead of rebuilding it.
+            If given, virtual_repository is ignored. Default is None.
+        profile_chunksize (int): If given, the expression profile is parsed
+            profile_chunksize rows at a time. Only the columns of control and
+            case samples are parsed in any case. Default is None.
+        cache_dir (str): Address of a directory where the parsed input files
+            are cached, so that later calls with the same files skip
+            parsing them. Default is None.
+        dtype (numpy.dtype): The floating point data type of the expression
+            values, e.g. numpy.float32 to halve the memory used by the
+            profiles and the repository. Test statistics are computed in
+            float64 in any case. If None (default), float64 is used.
+        return_stats (bool): If True, a SimulationStats object that records
+            the duration of each stage and the search effort of every
+            differentially expressed gene is returned as well. The genes
+            are differentially expressed in a batch, so stats records the
+            latency of the batch rather than per-gene latencies. The fold
+            change file is read while the contrast and the expression profile
+            are read, so the read_fold_change stage overlaps with the
+            read_contrast and read_profile stages; load_inputs is the
+            duration of reading all inputs. The default is False.
+        dexpress_cache (DExpressCache): If given, the repository rows that
+            meet the differential expression criteria for each gene are
+            cached in dexpress_cache, so that later calls with the same
+            repository, controls and fold changes skip searching them. The
+            simulated values follow the same distribution, but they are
+            different from those obtained without a cache. Default is None.
+
+    Returns:
+        tuple: The simulated controls and the simulated cases as
+            ExpressionProfile objects, followed by a SimulationStats object if
+            return_stats is True.
     """
-    #Set random seed
-    np.random.seed(random_state)
+    # Create the random number generator of this simulation
+    rng = np.random.default_rng(random_state)
     #Make sure that information about input file has been entered
     msg = 'Information about input files must be provided.'
     assert None not in {profile_address, contrast_address, gene_fc_address,
                         fc_id_col_name, lower_bound_col_name,
                         upper_bound_col_name, num_simulated_ctrls,
                         num_simulated_cases, profile_id_col_name}, msg
-    # Read contrast from a file
-    temp = read_contrast(contrast_address, ctrl_symbol=ctrl_symbol,
-                         case_symbol=case_symbol, sep=contrast_sep)
-    ctrl_indices, case_indices, contrast = temp
-    # Read the original expression profile from a file
-    profile = read_profile(profile_address,
-                           sep=profile_sep,
-                           index_col=profile_id_col_name)
-    # Read fold change information from a file
-    gfc = read_fold_change_file(gene_fc_address, fc_id_col_name,
-                                lower_bound_col_name, upper_bound_col_name,
-                                sep=fold_change_sep)
+    stats = SimulationStats()
+    # Read the input files; the fold change file is read while the contrast
+    # and the expression profile are read
+    with stats.stage('load_inputs'):
+        profile, ctrl_indices, case_indices, gfc = _load_inputs(
+            profile_address, contrast_address, gene_fc_address,
+            fc_id_col_name, lower_bound_col_name, upper_bound_col_name,
+            profile_id_col_name, ctrl_symbol, case_symbol, profile_sep,
+            contrast_sep, fold_change_sep, profile_chunksize, cache_dir,
+            dtype, stats)
     # Instantiate a Dataset object
-    dataset = Dataset(profile.samples(ctrl_indices),
-                      profile.samples(case_indices))
+    # Both share the expression values of profile
+    ctrls = profile.samples(ctrl_indices)
+    cases = profile.samples(case_indices)
+    dataset = Dataset(ctrls, cases, random_state=rng)
     # Generate simulated controls and a replicates (no differential expression)
-    sim_ctrls, sim_cases = dataset.make_replicates(num_simulated_ctrls, num_simulated_cases,
-                                                   replace=sampling_with_replacement)
+    with stats.stage('make_replicates'):
+        sim_ctrls, sim_cases = dataset.make_replicates(
+            num_simulated_ctrls, num_simulated_cases,
+            replace=sampling_with_replacement)
     _, num_ctrls = sim_ctrls.shape
     _, num_cases = sim_cases.shape
-    sim_ctrls.profile.columns = [f'C{i}' for i in range(1, num_ctrls + 1)]
-    sim_cases.profile.columns = [f'T{i}' for i in range(1, num_cases + 1)]
+    sim_ctrls.columns = [f'C{i}' for i in range(1, num_ctrls + 1)]
+    sim_cases.columns = [f'T{i}' for i in range(1, num_cases + 1)]
     # Assemble a repository
-    repository = Repository(profile.samples(case_indices), num_simulated_cases,
-                            num_repetitions=num_repository_reps,
-                            random_state=random_state)
+    with stats.stage('repository'):
+        if repository_address is None:
+            repository = Repository(cases,
+                                    num_simulated_cases,
+                                    num_repetitions=num_repository_reps,
+                                    random_state=random_state,
+                                    virtual=virtual_repository)
+        else:
+            repository = Repository.load_or_create(
+                repository_address, cases,
+                num_simulated_cases, num_repetitions=num_repository_reps,
+                random_state=random_state)
     # Create a DExpress object
-    dexpress_obj = TTestDExpress(repository, alpha=alpha)
+    if dexpress_cache is None:
+        dexpress_obj = TTestDExpress(repository, alpha=alpha,
+                                     random_state=rng, stats=stats)
+    else:
+        dexpress_obj = CachedDExpress(TTestDExpress(repository, alpha=alpha),
+                                      cache=dexpress_cache, random_state=rng,
+                                      stats=stats)
     # Apply differential expression
-    dataset.diff_express(sim_ctrls, sim_cases, gfc, dexpress_obj)
+    with stats.stage('diff_express'):
+        dataset.diff_express(sim_ctrls, sim_cases, gfc, dexpress_obj)
+    if return_stats is True:
+        return sim_ctrls, sim_cases, stats
     return sim_ctrls, sim_cases
 
+
+###############################################################################
+def _simulate_task(kwargs):
+    """Run simulate with keyword arguments; used by simulate_many."""
+    return simulate(**kwargs)
+
+
+###############################################################################
+def simulate_many(params, random_state=0, num_workers=None):
+    """Run several simulations, possibly in parallel.
+
+    Each simulation gets its own numpy.random.SeedSequence, spawned from
+    numpy.random.SeedSequence(random_state), so that the streams of the
+    simulations are independent, and the results only depend on params and
+    random_state and not on the number of workers or the order in which
+    simulations are scheduled.
+
+    Args:
+        params (list): A sequence of dictionaries, each containing the
+            keyword arguments of simulate for one simulation, except
+            random_state.
+        random_state (int): The entropy of the SeedSequence from which the
+            seed of each simulation is spawned. The default is 0.
+        num_workers (int): The number of worker processes. If None, the
+            number of CPUs is used. If 1, simulations are run in the current
+            process.
+
+    Returns:
+        list: The (simulated controls, simulated cases) tuples returned by
+            simulate, in the order of params.
+
+    Raises:
+        ValueError: If a dictionary in params contains random_state.
+
+    """
+    params = [dict(kwargs) for kwargs in params]
+    if any('random_state' in kwargs for kwargs in params):
+        raise ValueError('random_state is set by simulate_many and must not '
+                         'be in params.')
+    children = np.random.SeedSequence(random_state).spawn(len(params))
+    for kwargs, child in zip(params, children):
+        kwargs['random_state'] = child
+    if num_workers == 1:
+        return [_simulate_task(kwargs) for kwargs in params]
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        return list(executor.map(_simulate_task, params))
@@ -48,6 +48,60 @@ class TestDataset(unittest.TestCase):
             self.assertTrue(set(val).issubset(set(self.ctrl_profile[i])))
             self.assertEqual(len(val), num_sim_cases)
 
+    def test_make_replicates_random_state(self):
+        dataset = Dataset(self.ctrl_profile, self.case_profile)
+        global_state = np.random.get_state()[1].copy()
+        for replace in [False, True]:
+            ctrls1, cases1 = dataset.make_replicates(2, 3, replace=replace,
+                                                     random_state=11)
+            ctrls2, cases2 = dataset.make_replicates(2, 3, replace=replace,
+                                                     random_state=11)
+            self.assertListEqual(ctrls1.columns, ctrls2.columns)
+            self.assertListEqual(cases1.columns, cases2.columns)
+        np.testing.assert_array_equal(np.random.get_state()[1], global_state)
+        dataset1 = Dataset(self.ctrl_profile, self.case_profile,
+                           random_state=5)
+        dataset2 = Dataset(self.ctrl_profile, self.case_profile,
+                           random_state=np.random.default_rng(5))
+        for _ in range(3):
+            ctrls1, _ = dataset1.make_replicates(3, 3)
+            ctrls2, _ = dataset2.make_replicates(3, 3)
+            self.assertListEqual(ctrls1.columns, ctrls2.columns)
+
+    def test_replicate_indices(self):
+        dataset = Dataset(self.ctrl_profile, self.case_profile,
+                          random_state=0)
+        ctrls, cases = dataset.replicate_indices(50, 2, 3)
+        self.assertEqual((ctrls.shape, cases.shape), ((50, 2), (50, 3)))
+        for row in np.hstack([ctrls, cases]):
+            self.assertEqual(len(set(row)), 5)
+        self.assertTrue(np.all((ctrls >= 0) & (ctrls < self.num_ctrls)))
+        ctrls, cases = dataset.replicate_indices(50, 4, 4, replace=True)
+        self.assertEqual((ctrls.shape, cases.shape), ((50, 4), (50, 4)))
+        with self.assertRaises(ValueError):
+            dataset.replicate_indices(2, 4, 4)
+
+    def test_make_replicate_batch(self):
+        dataset = Dataset(self.ctrl_profile, self.case_profile)
+        ctrl_indices, case_indices = dataset.replicate_indices(
+            4, 2, 3, random_state=3)
+        replicates = dataset.make_replicate_batch(4, 2, 3, random_state=3)
+        self.assertEqual(len(replicates), 4)
+        for (ctrls, cases), ctrl_row, case_row in zip(replicates,
+                                                      ctrl_indices,
+                                                      case_indices):
+            np.testing.assert_array_equal(
+                ctrls.data(), self.ctrl_profile.data()[:, ctrl_row])
+            np.testing.assert_array_equal(
+                cases.data(), self.ctrl_profile.data()[:, case_row])
+        ctrl_stack, case_stack = dataset.make_replicate_batch(
+            4, 2, 3, random_state=3, stacked=True)
+        self.assertEqual(ctrl_stack.shape, (4, 5, 2))
+        self.assertEqual(case_stack.shape, (4, 5, 3))
+        for i, (ctrls, cases) in enumerate(replicates):
+            np.testing.assert_array_equal(ctrl_stack[i], ctrls.data())
+            np.testing.assert_array_equal(case_stack[i], cases.data())
+
     def test_diff_express(self):
         # Instantiate the Dataset object
         num_sim_ctrls, num_sim_cases = 3, 3
@@ -1,15 +1,20 @@
+import pickle
 import unittest
 import numpy as np
 import pandas as pd
 from silver.repository import Repository
-from silver.dexpress import TTestDExpress
+from scipy import stats
+from silver.dexpress import TTestDExpress, WilcoxonRankSumDExpress
+from silver.dexpress import FoldChangeDExpress
+from silver.dexpress import CachedDExpress, DExpressCache
+from silver.dexpress import _ranksums_rows
 from silver.expression_profile import ExpressionProfile
 from silver.exceptions import NonExistingExpressionException
+from silver.exceptions import InvalidLogFoldChangeValue
 
 
 class TestTTestDExpress(unittest.TestCase):
     def setUp(self):
-        np.random.seed(213456)
         # Read the expression dataset
         address = 'test/data/dummy_expression.txt'
         data = ExpressionProfile(pd.read_csv(address, sep='\t', index_col='ID'))
@@ -29,7 +34,8 @@ class TestTTestDExpress(unittest.TestCase):
                                      random_state=123456)
         alpha = 0.05
 
-        self.ttest_dexpress = TTestDExpress(self.repository, alpha)
+        self.ttest_dexpress = TTestDExpress(self.repository, alpha,
+                                            random_state=213456)
 
     def test_log_fold_change_of_1(self):
         ctrl_expression = [1.12, 1.13, 0.97]
@@ -74,6 +80,272 @@ class TestTTestDExpress(unittest.TestCase):
         self.assertTrue(np.mean(expression) >= np.mean(ctrl_expression) + lower)
         self.assertTrue(np.mean(expression) <= np.mean(ctrl_expression) + upper)
 
+    def test_block_scan_matches_row_scan(self):
+        # Objects with the same random_state draw the same shuffles, and
+        # without shuffling, both scans return the first passing row
+        fold_changes = [(0.5, 1.8), (-1.5, -0.5), (-2.5, -1.5), (1.0, 1.5)]
+        for shuffle in (True, False):
+            row_dexpress = TTestDExpress(self.repository, 0.05,
+                                         block_size=None, random_state=7)
+            block_dexpress = TTestDExpress(self.repository, 0.05,
+                                           block_size=2, random_state=7)
+            for gene in self.ctrl_profile.keys():
+                ctrl_expression = self.ctrl_profile.get(gene)[:3]
+                for fold_change in fold_changes:
+                    expected = row_dexpress(ctrl_expression, fold_change,
+                                            shuffle=shuffle)
+                    result = block_dexpress(ctrl_expression, fold_change,
+                                            shuffle=shuffle)
+                    np.testing.assert_array_equal(result, expected)
+
+    def test_nan_rows(self):
+        values = np.array([[1.0, np.nan, 1.2], [1.9, 2.1, 2.0],
+                           [2.0, 2.05, 1.95]])
+        profile = ExpressionProfile.from_array(values, ['a', 'b', 'c'],
+                                               ['x', 'y', 'z'])
+        repository = Repository(profile, num_sim_cases=3, random_state=0)
+        ctrl_expression = [1.0, 1.05, 0.95]
+        for block_size in (None, 2):
+            dexpress = TTestDExpress(repository, 0.05, block_size=block_size,
+                                     random_state=0)
+            for _ in range(5):
+                result = dexpress(ctrl_expression, (0.5, 1.5), force=False)
+                self.assertFalse(np.any(np.isnan(result)))
+            with self.assertRaises(NonExistingExpressionException):
+                dexpress(ctrl_expression, (-1.5, -0.5), force=False)
+        rows, _ = dexpress.passing_rows(ctrl_expression, (0.5, 1.5))
+        self.assertTrue(np.all(np.isfinite(repository.means[rows])))
+
+    def test_batch(self):
+        ctrl_expressions = np.array([[1.12, 1.13, 0.97],
+                                     [1.95, 1.97, 2.18],
+                                     [1.05, 1.17, 0.38]])
+        fold_changes = [(0.5, 1.8), (-1.5, -0.5), (-2.5, -1.5)]
+        cases, expressed = self.ttest_dexpress.batch(ctrl_expressions,
+                                                     fold_changes,
+                                                     force=False)
+        self.assertListEqual(list(expressed), [True, True, False])
+        self.assertTrue(set(cases[0]).issubset(set(self.case_profile.get('b'))))
+        self.assertTrue(set(cases[1]).issubset(set(self.case_profile.get('a'))))
+        np.testing.assert_array_equal(cases[2], ctrl_expressions[2])
+        cases, expressed = self.ttest_dexpress.batch(ctrl_expressions,
+                                                     fold_changes)
+        self.assertTrue(all(expressed))
+        self.assertTrue(np.mean(cases[2]) <= np.mean(ctrl_expressions[2]))
+
+    def test_passing_rows(self):
+        row_dexpress = TTestDExpress(self.repository, 0.05, block_size=None)
+        fold_changes = [(0.5, 1.8), (-1.5, -0.5), (-2.5, -1.5), (1.0, 1.5)]
+        for gene in self.ctrl_profile.keys():
+            ctrl_expression = self.ctrl_profile.get(gene)[:3]
+            for fold_change in fold_changes:
+                rows, _ = self.ttest_dexpress.passing_rows(ctrl_expression,
+                                                           fold_change)
+                if len(rows) == 0:
+                    with self.assertRaises(NonExistingExpressionException):
+                        row_dexpress(ctrl_expression, fold_change,
+                                     force=False)
+                    continue
+                expected = row_dexpress(ctrl_expression, fold_change,
+                                        shuffle=False)
+                np.testing.assert_array_equal(self.repository[rows[0]],
+                                              expected)
+
+    def test_batch_matches_passing_rows(self):
+        genes = list(self.ctrl_profile.keys())
+        ctrl_expressions = np.array([self.ctrl_profile.get(gene)[:3]
+                                     for gene in genes] * 4)
+        fold_changes = [fold_change
+                        for fold_change in [(0.5, 1.8), (-1.5, -0.5),
+                                            (-2.5, -1.5), (1.0, 1.5)]
+                        for _ in genes]
+        cases, expressed = self.ttest_dexpress.batch(
+            ctrl_expressions, fold_changes, force=False, shuffle=False)
+        for i, fold_change in enumerate(fold_changes):
+            rows, _ = self.ttest_dexpress.passing_rows(ctrl_expressions[i],
+                                                       fold_change)
+            self.assertEqual(expressed[i], len(rows) > 0)
+            if len(rows) > 0:
+                np.testing.assert_array_equal(cases[i],
+                                              self.repository[rows[0]])
+
+    def test_batch_float32(self):
+        repository = Repository(self.case_profile, num_sim_cases=3,
+                                random_state=123456, dtype=np.float32)
+        dexpress = TTestDExpress(repository, 0.05, random_state=213456)
+        ctrl_expressions = np.array([[1.12, 1.13, 0.97],
+                                     [1.95, 1.97, 2.18]], dtype=np.float32)
+        fold_changes = [(0.5, 1.8), (-1.5, -0.5)]
+        cases, expressed = dexpress.batch(ctrl_expressions, fold_changes)
+        self.assertEqual(cases.dtype, np.float32)
+        expected, _ = self.ttest_dexpress.batch(ctrl_expressions,
+                                                fold_changes)
+        np.testing.assert_array_almost_equal(cases, expected, decimal=6)
+
+    def test_batch_invalid_fold_changes(self):
+        ctrl_expressions = np.array([[1.12, 1.13, 0.97]])
+        with self.assertRaises(TypeError):
+            self.ttest_dexpress.batch(ctrl_expressions, [(0.5, 1.0, 1.5)])
+        with self.assertRaises(InvalidLogFoldChangeValue):
+            self.ttest_dexpress.batch(ctrl_expressions, [(1.5, 0.5)])
+        with self.assertRaises(InvalidLogFoldChangeValue):
+            self.ttest_dexpress.batch(ctrl_expressions, [(-0.5, 0.5)])
+
+
+class TestFoldChangeDExpress(unittest.TestCase):
+    def test_batch_matches_call(self):
+        ctrl_expressions = np.array([[1.12, 1.13, 0.97],
+                                     [1.95, 1.97, 2.18]])
+        fold_changes = [(0.5, 1.8), (-1.5, -0.5)]
+        fc_dexpress = FoldChangeDExpress(None, 0.05, random_state=3)
+        expected = [fc_dexpress(expressions, fold_change)
+                    for expressions, fold_change in zip(ctrl_expressions,
+                                                        fold_changes)]
+        fc_dexpress = FoldChangeDExpress(None, 0.05, random_state=3)
+        cases, expressed = fc_dexpress.batch(ctrl_expressions, fold_changes)
+        np.testing.assert_array_almost_equal(cases, expected)
+        self.assertTrue(all(expressed))
+
+
+class TestWilcoxonRankSumDExpress(unittest.TestCase):
+    def setUp(self):
+        address = 'test/data/dummy_expression.txt'
+        data = ExpressionProfile(pd.read_csv(address, sep='\t', index_col='ID'))
+        self.ctrl_profile = data.samples(list(range(6)))
+        self.case_profile = data.samples(list(range(6, 12)))
+        self.repository = Repository(self.case_profile,
+                                     num_sim_cases=3,
+                                     num_repetitions=2,
+                                     random_state=123456)
+
+    def test_ranksums_rows(self):
+        rows = np.array([[1.0, 2.0, 2.0, 5.0],
+                         [0.5, 3.0, 3.0, 3.0],
+                         [7.0, 8.0, 9.0, 10.0],
+                         [1.0, np.nan, 2.0, 5.0]])
+        for sample in (np.array([2.0, 3.0, 0.1]),
+                       np.array([2.0, np.nan, 0.1])):
+            z, p = _ranksums_rows(sample, np.sort(rows, axis=1))
+            for i, row in enumerate(rows):
+                expected = stats.ranksums(sample, row)
+                np.testing.assert_allclose(z[i], expected.statistic)
+                np.testing.assert_allclose(p[i], expected.pvalue)
+
+    def test_nan_rows(self):
+        values = np.array([[1.0, np.nan, 1.2], [1.9, 2.1, 2.0],
+                           [2.0, 2.05, 1.95]])
+        profile = ExpressionProfile.from_array(values, ['a', 'b', 'c'],
+                                               ['x', 'y', 'z'])
+        repository = Repository(profile, num_sim_cases=3, random_state=0)
+        for block_size in (None, 2):
+            dexpress = WilcoxonRankSumDExpress(repository, 0.05,
+                                               block_size=block_size,
+                                               random_state=0)
+            for _ in range(5):
+                result = dexpress([1.0, 1.05, 0.95], (0.5, 1.5))
+                self.assertFalse(np.any(np.isnan(result)))
+        rows, _ = dexpress.passing_rows([1.0, 1.05, 0.95], (0.5, 1.5))
+        self.assertTrue(np.all(np.isfinite(repository.means[rows])))
+
+    def test_block_scan_matches_row_scan(self):
+        row_dexpress = WilcoxonRankSumDExpress(self.repository, 0.05,
+                                               block_size=None, random_state=7)
+        block_dexpress = WilcoxonRankSumDExpress(self.repository, 0.05,
+                                                 block_size=2, random_state=7)
+        fold_changes = [(0.5, 1.8), (-1.5, -0.5), (-2.5, -1.5), (1.0, 1.5)]
+        for gene in self.ctrl_profile.keys():
+            ctrl_expression = self.ctrl_profile.get(gene)[:3]
+            for fold_change in fold_changes:
+                expected = row_dexpress(ctrl_expression, fold_change)
+                result = block_dexpress(ctrl_expression, fold_change)
+                np.testing.assert_array_equal(result, expected)
+
+    def test_raising_NonExistingExpressionException(self):
+        wilcoxon_dexpress = WilcoxonRankSumDExpress(self.repository, 0.2)
+        with self.assertRaises(NonExistingExpressionException):
+            ctrl_expression = [5., 4.87, 4.98]
+            wilcoxon_dexpress(ctrl_expression, (1.0, 1.5), force=False)
+
+    def test_batch(self):
+        wilcoxon_dexpress = WilcoxonRankSumDExpress(self.repository, 0.2)
+        ctrl_expressions = np.array([[5., 4.87, 4.98],
+                                     [1.12, 1.13, 0.97]])
+        fold_changes = [(1.0, 1.5), (0.5, 1.5)]
+        cases, expressed = wilcoxon_dexpress.batch(ctrl_expressions,
+                                                   fold_changes, force=False)
+        self.assertListEqual(list(expressed), [False, True])
+        np.testing.assert_array_equal(cases[0], ctrl_expressions[0])
+        self.assertTrue(set(cases[1]).issubset(set(self.case_profile.get('b'))))
+
+    def test_passing_rows(self):
+        row_dexpress = WilcoxonRankSumDExpress(self.repository, 0.2,
+                                               block_size=None)
+        block_dexpress = WilcoxonRankSumDExpress(self.repository, 0.2,
+                                                 block_size=2)
+        for gene in self.ctrl_profile.keys():
+            ctrl_expression = self.ctrl_profile.get(gene)[:3]
+            rows, num_tested = block_dexpress.passing_rows(ctrl_expression,
+                                                           (1.0, 1.5))
+            self.assertEqual(num_tested, len(self.repository))
+            if len(rows) == 0:
+                with self.assertRaises(NonExistingExpressionException):
+                    row_dexpress(ctrl_expression, (1.0, 1.5), force=False)
+                continue
+            expected = row_dexpress(ctrl_expression, (1.0, 1.5),
+                                    shuffle=False)
+            np.testing.assert_array_equal(self.repository[rows[0]], expected)
+
+
+class TestCachedDExpress(unittest.TestCase):
+    def setUp(self):
+        address = 'test/data/dummy_expression.txt'
+        data = ExpressionProfile(pd.read_csv(address, sep='\t', index_col='ID'))
+        self.case_profile = data.samples(list(range(6, 12)))
+        self.repository = Repository(self.case_profile,
+                                     num_sim_cases=3, num_repetitions=3,
+                                     random_state=123456)
+
+    def test_call(self):
+        cache = DExpressCache()
+        criterion = TTestDExpress(self.repository, 0.05)
+        cached = CachedDExpress(criterion, cache=cache, random_state=0)
+        ctrl_expression = [1.12, 1.13, 0.97]
+        rows, _ = criterion.passing_rows(ctrl_expression, (0.5, 1.8))
+        passing = {tuple(self.repository[i]) for i in rows}
+        for _ in range(5):
+            result = cached(ctrl_expression, (0.5, 1.8))
+            self.assertIn(tuple(result), passing)
+        self.assertEqual((cache.misses, cache.hits, len(cache)), (1, 4, 1))
+        # The cache is shared by criteria using an identical repository
+        repository = Repository(self.case_profile, num_sim_cases=3,
+                                num_repetitions=3, random_state=123456)
+        other = CachedDExpress(TTestDExpress(repository, 0.05), cache=cache)
+        other(ctrl_expression, (0.5, 1.8))
+        self.assertEqual((cache.hits, len(cache)), (5, 1))
+        other = CachedDExpress(TTestDExpress(self.repository, 0.01),
+                               cache=cache)
+        other(ctrl_expression, (0.5, 1.8))
+        self.assertEqual(len(cache), 2)
+        with self.assertRaises(NonExistingExpressionException):
+            cached([1.05, 1.17, 0.38], (-2.5, -1.5), force=False)
+        result = cached(np.array([1.05, 1.17, 0.38]), (-2.5, -1.5))
+        self.assertTrue(np.mean(result) < 0.97)
+        with self.assertRaises(TypeError):
+            CachedDExpress(FoldChangeDExpress(self.repository, 0.05))
+
+    def test_eviction(self):
+        cache = DExpressCache(max_bytes=8)
+        for i in range(3):
+            cache.put(str(i), np.array([i, i + 1]))
+        self.assertListEqual([cache.get(str(i)) is None for i in range(3)],
+                             [True, True, False])
+        self.assertEqual(cache.nbytes, 8)
+        cache.put('large', np.arange(10))
+        self.assertIsNone(cache.get('large'))
+        cache = pickle.loads(pickle.dumps(cache))
+        np.testing.assert_array_equal(cache.get('2'), [2, 3])
+        cache.clear()
+        self.assertEqual((len(cache), cache.nbytes), (0, 0))
 
 
 if __name__ == '__main__':
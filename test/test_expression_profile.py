@@ -1,4 +1,6 @@
 from silver.expression_profile import ExpressionProfile
+import pickle
+import numpy as np
 import pandas as pd
 import unittest
 
@@ -52,6 +54,30 @@ class TestExpressionProfile(unittest.TestCase):
         values = [value for _, value in self.items]
         self.assertListEqual(list(self.profile.values()), values)
 
+    def test_iter_values(self):
+        rows = list(self.profile.iter_values())
+        self.assertEqual(len(rows), len(self.items))
+        for row, (_, expected) in zip(rows, self.items):
+            self.assertListEqual(list(row), expected)
+            with self.assertRaises(ValueError):
+                row[0] = 0
+        blocks = list(self.profile.iter_values(chunk_size=2))
+        self.assertListEqual([len(block) for block in blocks], [2, 2, 1])
+        np.testing.assert_array_equal(np.concatenate(blocks),
+                                      self.profile.data())
+        with self.assertRaises(ValueError):
+            list(self.profile.iter_values(chunk_size=0))
+
+    def test_iter_items(self):
+        for (identifier, row), item in zip(self.profile.iter_items(),
+                                           self.items):
+            self.assertEqual(identifier, item[0])
+            self.assertListEqual(list(row), item[1])
+        chunks = list(self.profile.iter_items(chunk_size=3))
+        self.assertListEqual(list(chunks[0][0]), self.row_names[:3])
+        self.assertListEqual(list(chunks[1][0]), self.row_names[3:])
+        self.assertEqual(chunks[1][1].shape, (2, self.NUM_COLUMNS))
+
     def test__getitem__(self):
         # Check if the method returns TypeError for an invalid index type.
         with self.assertRaises(TypeError, msg='i must be of type integer.'):
@@ -71,6 +97,10 @@ class TestExpressionProfile(unittest.TestCase):
         for i in range(len(self.items)):
             self.assertListEqual(self.profile[i], self.items[i][1])
 
+    def test_index(self):
+        pd.testing.assert_index_equal(self.profile.index,
+                                      self.profile.profile.index)
+
     def test_columns(self):
         # Check if columns property returns correct values
         self.assertListEqual(self.profile.columns, self.col_names)
@@ -89,6 +119,50 @@ class TestExpressionProfile(unittest.TestCase):
             self.assertListEqual(self.profile.get(identifier),
                                  self.items[idx][1])
 
+    def test__contains__(self):
+        for identifier in self.row_names:
+            self.assertIn(identifier, self.profile)
+        self.assertNotIn('f', self.profile)
+        self.assertNotIn(['a'], self.profile)
+
+    def test_set(self):
+        expression = list(range(self.NUM_COLUMNS))
+        self.profile.set('c', expression)
+        self.assertListEqual(self.profile.get('c'), expression)
+        with self.assertRaises(KeyError):
+            self.profile.set('f', expression)
+        with self.assertRaises(ValueError):
+            self.profile.set('c', expression[1:])
+
+    def test_get_many_and_set_many(self):
+        values = self.profile.get_many(['d', 'a'])
+        np.testing.assert_array_equal(values, [self.items[3][1],
+                                               self.items[0][1]])
+        with self.assertRaises(KeyError):
+            self.profile.get_many(['a', 'f'])
+        self.profile.set_many(['d', 'a'], values + 1)
+        np.testing.assert_array_almost_equal(self.profile.get('a'),
+                                             np.array(self.items[0][1]) + 1)
+        with self.assertRaises(ValueError):
+            self.profile.set_many(['d', 'a'], values[:, 1:])
+
+    def test_set_columns(self):
+        profile = self.profile.samples([0, 1])
+        profile.columns = ['X', 'Y']
+        self.assertListEqual(profile.columns, ['X', 'Y'])
+        self.assertListEqual(list(profile.profile.columns), ['X', 'Y'])
+        with self.assertRaises(ValueError):
+            profile.columns = ['X']
+
+    def test_from_array(self):
+        profile = ExpressionProfile.from_array(self.data.values,
+                                               self.data.index,
+                                               self.data.columns)
+        pd.testing.assert_frame_equal(profile.profile, self.data)
+        with self.assertRaises(ValueError):
+            ExpressionProfile.from_array(self.data.values, list('aacde'),
+                                         self.data.columns)
+
     def test_samples(self):
         # Check if samples() returns a ExpressionProfile object
         self.assertIsInstance(self.profile.samples([0, 10, 2]),
@@ -111,6 +185,88 @@ class TestExpressionProfile(unittest.TestCase):
         self.assertEqual(list(self.profile.samples(col_indices).items()),
                          self.items)
 
+    def test_data(self):
+        values = self.profile.data()
+        np.testing.assert_array_equal(values, self.data.values)
+        values[0, 0] = 100
+        self.assertNotEqual(self.profile.get('a')[0], 100)
+        view = self.profile.data(copy=False)
+        np.testing.assert_array_equal(view, self.data.values)
+        with self.assertRaises(ValueError):
+            view[0, 0] = 100
+
+    def test_astype(self):
+        self.assertEqual(self.profile.dtype, np.float64)
+        self.assertIs(self.profile.astype(np.float64), self.profile)
+        profile = self.profile.astype(np.float32)
+        self.assertEqual(profile.dtype, np.float32)
+        self.assertListEqual(profile.columns, self.col_names)
+        self.assertListEqual(list(profile.keys()), self.row_names)
+        np.testing.assert_array_equal(profile.data(),
+                                      self.data.values.astype(np.float32))
+        with self.assertRaises(TypeError):
+            self.profile.astype(np.int32)
+
+    def test_samples_copy_on_write(self):
+        view = self.profile.samples([0, 2, 4])
+        lazy = self.profile.samples([5, 1, 3])
+        nested = lazy.samples(['F', 'D'])
+        self.assertTrue(np.shares_memory(view.data(copy=False),
+                                         self.profile.data(copy=False)))
+        self.assertListEqual(nested.columns, ['F', 'D'])
+        np.testing.assert_array_equal(nested.data(),
+                                      self.data[['F', 'D']].values)
+        self.assertListEqual(lazy.get('b'), [2.0, 2.03, 1.99])
+        # Modifying a profile does not modify the others
+        self.profile.set('a', [0] * self.NUM_COLUMNS)
+        view.set('b', [1, 1, 1])
+        np.testing.assert_array_equal(self.profile.get('b'),
+                                      self.data.loc['b'].values)
+        for profile, cols in [(view, ['A', 'C', 'E']),
+                              (lazy, ['F', 'B', 'D']), (nested, ['F', 'D'])]:
+            np.testing.assert_array_equal(profile.get('a'),
+                                          self.data.loc['a', cols].values)
+        # Read-only views returned by data are not modified either
+        values = lazy.data(copy=False)
+        lazy.set('c', [0, 0, 0])
+        np.testing.assert_array_equal(values, self.data[['F', 'B', 'D']])
+        self.assertListEqual(lazy.get('c'), [0, 0, 0])
+
+    def test_profile_is_read_only(self):
+        child = self.profile.samples([0, 1])
+        frame = child.profile
+        with self.assertRaises(ValueError):
+            frame.loc['a', 'A'] = 99
+        with self.assertRaises(ValueError):
+            frame.columns = ['X', 'Y']
+        with self.assertRaises(ValueError):
+            frame.index = list('vwxyz')
+        with self.assertRaises(ValueError):
+            frame['A'] = 0
+        self.assertListEqual(list(frame.columns), ['A', 'B'])
+        # Copies can be modified
+        frame = frame.copy()
+        frame.columns = ['X', 'Y']
+        # Later modifications of the profile do not modify the DataFrame
+        child.set('a', [0, 0])
+        np.testing.assert_array_equal(frame.loc['a'].values,
+                                      self.data.loc['a', ['A', 'B']].values)
+        np.testing.assert_array_equal(self.profile.get('a'),
+                                      self.data.loc['a'].values)
+
+    def test_pickle(self):
+        lazy = self.profile.samples([5, 1, 3])
+        fresh = ExpressionProfile(self.data[['F', 'B', 'D']])
+        # Only the selected samples are pickled
+        self.assertLessEqual(len(pickle.dumps(lazy)),
+                             len(pickle.dumps(fresh)))
+        copy = pickle.loads(pickle.dumps(lazy))
+        np.testing.assert_array_equal(copy.data(), lazy.data())
+        self.assertListEqual(copy.columns, ['F', 'B', 'D'])
+        copy.set('a', [0, 0, 0])
+        np.testing.assert_array_equal(self.profile.get('a'),
+                                      self.data.loc['a'].values)
+
     def test__str__(self):
         self.assertEqual(str(self.profile), str(self.data))
 
@@ -121,7 +277,7 @@ class TestExpressionProfile(unittest.TestCase):
         self.assertListEqual(profile3.columns, list('ABCDEFGHIJKL'))
         self.assertListEqual(list(profile3.keys()), list(profile1.keys()))
         self.assertListEqual(list(profile3.keys()), list(profile2.keys()))
-        pd.testing.assert_frame_equal(self.data, profile3.profile)
+        pd.testing.assert_frame_equal(profile3.profile, self.data)
 
 
 if __name__ == '__main__':
@@ -1,6 +1,10 @@
 from silver.geneset_database import GenesetDatabase
 from collections import OrderedDict
+import pickle
+import shutil
+import tempfile
 import unittest
+import numpy as np
 
 
 class TestGeneSetDatabase(unittest.TestCase):
@@ -25,6 +29,29 @@ class TestGeneSetDatabase(unittest.TestCase):
         self.assertDictEqual(self.gsdb.database, self.databse)
         self.assertDictEqual(self.gsdb.info, self.info)
 
+    def test_read_only(self):
+        with self.assertRaises(TypeError):
+            self.gsdb.database['Geneset3'] = ['gene1']
+        with self.assertRaises(TypeError):
+            del self.gsdb.info['Geneset1']
+        with self.assertRaises(TypeError):
+            self.gsdb.database.update({'Geneset3': ['gene1']})
+        self.assertEqual(len(self.gsdb), 2)
+        self.assertListEqual(list(self.gsdb.keys()), list(self.databse))
+        database = self.gsdb.database.copy()
+        database['Geneset3'] = ['gene1', 'gene6']
+        del database['Geneset1']
+        self.gsdb.database = database
+        self.assertListEqual(list(self.gsdb.keys()), ['Geneset2', 'Geneset3'])
+        self.assertListEqual(self.gsdb['Geneset3'], ['gene1', 'gene6'])
+        self.assertListEqual(self.gsdb.sets_containing('gene6'), ['Geneset3'])
+        self.assertDictEqual(self.gsdb.info, {'Geneset2': 'second geneset',
+                                              'Geneset3': ''})
+        copied = pickle.loads(pickle.dumps(self.gsdb.database))
+        self.assertDictEqual(copied, self.gsdb.database)
+        with self.assertRaises(TypeError):
+            copied['Geneset1'] = []
+
     def test__getitem__(self):
         self.assertListEqual(self.gsdb['Geneset1'], self.databse['Geneset1'])
         self.assertListEqual(self.gsdb['Geneset2'], self.databse['Geneset2'])
@@ -65,3 +92,100 @@ class TestGeneSetDatabase(unittest.TestCase):
         message = 'gene set with a size greater than max_size must be excluded.'
         with self.assertRaises(KeyError, msg=message):
             self.gsdb['Geneset2']
+
+    def test_cleaned(self):
+        background = ['gene1', 'gene2', 'gene4', 'gene6']
+        gsdb = self.gsdb.cleaned(background, min_size=3)
+        self.assertListEqual(list(gsdb.keys()), ['Geneset2'])
+        self.assertListEqual(gsdb['Geneset2'], ['gene1', 'gene2', 'gene4'])
+        self.assertDictEqual(gsdb.info, {'Geneset2': 'second geneset'})
+        # The original database is not modified
+        self.assertDictEqual(self.gsdb.database, self.databse)
+        db = GenesetDatabase(self.databse)
+        db.clean(background, max_size=2)
+        self.assertDictEqual(db.database, {'Geneset1': ['gene4', 'gene2']})
+        self.assertIsNone(db.info)
+        db.clean([])
+        self.assertEqual(len(db), 0)
+
+    def test_sets_containing(self):
+        self.assertListEqual(self.gsdb.sets_containing('gene2'),
+                             ['Geneset1', 'Geneset2'])
+        self.assertListEqual(self.gsdb.sets_containing('gene3'),
+                             ['Geneset2'])
+        self.assertListEqual(self.gsdb.sets_containing('gene9'), [])
+        self.gsdb.clean(['gene1', 'gene3'])
+        self.assertListEqual(self.gsdb.sets_containing('gene2'), [])
+        self.assertListEqual(self.gsdb.sets_containing('gene3'),
+                             ['Geneset2'])
+        np.testing.assert_array_equal(self.gsdb.sizes, [2])
+
+    def test_save_and_load(self):
+        address = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, address)
+        for gsdb in [self.gsdb, GenesetDatabase(self.databse)]:
+            gsdb.save(address)
+            loaded = GenesetDatabase.load(address)
+            self.assertIsInstance(loaded.indices, np.memmap)
+            self.assertDictEqual(loaded.database, gsdb.database)
+            self.assertEqual(loaded.info, gsdb.info)
+            self.assertListEqual(loaded.sets_containing('gene1'),
+                                 ['Geneset2'])
+
+    def test_fromGMT_cache_dir(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        address = 'test/data/dummy_genesets.gmt'
+        for _ in range(2):
+            gsdb = GenesetDatabase.fromGMT(address, cache_dir=cache_dir)
+            self.assertDictEqual(gsdb.database, self.databse)
+            self.assertDictEqual(gsdb.info, self.info)
+        self.assertIsInstance(gsdb.indices, np.memmap)
+        gsdb.clean(['gene1', 'gene2'])
+        self.assertListEqual(gsdb['Geneset2'], ['gene1', 'gene2'])
+        gsdb = GenesetDatabase.fromGMT(address, cache_dir=cache_dir)
+        self.assertDictEqual(gsdb.database, self.databse)
+
+    def test_overlap_matrix_keeps_database(self):
+        database = OrderedDict([('Geneset1', ['gene4', 'gene2', 'gene4']),
+                                ('Geneset2', ['gene3', 'gene1'])])
+        gsdb = GenesetDatabase(database)
+        indptr, indices = gsdb.indptr.copy(), gsdb.indices.copy()
+        counts = gsdb.overlap_matrix().toarray()
+        np.testing.assert_array_equal(counts, [[2, 0], [0, 2]])
+        gsdb.top_overlaps(1)
+        np.testing.assert_array_equal(gsdb.indptr, indptr)
+        np.testing.assert_array_equal(gsdb.indices, indices)
+        self.assertDictEqual(gsdb.database, database)
+        address = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, address)
+        gsdb.save(address)
+        loaded = GenesetDatabase.load(address)
+        np.testing.assert_array_equal(loaded.overlap_matrix().toarray(),
+                                      counts)
+        self.assertDictEqual(loaded.database, database)
+
+    def test_overlap_matrix(self):
+        counts = self.gsdb.overlap_matrix().toarray()
+        np.testing.assert_array_equal(counts, [[3, 3], [3, 5]])
+        jaccard = self.gsdb.overlap_matrix(metric='jaccard').toarray()
+        np.testing.assert_array_almost_equal(jaccard, [[1, 0.6], [0.6, 1]])
+        with self.assertRaises(ValueError):
+            self.gsdb.overlap_matrix(metric='dice')
+
+    def test_top_overlaps(self):
+        database = OrderedDict(self.databse)
+        database['Geneset3'] = ['gene4', 'gene4', 'gene6']
+        database['Geneset4'] = ['gene7']
+        gsdb = GenesetDatabase(database)
+        for chunk_size in [1, 3, 1024]:
+            neighbors, scores = gsdb.top_overlaps(2, chunk_size=chunk_size)
+            np.testing.assert_array_equal(neighbors, [[1, 2], [0, 2],
+                                                      [0, 1], [-1, -1]])
+            np.testing.assert_array_almost_equal(
+                scores, [[0.6, 0.25], [0.6, 1 / 6], [0.25, 1 / 6], [0, 0]])
+        neighbors, scores = gsdb.top_overlaps(1, metric='count')
+        np.testing.assert_array_equal(neighbors, [[1], [0], [0], [-1]])
+        np.testing.assert_array_equal(scores, [[3], [3], [1], [0]])
+        with self.assertRaises(ValueError):
+            gsdb.top_overlaps(0)
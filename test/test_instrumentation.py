@@ -0,0 +1,126 @@
+import json
+import pickle
+import threading
+import time
+import unittest
+import numpy as np
+import pandas as pd
+from silver.dexpress import TTestDExpress, WilcoxonRankSumDExpress
+from silver.exceptions import NonExistingExpressionException
+from silver.expression_profile import ExpressionProfile
+from silver.instrumentation import SimulationStats, HIT, FALLBACK, MISS
+from silver.repository import Repository
+
+
+class TestSimulationStats(unittest.TestCase):
+    def setUp(self):
+        address = 'test/data/dummy_expression.txt'
+        data = ExpressionProfile(pd.read_csv(address, sep='\t',
+                                             index_col='ID'))
+        self.repository = Repository(data.samples(list(range(6, 12))),
+                                     num_sim_cases=3, random_state=123456)
+
+    def test_record(self):
+        stats = SimulationStats()
+        with stats.stage('a'):
+            pass
+        with stats.stage('a'):
+            pass
+        self.assertListEqual(list(stats.stage_times), ['a'])
+        stats.record_gene(3, HIT, 1e-4)
+        stats.record_genes([5, 5], [FALLBACK, MISS], [1e-3, 2e-3])
+        self.assertEqual(stats.num_genes, 3)
+        self.assertEqual((stats.hits, stats.fallbacks, stats.misses),
+                         (1, 1, 1))
+        np.testing.assert_array_equal(stats.rows_tested, [3, 5, 5])
+        counts, edges = stats.latency_histogram()
+        self.assertEqual(counts.sum(), 3)
+        self.assertGreaterEqual(edges[-1], 2e-3)
+        summary = json.loads(json.dumps(stats.summary()))
+        self.assertEqual(summary['rows_tested']['total'], 13)
+        self.assertNotIn('batch_latency', summary)
+        with self.assertRaises(ValueError):
+            stats.record_genes([1], [HIT, HIT], [0.1])
+        stats.record_batch([2, 4], [HIT, HIT], 0.5)
+        self.assertEqual(stats.num_genes, 5)
+        self.assertTrue(np.all(np.isnan(stats.latencies[3:])))
+        np.testing.assert_array_equal(stats.batch_latencies, [0.5])
+        np.testing.assert_array_equal(stats.batch_sizes, [2])
+        # Batches are left out of the per-gene latencies
+        counts, _ = stats.latency_histogram()
+        self.assertEqual(counts.sum(), 3)
+        summary = json.loads(json.dumps(stats.summary()))
+        self.assertAlmostEqual(summary['latency']['total'], 3.1e-3)
+        self.assertDictEqual(summary['batch_latency'],
+                             {'num_batches': 1, 'num_genes': 2, 'total': 0.5,
+                              'mean': 0.5, 'max': 0.5})
+        with self.assertRaises(ValueError):
+            stats.record_batch([1], [HIT, HIT], 0.1)
+
+    def test_dexpress_call(self):
+        for cls in [TTestDExpress, WilcoxonRankSumDExpress]:
+            stats = SimulationStats()
+            dexpress = cls(self.repository, 0.05, random_state=0,
+                           stats=stats)
+            dexpress([1.12, 1.13, 0.97], (0.5, 1.8))
+            dexpress(np.array([1.05, 1.17, 0.38]), (-2.5, -1.5))
+            with self.assertRaises(NonExistingExpressionException):
+                dexpress([1.05, 1.17, 0.38], (-2.5, -1.5), force=False)
+            self.assertEqual(stats.num_genes, 3)
+            self.assertEqual(stats.misses, 1)
+            self.assertEqual(stats.hits + stats.fallbacks, 2)
+            self.assertTrue(np.all(stats.rows_tested <=
+                                   len(self.repository)))
+
+    def test_threads_and_pickle(self):
+        stats = SimulationStats()
+
+        def record(outcome):
+            for _ in range(200):
+                stats.record_genes([1, 2], [outcome, outcome], [1e-6, 2e-6])
+
+        threads = [threading.Thread(target=record, args=(outcome,))
+                   for outcome in (HIT, FALLBACK, MISS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((stats.hits, stats.fallbacks, stats.misses),
+                         (400, 400, 400))
+        np.testing.assert_array_equal(stats.rows_tested[::2], 1)
+        np.testing.assert_array_equal(stats.rows_tested[1::2], 2)
+        copy = pickle.loads(pickle.dumps(stats))
+        self.assertDictEqual(copy.summary(), stats.summary())
+        copy.record_gene(3, HIT, 1e-4)
+        self.assertEqual(copy.num_genes, stats.num_genes + 1)
+
+    def test_dexpress_batch(self):
+        stats = SimulationStats()
+        dexpress = TTestDExpress(self.repository, 0.05, random_state=0,
+                                 stats=stats)
+        ctrl_expressions = np.array([[1.12, 1.13, 0.97],
+                                     [1.95, 1.97, 2.18],
+                                     [1.05, 1.17, 0.38]])
+        fold_changes = [(0.5, 1.8), (-1.5, -0.5), (-2.5, -1.5)]
+        start = time.perf_counter()
+        dexpress.batch(ctrl_expressions, fold_changes)
+        elapsed = time.perf_counter() - start
+        self.assertEqual((stats.hits, stats.fallbacks, stats.misses),
+                         (2, 1, 0))
+        # The latency of the batch is recorded instead of per-gene latencies
+        self.assertTrue(np.all(np.isnan(stats.latencies)))
+        np.testing.assert_array_equal(stats.batch_sizes, [3])
+        self.assertEqual(len(stats.batch_latencies), 1)
+        self.assertGreaterEqual(stats.batch_latencies[0], 0)
+        self.assertLessEqual(stats.batch_latencies[0], elapsed)
+        # Only the rows whose mean is in the range of a gene are tested
+        expected = [len(self.repository.rows_in_mean_range(
+                        np.mean(expressions + lower),
+                        np.mean(expressions + upper)))
+                    for expressions, (lower, upper) in zip(ctrl_expressions,
+                                                           fold_changes)]
+        np.testing.assert_array_equal(stats.rows_tested, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,8 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import tempfile
 import unittest
+import numpy as np
 import pandas as pd
 from silver.repository import Repository
 from silver.expression_profile import ExpressionProfile
@@ -21,6 +25,36 @@ class TestRepository(unittest.TestCase):
                                           num_sim_cases=self.num_sim_cases,
                                           num_repetitions=3)
 
+    def test_dtype(self):
+        repository = Repository(self.case_profile,
+                                num_sim_cases=self.num_sim_cases,
+                                num_repetitions=3, random_state=0,
+                                dtype=np.float32)
+        expected = Repository(self.case_profile,
+                              num_sim_cases=self.num_sim_cases,
+                              num_repetitions=3, random_state=0)
+        self.assertEqual(repository.dtype, np.float32)
+        self.assertEqual(repository.means.dtype, np.float64)
+        np.testing.assert_allclose(repository.means, expected.means,
+                                   rtol=1e-6)
+        np.testing.assert_allclose(repository.variances, expected.variances,
+                                   rtol=1e-4)
+
+    def test_key(self):
+        repositories = [Repository(self.case_profile,
+                                   num_sim_cases=self.num_sim_cases,
+                                   num_repetitions=2, random_state=0,
+                                   virtual=virtual)
+                        for virtual in [False, True]]
+        self.assertEqual(repositories[0].key, repositories[1].key)
+        other = Repository(self.case_profile,
+                           num_sim_cases=self.num_sim_cases,
+                           num_repetitions=2, random_state=1)
+        self.assertNotEqual(other.key, repositories[0].key)
+        self.assertNotEqual(self.repository_1rep.key,
+                            Repository(self.case_profile,
+                                       num_sim_cases=self.num_sim_cases).key)
+
     def test__len__(self):
         self.assertEqual(len(self.repository_1rep), self.data_length)
         self.assertEqual(len(self.repository_3rep), self.data_length* 3)
@@ -54,6 +88,191 @@ class TestRepository(unittest.TestCase):
             self.assertEqual(len(val), self.num_sim_cases)
             self.assertEqual(set(val) - set(self.case_profile[i]), set())
 
+    def test_row_summaries(self):
+        for repository in [self.repository_1rep, self.repository_3rep]:
+            self.assertEqual(len(repository.means), len(repository))
+            for i, row in enumerate(repository):
+                self.assertAlmostEqual(repository.means[i], np.mean(row))
+                self.assertAlmostEqual(repository.variances[i],
+                                       np.var(row, ddof=1))
+                self.assertEqual(repository.counts[i], self.num_sim_cases)
+        self.assertIs(self.repository_1rep.means, self.repository_1rep.means)
+
+    def test_rows(self):
+        indices = [2, 0, 4]
+        block = self.repository_3rep.rows(indices)
+        self.assertEqual(block.shape, (len(indices), self.num_sim_cases))
+        for i, idx in enumerate(indices):
+            np.testing.assert_array_equal(block[i], self.repository_3rep[idx])
+
+    def test_rows_in_mean_range(self):
+        means = self.repository_3rep.means
+        order = self.repository_3rep.mean_order
+        self.assertTrue(np.all(np.diff(means[order]) >= 0))
+        low, high = 1.5, 3.5
+        rows = self.repository_3rep.rows_in_mean_range(low, high)
+        expected = np.flatnonzero((means >= low) & (means <= high))
+        self.assertSetEqual(set(rows), set(expected))
+        self.assertEqual(len(self.repository_3rep.rows_in_mean_range(3, 2)), 0)
+        rows = self.repository_3rep.rows_in_mean_range(means[0], means[0])
+        self.assertIn(0, rows)
+
+    def test_sorted_rows(self):
+        indices = [1, 4, 0]
+        block = self.repository_3rep.sorted_rows(indices)
+        for i, idx in enumerate(indices):
+            np.testing.assert_array_equal(block[i],
+                                          np.sort(self.repository_3rep[idx]))
+
+    def test_virtual(self):
+        repository = Repository(self.case_profile,
+                                num_sim_cases=self.num_sim_cases,
+                                num_repetitions=3, random_state=5)
+        virtual = Repository(self.case_profile,
+                             num_sim_cases=self.num_sim_cases,
+                             num_repetitions=3, random_state=5, virtual=True)
+        self.assertEqual(virtual.shape, repository.shape)
+        self.assertEqual(len(virtual), len(repository))
+        self.assertEqual(virtual.dtype, repository.dtype)
+        np.testing.assert_array_equal(virtual.repository,
+                                      repository.repository)
+        for i in range(len(repository)):
+            np.testing.assert_array_equal(virtual[i], repository[i])
+        np.testing.assert_array_equal(list(virtual), list(repository))
+        indices = [7, 0, 14, 3]
+        np.testing.assert_array_equal(virtual.rows(indices),
+                                      repository.rows(indices))
+        np.testing.assert_array_equal(virtual.sorted_rows(indices),
+                                      repository.sorted_rows(indices))
+        np.testing.assert_array_almost_equal(virtual.means, repository.means)
+        np.testing.assert_array_almost_equal(virtual.variances,
+                                             repository.variances)
+        np.testing.assert_array_equal(virtual.counts, repository.counts)
+        with self.assertRaises(IndexError):
+            virtual[len(virtual)]
+
+    def test_summaries_in_threads(self):
+        expected = Repository(self.case_profile,
+                              num_sim_cases=self.num_sim_cases,
+                              num_repetitions=50, random_state=2)
+        for _ in range(5):
+            repository = Repository(self.case_profile,
+                                    num_sim_cases=self.num_sim_cases,
+                                    num_repetitions=50, random_state=2,
+                                    virtual=True)
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                orders = list(executor.map(lambda _: repository.mean_order,
+                                           range(8)))
+            for order in orders:
+                np.testing.assert_array_equal(order, expected.mean_order)
+
+    def test_sample_indices(self):
+        sample_indices = self.repository_3rep.sample_indices
+        self.assertEqual(sample_indices.shape, (3, self.num_sim_cases))
+        data = self.case_profile.data()
+        for rep, indices in enumerate(sample_indices):
+            self.assertEqual(len(set(indices)), self.num_sim_cases)
+            for gene in range(self.data_length):
+                row = rep * self.data_length + gene
+                np.testing.assert_array_equal(self.repository_3rep[row],
+                                              data[gene, indices])
+
+    def test_save_and_load(self):
+        for virtual in [False, True]:
+            repository = Repository(self.case_profile,
+                                    num_sim_cases=self.num_sim_cases,
+                                    num_repetitions=3, random_state=5,
+                                    virtual=virtual)
+            with tempfile.TemporaryDirectory() as address:
+                repository.save(address)
+                loaded = Repository.load(address)
+                self.assertIsInstance(loaded.repository, np.memmap)
+                np.testing.assert_array_equal(loaded.repository,
+                                              repository.repository)
+                np.testing.assert_array_equal(loaded.sample_indices,
+                                              repository.sample_indices)
+                self.assertEqual(loaded.source_hash,
+                                 Repository.fingerprint(self.case_profile))
+                self.assertEqual(loaded.random_state, 5)
+                np.testing.assert_array_almost_equal(loaded.means,
+                                                     repository.means)
+                with self.assertRaises(ValueError):
+                    loaded.repository[0, 0] = 0
+
+    def test_save_in_threads(self):
+        repository = Repository(self.case_profile,
+                                num_sim_cases=self.num_sim_cases,
+                                num_repetitions=20, random_state=5)
+        with tempfile.TemporaryDirectory() as address:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                list(executor.map(lambda _: repository.save(address),
+                                  range(8)))
+            self.assertListEqual(sorted(os.listdir(address)),
+                                 ['metadata.json', 'repository.npy',
+                                  'sample_indices.npy'])
+            loaded = Repository.load(address)
+            np.testing.assert_array_equal(loaded.repository,
+                                          repository.repository)
+
+    def test_seed_sequence(self):
+        seed = np.random.SeedSequence(7).spawn(2)[1]
+        repository = Repository(self.case_profile,
+                                num_sim_cases=self.num_sim_cases,
+                                num_repetitions=2, random_state=seed)
+        same = Repository(self.case_profile, num_sim_cases=self.num_sim_cases,
+                          num_repetitions=2,
+                          random_state=np.random.SeedSequence(7).spawn(2)[1])
+        other = Repository(self.case_profile,
+                           num_sim_cases=self.num_sim_cases,
+                           num_repetitions=2,
+                           random_state=np.random.SeedSequence(7).spawn(2)[0])
+        np.testing.assert_array_equal(same.sample_indices,
+                                      repository.sample_indices)
+        self.assertEqual(same.key, repository.key)
+        self.assertNotEqual(other.key, repository.key)
+        with tempfile.TemporaryDirectory() as address:
+            created = Repository.load_or_create(address, self.case_profile,
+                                                self.num_sim_cases,
+                                                num_repetitions=2,
+                                                random_state=seed)
+            loaded = Repository.load_or_create(address, self.case_profile,
+                                               self.num_sim_cases,
+                                               num_repetitions=2,
+                                               random_state=seed)
+            self.assertIsInstance(loaded.repository, np.memmap)
+            self.assertEqual(loaded.key, created.key)
+            self.assertEqual(loaded.random_state.spawn_key, seed.spawn_key)
+
+    def test_load_or_create(self):
+        with tempfile.TemporaryDirectory() as address:
+            created = Repository.load_or_create(address, self.case_profile,
+                                                self.num_sim_cases,
+                                                num_repetitions=2,
+                                                random_state=5)
+            self.assertNotIsInstance(created.repository, np.memmap)
+            self.assertTrue(os.path.exists(os.path.join(address,
+                                                        'metadata.json')))
+            loaded = Repository.load_or_create(address, self.case_profile,
+                                               self.num_sim_cases,
+                                               num_repetitions=2,
+                                               random_state=5)
+            self.assertIsInstance(loaded.repository, np.memmap)
+            np.testing.assert_array_equal(loaded.repository,
+                                          created.repository)
+            rebuilt = Repository.load_or_create(address, self.case_profile,
+                                                self.num_sim_cases,
+                                                num_repetitions=2,
+                                                random_state=6)
+            self.assertNotIsInstance(rebuilt.repository, np.memmap)
+            other_profile = self.case_profile.samples([0, 1, 2, 3])
+            rebuilt = Repository.load_or_create(address, other_profile,
+                                                self.num_sim_cases,
+                                                num_repetitions=2,
+                                                random_state=6)
+            self.assertNotIsInstance(rebuilt.repository, np.memmap)
+            self.assertEqual(rebuilt.source_hash,
+                             Repository.fingerprint(other_profile))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,82 @@
+from concurrent.futures import ProcessPoolExecutor
+import pickle
+import unittest
+import numpy as np
+import pandas as pd
+from silver import shared
+from silver.expression_profile import ExpressionProfile
+from silver.repository import Repository
+
+
+def _sum_rows(handle):
+    repository = Repository.from_shared_memory(handle)
+    return float(repository.rows(np.arange(len(repository))).sum())
+
+
+class TestShared(unittest.TestCase):
+    def setUp(self):
+        address = 'test/data/dummy_expression.txt'
+        self.data = ExpressionProfile(pd.read_csv(address, sep='\t',
+                                                  index_col='ID'))
+        self.cases = self.data.samples(list(range(6, 12)))
+
+    def test_attach(self):
+        array = np.arange(12, dtype=np.float32).reshape(3, 4)
+        with shared.SharedExport({'a': array, 'empty': array[:0]}) as export:
+            handle = pickle.loads(pickle.dumps(export.handle))
+            arrays = shared.attach(handle)
+            np.testing.assert_array_equal(arrays['a'], array)
+            self.assertEqual(arrays['a'].dtype, np.float32)
+            self.assertEqual(arrays['empty'].shape, (0, 4))
+            self.assertFalse(arrays['a'].flags.writeable)
+        # Attached views outlive the release of the shared memory
+        np.testing.assert_array_equal(arrays['a'], array)
+        with self.assertRaises(FileNotFoundError):
+            shared.attach(handle)
+        with self.assertRaises(ValueError):
+            shared.SharedExport({'a': np.array(['x'], dtype=object)})
+
+    def test_profile(self):
+        with self.data.to_shared_memory() as export:
+            profile = ExpressionProfile.from_shared_memory(export.handle)
+        self.assertListEqual(list(profile.keys()), list(self.data.keys()))
+        self.assertListEqual(list(profile.columns), list(self.data.columns))
+        self.assertEqual(profile.profile.index.name, 'ID')
+        np.testing.assert_array_equal(profile.data(), self.data.data())
+        # Modifications copy the shared values first
+        gene = next(iter(profile.keys()))
+        profile.set(gene, np.zeros(len(profile.columns)))
+        np.testing.assert_array_equal(profile.get(gene), 0)
+        self.assertFalse(np.all(self.data.get(gene) == 0))
+
+    def test_repository(self):
+        for virtual in (False, True):
+            repository = Repository(self.cases, num_sim_cases=3,
+                                    num_repetitions=2, random_state=1,
+                                    virtual=virtual)
+            repository.means
+            with repository.to_shared_memory() as export:
+                attached = Repository.from_shared_memory(export.handle)
+                self.assertEqual(attached.virtual, virtual)
+                self.assertEqual(attached.key, repository.key)
+                np.testing.assert_array_equal(attached.repository,
+                                              repository.repository)
+                np.testing.assert_array_equal(attached.means,
+                                              repository.means)
+                np.testing.assert_array_equal(attached.counts,
+                                              repository.counts)
+                np.testing.assert_array_equal(attached.sorted_rows([0, 5]),
+                                              repository.sorted_rows([0, 5]))
+
+    def test_process_pool(self):
+        repository = Repository(self.cases, num_sim_cases=3,
+                                num_repetitions=2, random_state=1)
+        expected = float(repository.repository.sum())
+        with repository.to_shared_memory() as export:
+            with ProcessPoolExecutor(max_workers=2) as executor:
+                results = list(executor.map(_sum_rows, [export.handle] * 4))
+        self.assertListEqual(results, [expected] * 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,313 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+import numpy as np
+import pandas as pd
+from silver.utils import simulate, simulate_many, read_profile
+from silver.utils import read_contrast, read_fold_change_file
+from silver.utils import write_dataset, load_profile
+from silver.dexpress import DExpressCache
+from silver.exceptions import InvalidContrastException
+from silver.expression_profile import ExpressionProfile
+
+
+class TestReadProfile(unittest.TestCase):
+    def setUp(self):
+        self.address = 'test/data/dummy_expression.txt'
+        self.data = pd.read_csv(self.address, sep='\t', index_col='ID')
+
+    def test_read_profile(self):
+        profile = read_profile(self.address, sep='\t', index_col='ID')
+        pd.testing.assert_frame_equal(profile.profile, self.data)
+
+    def test_columns(self):
+        profile = read_profile(self.address, columns=[4, 0, 11], sep='\t',
+                               index_col='ID')
+        self.assertListEqual(profile.columns, ['E', 'A', 'L'])
+        self.assertListEqual(list(profile.keys()), list('abcde'))
+        np.testing.assert_array_equal(profile.data(),
+                                      self.data[['E', 'A', 'L']].values)
+        profile = read_profile(self.address, columns=['B', 'C'], sep='\t',
+                               index_col='ID')
+        self.assertListEqual(profile.columns, ['B', 'C'])
+        with self.assertRaises(IndexError):
+            read_profile(self.address, columns=[12], sep='\t',
+                         index_col='ID')
+        with self.assertRaises(ValueError):
+            read_profile(self.address, columns=['ID'], sep='\t',
+                         index_col='ID')
+
+    def test_dtype_and_chunksize(self):
+        profile = read_profile(self.address, dtype=np.float32, chunksize=2,
+                               sep='\t', index_col='ID')
+        self.assertEqual(profile.data().dtype, np.float32)
+        self.assertListEqual(list(profile.keys()), list('abcde'))
+        self.assertListEqual(profile.columns, list(self.data.columns))
+        np.testing.assert_array_almost_equal(profile.data(), self.data.values,
+                                             decimal=6)
+
+    def test_chunksize_memory(self):
+        # Chunks are copied into one array rather than concatenated
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        address = os.path.join(directory, 'profile.txt')
+        values = np.random.default_rng(0).random((10000, 100))
+        data = pd.DataFrame(values, columns=[f'S{i}' for i in range(100)],
+                            index=pd.Index([f'g{i}' for i in range(10000)],
+                                           name='ID'))
+        data.to_csv(address, sep='\t')
+        tracemalloc.start()
+        try:
+            profile = read_profile(address, chunksize=250, sep='\t',
+                                   index_col='ID')
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        np.testing.assert_array_almost_equal(profile.data(), values)
+        self.assertListEqual(list(profile.keys()), list(data.index))
+        self.assertLess(peak, 1.6 * values.nbytes)
+
+    def test_blank_index_header(self):
+        # DataFrame.to_csv writes a blank header cell for an unnamed index
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        address = os.path.join(directory, 'profile.txt')
+        data = self.data.rename_axis(None)
+        data.to_csv(address, sep='\t')
+        for kwargs in [{'columns': [4, 0]}, {'columns': ['E', 'A']},
+                       {'dtype': np.float32}, {'chunksize': 2}]:
+            profile = read_profile(address, sep='\t', index_col=0, **kwargs)
+            names = profile.columns
+            self.assertListEqual(list(profile.keys()), list('abcde'))
+            np.testing.assert_array_almost_equal(profile.data(),
+                                                 data[names].values)
+        self.assertListEqual(names, list(data.columns))
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+
+    def test_read_profile(self):
+        address = 'test/data/dummy_expression.txt'
+        expected = read_profile(address, columns=[4, 0], sep='\t',
+                                index_col='ID')
+        for _ in range(2):
+            profile = read_profile(address, columns=[4, 0], sep='\t',
+                                   index_col='ID', cache_dir=self.cache_dir)
+            pd.testing.assert_frame_equal(profile.profile, expected.profile)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        # Modifying a profile loaded from the cache leaves the cache intact
+        profile.set('a', [0, 0])
+        profile = read_profile(address, columns=[4, 0], sep='\t',
+                               index_col='ID', cache_dir=self.cache_dir)
+        pd.testing.assert_frame_equal(profile.profile, expected.profile)
+        # Other arguments use other entries
+        read_profile(address, sep='\t', index_col='ID',
+                     cache_dir=self.cache_dir)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+    def test_read_contrast(self):
+        address = 'test/data/dummy_expression_contrast.txt'
+        expected = read_contrast(address)
+        for _ in range(2):
+            self.assertEqual(read_contrast(address, cache_dir=self.cache_dir),
+                             expected)
+
+    def test_read_fold_change_file(self):
+        args = ('test/data/dummy_fold_change.txt', 'ID', 'FCLower',
+                'FCUpper')
+        expected = read_fold_change_file(*args)
+        for _ in range(2):
+            self.assertDictEqual(read_fold_change_file(
+                *args, cache_dir=self.cache_dir), expected)
+
+
+class TestWriteDataset(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        profile = read_profile('test/data/dummy_expression.txt', sep='\t',
+                               index_col='ID')
+        self.ctrls = profile.samples(list(range(0, 12, 2)))
+        self.cases = profile.samples(list(range(1, 12, 2)))
+        self.expected = self.ctrls.concat(self.cases)
+
+    def test_text(self):
+        expected_address = os.path.join(self.directory, 'expected.txt')
+        self.expected.profile.to_csv(expected_address, sep='\t')
+        with open(expected_address) as fin:
+            expected = fin.read()
+        address = os.path.join(self.directory, 'profile.txt')
+        contrast_address = os.path.join(self.directory, 'contrast.txt')
+        for chunk_size in (1, 2, 100):
+            write_dataset(self.ctrls, self.cases, address,
+                          contrast_address=contrast_address,
+                          chunk_size=chunk_size)
+            with open(address) as fin:
+                self.assertEqual(fin.read(), expected)
+        ctrl_indices, case_indices, _ = read_contrast(contrast_address)
+        self.assertListEqual(ctrl_indices, list(range(6)))
+        self.assertListEqual(case_indices, list(range(6, 12)))
+
+    def test_binary(self):
+        address = os.path.join(self.directory, 'profile')
+        write_dataset(self.ctrls, self.cases, address, binary=True,
+                      chunk_size=2)
+        profile = load_profile(address)
+        np.testing.assert_array_equal(profile.data(), self.expected.data())
+        self.assertListEqual(list(profile.keys()),
+                             list(self.expected.keys()))
+        self.assertListEqual(profile.columns, self.expected.columns)
+
+    def test_lazy_samples(self):
+        # Samples selected from a profile are written a chunk at a time
+        values = np.random.default_rng(0).random((20000, 40))
+        profile = ExpressionProfile.from_array(
+            values, [f'g{i}' for i in range(20000)],
+            [f'S{i}' for i in range(40)])
+        order = [int(i) for i in np.random.default_rng(1).permutation(40)]
+        ctrls = profile.samples(order[:20])
+        cases = profile.samples(order[20:])
+        address = os.path.join(self.directory, 'profile')
+        tracemalloc.start()
+        try:
+            write_dataset(ctrls, cases, address, binary=True, chunk_size=500)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertLess(peak, values.nbytes / 4)
+        written = load_profile(address)
+        np.testing.assert_array_equal(written.data(),
+                                      ctrls.concat(cases).data())
+
+    def test_invalid(self):
+        address = os.path.join(self.directory, 'profile.txt')
+        with self.assertRaises(ValueError):
+            write_dataset(self.ctrls, self.ctrls, address)
+        with self.assertRaises(ValueError):
+            write_dataset(self.ctrls, self.cases, address, chunk_size=0)
+
+
+class TestSimulate(unittest.TestCase):
+    def setUp(self):
+        self.params = dict(profile_address='test/data/dummy_expression.txt',
+                           contrast_address='test/data/dummy_expression_contrast.txt',
+                           gene_fc_address='test/data/dummy_fold_change.txt',
+                           fc_id_col_name='ID',
+                           lower_bound_col_name='FCLower',
+                           upper_bound_col_name='FCUpper',
+                           num_simulated_ctrls=3,
+                           num_simulated_cases=3,
+                           profile_id_col_name='ID',
+                           num_repository_reps=2)
+
+    def test_simulate(self):
+        sim_ctrls, sim_cases = simulate(**self.params, random_state=1)
+        self.assertListEqual(sim_ctrls.columns, ['C1', 'C2', 'C3'])
+        self.assertListEqual(sim_cases.columns, ['T1', 'T2', 'T3'])
+        self.assertListEqual(list(sim_ctrls.keys()), list('abcde'))
+        self.assertListEqual(list(sim_cases.keys()), list('abcde'))
+        for gene, (lower, upper) in [('a', (2, 3)), ('e', (-3, -2))]:
+            difference = (np.mean(sim_cases.get(gene)) -
+                          np.mean(sim_ctrls.get(gene)))
+            self.assertTrue(lower - 1 <= difference <= upper + 1)
+
+    def test_simulate_profile_chunksize(self):
+        expected = simulate(**self.params, random_state=1)
+        result = simulate(**self.params, random_state=1, profile_chunksize=2)
+        for expected_profile, profile in zip(expected, result):
+            np.testing.assert_array_equal(expected_profile.data(),
+                                          profile.data())
+
+    def test_simulate_cache_dir(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        expected = simulate(**self.params, random_state=1)
+        for _ in range(2):
+            result = simulate(**self.params, random_state=1,
+                              cache_dir=cache_dir)
+            for expected_profile, profile in zip(expected, result):
+                np.testing.assert_array_equal(expected_profile.data(),
+                                              profile.data())
+
+    def test_simulate_float32(self):
+        sim_ctrls, sim_cases = simulate(**self.params, random_state=1,
+                                        dtype=np.float32)
+        self.assertEqual(sim_ctrls.dtype, np.float32)
+        self.assertEqual(sim_cases.dtype, np.float32)
+
+    def test_simulate_return_stats(self):
+        expected = simulate(**self.params, random_state=1)
+        *result, stats = simulate(**self.params, random_state=1,
+                                  return_stats=True)
+        for expected_profile, profile in zip(expected, result):
+            np.testing.assert_array_equal(expected_profile.data(),
+                                          profile.data())
+        self.assertSetEqual(set(stats.stage_times),
+                            {'load_inputs', 'read_contrast', 'read_profile',
+                             'read_fold_change', 'make_replicates',
+                             'repository', 'diff_express'})
+        self.assertEqual(stats.num_genes, 2)
+        self.assertEqual(stats.hits + stats.fallbacks, 2)
+
+    def test_simulate_input_errors(self):
+        # Errors are raised in the order in which the files were read
+        missing = 'test/data/missing.txt'
+        with self.assertRaises(InvalidContrastException):
+            simulate(**dict(self.params, ctrl_symbol='x',
+                            gene_fc_address=missing))
+        with self.assertRaises(FileNotFoundError):
+            simulate(**dict(self.params, gene_fc_address=missing))
+        with self.assertRaises(FileNotFoundError):
+            simulate(**dict(self.params, profile_address=missing,
+                            fc_id_col_name='missing'))
+        with self.assertRaises(KeyError):
+            simulate(**dict(self.params, fc_id_col_name='missing'))
+
+    def test_simulate_dexpress_cache(self):
+        cache = DExpressCache()
+        simulate(**self.params, random_state=1, dexpress_cache=cache)
+        self.assertEqual((cache.hits, len(cache)), (0, 2))
+        sim_ctrls, sim_cases = simulate(**self.params, random_state=1,
+                                        dexpress_cache=cache)
+        self.assertEqual((cache.hits, len(cache)), (2, 2))
+        self.assertEqual(sim_cases.shape, (5, 3))
+
+    def test_simulate_in_threads(self):
+        seeds = [1, 2, 3, 4]
+        expected = [simulate(**self.params, random_state=seed)
+                    for seed in seeds]
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(
+                lambda seed: simulate(**self.params, random_state=seed),
+                seeds))
+        for (ctrls1, cases1), (ctrls2, cases2) in zip(expected, results):
+            np.testing.assert_array_equal(ctrls1.data(), ctrls2.data())
+            np.testing.assert_array_equal(cases1.data(), cases2.data())
+
+    def test_simulate_many(self):
+        params = [self.params,
+                  dict(self.params, sampling_with_replacement=True),
+                  dict(self.params, num_repository_reps=3)]
+        serial = simulate_many(params, random_state=3, num_workers=1)
+        parallel = simulate_many(params, random_state=3, num_workers=2)
+        self.assertEqual(len(serial), len(params))
+        for (ctrls1, cases1), (ctrls2, cases2) in zip(serial, parallel):
+            np.testing.assert_array_equal(ctrls1.data(), ctrls2.data())
+            np.testing.assert_array_equal(cases1.data(), cases2.data())
+        self.assertEqual(serial[2][0].shape, (5, 3))
+        # Each simulation is seeded with a spawned SeedSequence
+        seed = np.random.SeedSequence(3).spawn(len(params))[1]
+        ctrls, cases = simulate(**params[1], random_state=seed)
+        np.testing.assert_array_equal(ctrls.data(), serial[1][0].data())
+        np.testing.assert_array_equal(cases.data(), serial[1][1].data())
+        with self.assertRaises(ValueError):
+            simulate_many([dict(self.params, random_state=0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,7 @@
 """This module shows an example for simulating expression profiles.
 
 """
-from silver.utils import simulate
+from silver.utils import simulate, write_dataset
 
 
 # Input informaiton
@@ -35,15 +35,10 @@ sim_ctrls, sim_cases = simulate(profile_address=PROFILE_ADDRESS,
                                 alpha=0.05,
                                 random_state=123456,
                                 sampling_with_replacement=False)
-# Combine the simulated controls and cases
-expression_dataset = sim_ctrls.concat(sim_cases)
-# Get the expression profile
-result = expression_dataset.profile
-# Write the simulated dataset to a file
+# Write the simulated dataset and its contrast to files; controls and cases
+# are written side by side without being combined in memory
 simulated_profile_address = 'simulated.profile.txt'
-result.to_csv(simulated_profile_address, sep='\t')
-# Make a contrast for the simulated dataset and write it to a file
 simulated_contrast_address = 'simulated.contrast.txt'
-with open(simulated_contrast_address, 'w') as fout:
-    fout.write('{}\n'.format('\t'.join(['c'] * NUM_SIMULATED_CTRLS +
-                                       ['d'] * NUM_SIMULATED_CASES)))
+write_dataset(sim_ctrls, sim_cases, simulated_profile_address,
+              contrast_address=simulated_contrast_address,
+              ctrl_symbol='c', case_symbol='d', sep='\t')